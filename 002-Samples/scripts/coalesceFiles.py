@@ -0,0 +1,175 @@
+# This script coalesces the small files of each dataset in a dataset JSON into
+# files of a target size / entry count, and writes the dataset JSON of the result.
+#
+# The PostProcessor drivers of the later chapters spawn a fresh worker process
+# per file (ROOT import + module setup, ~5 s), so a dataset of many small CRAB
+# outputs spends more time starting workers than processing events. Files are
+# packed into groups in dataset JSON order: a group closes before the file that
+# would take it past --targetSizeMB or --targetEvents. Each group of two or more
+# files is merged with ../../scripts/haddnano.py (fast-cloning the baskets when
+# all inputs share one compression setting), groups of one file are kept as they
+# are, and datasets where no group has two files -- already at the target size --
+# are skipped entirely.
+#
+# Merged files are named {dataset}_coalesced_{n}_{hash of the source list}.root
+# and written under a temporary name first, so an existing merged file is always
+# complete and a re-run only merges the groups that are missing. The output
+# dataset JSON keeps the {filepath: "Events"} format every chapter reads; the
+# merged-file -> source-files mapping goes to {output JSON stem}_provenance.json.
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import uproot
+
+HADDNANO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts", "haddnano.py")
+
+
+def file_stats(path):
+    """(size in bytes, Events entries) of one file, from the file header and TTree metadata."""
+    size = os.path.getsize(path)
+    with uproot.open(path) as f:
+        return size, f["Events"].num_entries
+
+
+def plan_groups(files, stats, target_bytes=None, target_events=None):
+    """Pack `files` (in order) into groups below the byte/entry targets; a file over a target is a group by itself."""
+    groups, current, size, entries = [], [], 0, 0
+    for path in files:
+        f_size, f_entries = stats[path]
+        too_big = ((target_bytes and size + f_size > target_bytes)
+                   or (target_events and entries + f_entries > target_events))
+        if current and too_big:
+            groups.append(current)
+            current, size, entries = [], 0, 0
+        current.append(path)
+        size += f_size
+        entries += f_entries
+    if current:
+        groups.append(current)
+    return groups
+
+
+def merged_name(dataset, index, sources):
+    digest = hashlib.sha1("\n".join(sources).encode()).hexdigest()[:8]
+    return f"{dataset}_coalesced_{index}_{digest}.root"
+
+
+def merge_group(output_path, sources):
+    """Merge `sources` into `output_path` with haddnano.py; returns output_path, raises on failure."""
+    if os.path.exists(output_path):
+        return output_path
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = output_path.replace(".root", ".tmp.root")
+    cmd = [sys.executable, HADDNANO, tmp_path] + list(sources)
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0 or not os.path.exists(tmp_path):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise RuntimeError(f"haddnano.py failed for {output_path}:\n{result.stderr[-2000:]}")
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def coalesce_dataset_json(dataset_json, output_base, target_bytes=None, target_events=None, workers=4):
+    """Returns (coalesced dataset JSON, {merged path: [source paths]})."""
+    all_files = [path for groups in dataset_json.values() for datasets in groups.values()
+                 for files in datasets.values() for path in files]
+    stats = {}
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        futures = {pool.submit(file_stats, path): path for path in all_files}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                stats[path] = future.result()
+            except Exception as e:
+                # Unreadable files are passed through untouched and never merged.
+                logging.warning(f"Cannot read {path}: {e}; keeping it as is")
+
+    plans, jobs = {}, []  # plans: {(DataMC, group, dataset): [(merged path or None, sources)]}
+    for DataMC, groups in dataset_json.items():
+        for group, datasets in groups.items():
+            for dataset, files in datasets.items():
+                readable = [path for path in files if path in stats]
+                packed = plan_groups(readable, stats, target_bytes, target_events)
+                if all(len(g) == 1 for g in packed):
+                    logging.info(f"{DataMC}/{group}/{dataset}: {len(files)} file(s) already at target size; skipping")
+                    plans[(DataMC, group, dataset)] = [(None, [path]) for path in files]
+                    continue
+                logging.info(f"{DataMC}/{group}/{dataset}: {len(readable)} file(s) -> {len(packed)} "
+                             f"({sum(1 for g in packed if len(g) > 1)} merged)")
+                plan = []
+                for index, sources in enumerate(packed):
+                    merged = None
+                    if len(sources) > 1:
+                        merged = os.path.join(output_base, DataMC, group, dataset,
+                                              merged_name(dataset, index, sources))
+                        jobs.append((merged, sources))
+                    plan.append((merged, sources))
+                plan += [(None, [path]) for path in files if path not in stats]
+                plans[(DataMC, group, dataset)] = plan
+
+    done, failed = set(), 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(merge_group, merged, sources): merged for merged, sources in jobs}
+        for i, future in enumerate(as_completed(futures), start=1):
+            try:
+                done.add(future.result())
+            except Exception as e:
+                logging.error(str(e))
+                failed += 1
+            if i % 20 == 0 or i == len(jobs):
+                logging.info(f"Merge progress: {i}/{len(jobs)} ({failed} failed)")
+
+    # A failed merge falls back to its sources, so the dataset JSON stays complete.
+    output_json, provenance = {}, {}
+    for (DataMC, group, dataset), plan in plans.items():
+        files = dataset_json[DataMC][group][dataset]
+        out_files = output_json.setdefault(DataMC, {}).setdefault(group, {}).setdefault(dataset, {})
+        for merged, sources in plan:
+            if merged in done:
+                out_files[merged] = files[sources[0]]
+                provenance[merged] = sources
+            else:
+                out_files.update((path, files[path]) for path in sources)
+    return output_json, provenance
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coalesce small files per dataset into files of a target size.")
+    parser.add_argument("--datasetJSON", required=True, help="Input dataset JSON ({DataMC: {group: {dataset: {filepath: tree}}}})")
+    parser.add_argument("--outputJSON", required=True, help="Dataset JSON of the coalesced files")
+    parser.add_argument("--outputBase", required=True,
+                        help="Directory for merged files, written to {outputBase}/{DataMC}/{group}/{dataset}/")
+    parser.add_argument("--targetSizeMB", type=float, default=2000.0,
+                        help="Close a group before it exceeds this size in MB (default: 2000; 0 = no size limit)")
+    parser.add_argument("--targetEvents", type=int, default=0,
+                        help="Close a group before it exceeds this many Events entries (default: 0 = no limit)")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel haddnano.py processes (default: 4)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not args.targetSizeMB and not args.targetEvents:
+        parser.error("Give --targetSizeMB and/or --targetEvents")
+
+    with open(args.datasetJSON) as f:
+        dataset_json = json.load(f)
+    output_json, provenance = coalesce_dataset_json(
+        dataset_json, args.outputBase,
+        target_bytes=args.targetSizeMB * 1024 * 1024 if args.targetSizeMB else None,
+        target_events=args.targetEvents or None, workers=args.workers)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.outputJSON)), exist_ok=True)
+    with open(args.outputJSON, "w") as f:
+        json.dump(output_json, f, indent=4)
+    provenance_path = f"{os.path.splitext(args.outputJSON)[0]}_provenance.json"
+    with open(provenance_path, "w") as f:
+        json.dump({"source": os.path.abspath(args.datasetJSON), "merged": provenance}, f, indent=4)
+    print(f"Coalesced dataset JSON generated at: {args.outputJSON} "
+          f"({len(provenance)} merged files; provenance in {provenance_path})")
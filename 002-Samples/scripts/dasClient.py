@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Cached, concurrency-bounded DAS client shared by the 002-Samples metadata steps
+(getFileList.py, getDatasetInfo.py, getFileInfo.py and run_all.py).
+
+Every query goes through one DASClient, which
+  - caps how many dasgoclient processes run at once (each one does its own
+    proxy lookup and TLS handshake, so hundreds in flight just get throttled),
+  - keeps a persistent on-disk response cache keyed by the query string, with
+    a TTL, so re-running a metadata step when nothing changed upstream never
+    touches DAS at all,
+  - talks to a pluggable backend: DasgoclientBackend (the real thing) or
+    FixtureBackend, which serves recorded responses from a local directory so
+    the steps can be exercised off lxplus.
+
+Recording fixtures (on lxplus) and querying through the cache:
+    python3 dasClient.py -q "file dataset=/TTToSemiLeptonic_.../NANOAODSIM" --record fixtures/
+    python3 dasClient.py -q "file dataset=/TTToSemiLeptonic_.../NANOAODSIM" --dasFixtures fixtures/
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / 'outputs' / '.das_cache'
+DEFAULT_TTL_HOURS = 24.0
+DEFAULT_MAX_CONCURRENCY = 8
+
+# See getFileInfo._print_lock: keeps multi-line messages from different
+# threads together in the shared log.
+_print_lock = threading.Lock()
+
+
+class DASQueryError(RuntimeError):
+    """A DAS query failed (non-zero dasgoclient exit, or no fixture recorded)."""
+
+
+def query_key(query, as_json):
+    """Cache/fixture key of one query: its exact text plus the output format."""
+    return hashlib.sha256(f"{int(as_json)}|{query}".encode()).hexdigest()
+
+
+def fixture_name(query, as_json):
+    """Readable, filesystem-safe fixture file name for a query."""
+    slug = re.sub(r'[^A-Za-z0-9._=-]+', '_', query).strip('_')[:150]
+    return f"{slug}.{query_key(query, as_json)[:12]}.{'json' if as_json else 'txt'}"
+
+
+class DasgoclientBackend:
+    """Runs the query through the dasgoclient CLI and returns its stdout."""
+
+    def run(self, query, as_json):
+        cmd = ['dasgoclient', f'-query={query}'] + (['-json'] if as_json else [])
+        with _print_lock:
+            print(f"Executing command: dasgoclient -query='{query}'{' -json' if as_json else ''}")
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise DASQueryError(
+                f"dasgoclient failed for query '{query}' (exit {result.returncode}):\n"
+                f"Command output: \n{result.stdout}\nCommand error (if any): \n{result.stderr}"
+            )
+        return result.stdout
+
+
+class FixtureBackend:
+    """Serves recorded responses from a directory (see fixture_name())."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def run(self, query, as_json):
+        path = self.directory / fixture_name(query, as_json)
+        if not path.exists():
+            raise DASQueryError(f"No DAS fixture for query '{query}' (expected {path})")
+        return path.read_text()
+
+
+class DASClient:
+    """Query DAS through a backend, with bounded concurrency and a TTL cache.
+
+    cache_dir=None disables the cache; ttl_hours <= 0 makes every cached
+    response stale (always re-query, but still refresh the cache).
+    refresh=True does the same regardless of the TTL: cached responses are
+    never served, and every fresh one overwrites its entry (run_all.py --force).
+    """
+
+    def __init__(self, backend=None, cache_dir=DEFAULT_CACHE_DIR, ttl_hours=DEFAULT_TTL_HOURS,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, refresh=False):
+        self.backend = backend or DasgoclientBackend()
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.ttl_seconds = ttl_hours * 3600.0
+        self.refresh = refresh
+        # A semaphore rather than a dedicated pool: callers already fan out
+        # with their own ThreadPoolExecutor, this just bounds what reaches DAS.
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self.hits = 0
+        self.misses = 0
+
+    def _cache_path(self, query, as_json):
+        key = query_key(query, as_json)
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _cache_get(self, query, as_json):
+        if self.cache_dir is None or self.refresh:
+            return None
+        path = self._cache_path(query, as_json)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if entry.get("query") != query or time.time() - entry.get("fetched_at", 0) > self.ttl_seconds:
+            return None
+        return entry["stdout"]
+
+    def _cache_put(self, query, as_json, stdout):
+        if self.cache_dir is None:
+            return
+        path = self._cache_path(query, as_json)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Threads may refresh the same query at once: per-thread temp file +
+        # rename, so a reader never sees a half-written entry.
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"query": query, "json": as_json, "fetched_at": time.time(), "stdout": stdout}, f)
+        os.replace(tmp_path, path)
+
+    def query_text(self, query, as_json=False):
+        """Raw stdout of `query`, from the cache if fresh. Raises DASQueryError."""
+        cached = self._cache_get(query, as_json)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        with self._slots:
+            stdout = self.backend.run(query, as_json)
+        self.misses += 1
+        self._cache_put(query, as_json, stdout)
+        return stdout
+
+    def query_json(self, query):
+        """Parsed `dasgoclient -json` records of `query`."""
+        return json.loads(self.query_text(query, as_json=True) or "[]")
+
+
+def add_das_arguments(parser):
+    """DAS client options shared by run_all.py and the standalone scripts."""
+    parser.add_argument('--dasCacheDir', default=str(DEFAULT_CACHE_DIR),
+                        help=f'Persistent DAS response cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--dasCacheTTL', type=float, default=DEFAULT_TTL_HOURS,
+                        help=f'Hours a cached DAS response stays valid; 0 forces fresh queries '
+                             f'(default: {DEFAULT_TTL_HOURS:g})')
+    parser.add_argument('--noDasCache', action='store_true',
+                        help='Neither read nor write the DAS response cache')
+    parser.add_argument('--dasRefresh', action='store_true',
+                        help='Ignore cached DAS responses but store the fresh ones '
+                             '(implied by run_all.py --force)')
+    parser.add_argument('--dasConcurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help=f'Maximum concurrent dasgoclient calls (default: {DEFAULT_MAX_CONCURRENCY})')
+    parser.add_argument('--dasFixtures', default=None, metavar='DIR',
+                        help='Serve DAS responses from recorded fixtures in DIR instead of dasgoclient')
+
+
+def client_from_args(args):
+    backend = FixtureBackend(args.dasFixtures) if args.dasFixtures else DasgoclientBackend()
+    return DASClient(backend=backend,
+                     cache_dir=None if args.noDasCache else args.dasCacheDir,
+                     ttl_hours=args.dasCacheTTL,
+                     max_concurrency=args.dasConcurrency,
+                     # --force must be able to pick up file lists that changed
+                     # upstream within the TTL, not just rewrite the outputs.
+                     refresh=args.dasRefresh or getattr(args, 'force', False))
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client used when a caller doesn't pass one explicitly."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = DASClient()
+        return _default_client
+
+
+def set_client(client):
+    global _default_client
+    with _default_lock:
+        _default_client = client
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run one DAS query through the cached client, or record a fixture.")
+    parser.add_argument("-q", "--das_query", required=True, help="DAS query string")
+    parser.add_argument("--plain", action="store_true", help="Plain-text output instead of -json")
+    parser.add_argument("--record", default=None, metavar="DIR",
+                        help="Also save the response as a fixture in DIR (for --dasFixtures)")
+    add_das_arguments(parser)
+    args = parser.parse_args()
+
+    stdout = client_from_args(args).query_text(args.das_query, as_json=not args.plain)
+    if args.record:
+        os.makedirs(args.record, exist_ok=True)
+        fixture_path = os.path.join(args.record, fixture_name(args.das_query, not args.plain))
+        with open(fixture_path, "w") as f:
+            f.write(stdout)
+        print(f"Fixture saved to {fixture_path}")
+    else:
+        print(stdout, end="")
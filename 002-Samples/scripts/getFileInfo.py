@@ -5,11 +5,13 @@ Usage: python3 getFileInfo.py -q "lumi file=/store/data/Run2016E/SingleMuon/NANO
 """
 
 import argparse
-import subprocess
+import json
 import os
 import sys
 import threading
 
+import dasClient
+
 # run_all.py's --getFileInfo calls get_file_info() from multiple threads at
 # once (ThreadPoolExecutor). Each thread's own print() calls are individually
 # atomic, but a multi-line message built from several print() calls can still
@@ -18,7 +20,7 @@ import threading
 _print_lock = threading.Lock()
 
 
-def get_file_info(das_query, output_file):
+def get_file_info(das_query, output_file, client=None):
     """Get file run-lumi info from DAS query and save to json file.
 
     Returns True on success, False if dasgoclient failed (caller decides how
@@ -26,30 +28,73 @@ def get_file_info(das_query, output_file):
     both cases, which let callers report success even when nothing was
     written).
     """
-    cmd = f"dasgoclient -query='{das_query}' -json"
-    with _print_lock:
-        print(f"Executing command: {cmd}")
-    result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-    # Make sure the command executed successfully
-    if result.returncode != 0:
+    client = client or dasClient.get_client()
+    try:
+        stdout = client.query_text(das_query, as_json=True)
+    except dasClient.DASQueryError as e:
         with _print_lock:
-            print("Error running dasgoclient:")
-            print(f"Command output: \n{result.stdout}")
-            print(f"Command error (if any): \n{result.stderr}")
+            print(f"Error running dasgoclient: {e}")
         return False
     # make sure the output directory exists
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     with open(output_file, "w") as f:
-        f.write(result.stdout)
+        f.write(stdout)
     return True
 
 
+def _first(record, key):
+    value = record.get(key) or [{}]
+    return value[0] if isinstance(value, list) else value
+
+
+def get_dataset_file_info(dataset, file_outputs, client=None):
+    """Run-lumi info of many files of one dataset from a single DAS query.
+
+    One `file,run,lumi dataset=...` query replaces one `lumi file=...` query
+    per file. Each requested file's records are written to its output path in
+    the same `lumi` record layout as the per-file query, which is what
+    generateRunLumiFiles.py reads. Files the batch query fails to cover (or
+    the whole dataset, if the batch query itself fails) fall back to
+    get_file_info() one file at a time.
+
+    file_outputs: {file LFN: output JSON path}
+    Returns {file LFN: True/False}.
+    """
+    client = client or dasClient.get_client()
+    records = {}
+    try:
+        for record in client.query_json(f"file,run,lumi dataset={dataset}"):
+            name = _first(record, "file").get("name")
+            run = _first(record, "run").get("run_number")
+            lumi = _first(record, "lumi")
+            numbers = lumi.get("number", lumi.get("lumi_section_num"))
+            if name is None or run is None or numbers is None:
+                continue
+            records.setdefault(name, []).append(
+                {"lumi": [{"file": name, "run_number": run, "lumi_section_num": numbers}]}
+            )
+    except (dasClient.DASQueryError, json.JSONDecodeError) as e:
+        with _print_lock:
+            print(f"Batch run-lumi query failed for {dataset}, falling back to per-file queries: {e}")
+
+    results = {}
+    for file_name, output_file in file_outputs.items():
+        if file_name not in records:
+            results[file_name] = get_file_info(f"lumi file={file_name}", output_file, client)
+            continue
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        with open(output_file, "w") as f:
+            json.dump(records[file_name], f)
+        results[file_name] = True
+    return results
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Get file run-lumi info from DAS query and save to json file.")
     parser.add_argument("-q", "--das_query", help="DAS query string")
     parser.add_argument("-o", "--output_filename", help="Output file name (e.g., UL2016preVFP_ttbarSemiLeptonic_file1.json)")
     parser.add_argument("-outDir", "--output_directory", help="Output directory path", default="./")
+    dasClient.add_das_arguments(parser)
     print("Parsing arguments...")
     print("DAS Query:", parser.parse_args().das_query)
     print("Output Directory:", parser.parse_args().output_directory)
@@ -57,5 +102,5 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
     output_file_path = os.path.join(args.output_directory, args.output_filename)
-    ok = get_file_info(args.das_query, output_file_path)
-    sys.exit(0 if ok else 1)
\ No newline at end of file
+    ok = get_file_info(args.das_query, output_file_path, dasClient.client_from_args(args))
+    sys.exit(0 if ok else 1)
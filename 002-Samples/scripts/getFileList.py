@@ -5,31 +5,35 @@ Usage:
     python3 scripts/getFileList.py -q "file dataset=/TTToSemiLeptonic_TuneCP5_13TeV-powheg-pythia8/RunIISummer20UL16NanoAODAPVv9-106X_mcRun2_asymptotic_preVFP_v11-v1/NANOAODSIM" -o UL2016preVFP_ttbarSemiLeptonic.json -outDir outputs/queryResults/UL2016preVFP/
 """
 import argparse
-import subprocess
 import os
+import sys
 
-def get_file_list(das_query, output_file):
-    """Get list of files from DAS query and save to json file."""
-    cmd = f"dasgoclient -query='{das_query}' -json"
-    print(f"Executing command: {cmd}")
-    result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
- 
-    # Make sure the command executed successfully
-    if result.returncode != 0:
-        print("Error running dasgoclient:")
-        print(f"Command output: \n{result.stdout}")
-        print(f"Command error (if any): \n{result.stderr}")  
-        return
+import dasClient
+
+def get_file_list(das_query, output_file, client=None):
+    """Get list of files from DAS query and save to json file.
+
+    Goes through the cached DAS client (dasClient.py). Returns True on
+    success, False if the query failed.
+    """
+    client = client or dasClient.get_client()
+    try:
+        stdout = client.query_text(das_query, as_json=True)
+    except dasClient.DASQueryError as e:
+        print(f"Error running dasgoclient: {e}")
+        return False
     # make sure the output directory exists
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     with open(output_file, "w") as f:
-        f.write(result.stdout)
+        f.write(stdout)
+    return True
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Get list of files from DAS query and save to json file.")
     parser.add_argument("-q", "--das_query", help="DAS query string")
     parser.add_argument("-o", "--output_filename", help="Output file name (e.g., UL2016preVFP_ttbarSemiLeptonic.json)")
     parser.add_argument("-outDir", "--output_directory", help="Output directory path", default="./")
+    dasClient.add_das_arguments(parser)
     print("Parsing arguments...")
     print("DAS Query:", parser.parse_args().das_query)
     print("Output Directory:", parser.parse_args().output_directory)
@@ -37,4 +41,5 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
     output_file_path = os.path.join(args.output_directory, args.output_filename)
-    get_file_list(args.das_query, output_file_path)
+    ok = get_file_list(args.das_query, output_file_path, dasClient.client_from_args(args))
+    sys.exit(0 if ok else 1)
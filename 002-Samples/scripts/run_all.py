@@ -16,7 +16,8 @@ Usage:
     python scripts/run_all.py --tag TAG_NAME [--force] [--filter ...] [step flags]
 
 Options:
-    --force: Regenerate outputs even if config hash already exists
+    --force: Regenerate outputs even if config hash already exists, and
+             re-query DAS instead of serving cached responses
     --tag: Create a named tag for this run (e.g., "earlyApril")
 """
 
@@ -30,7 +31,10 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 import utils
+import dasClient
 import getFileInfo
+import getFileList
+import getDatasetInfo
 import generateRunLumiFiles
 
 
@@ -62,12 +66,15 @@ def main():
     parser.add_argument('-t', '--tag', type=str, default='Dump',
                        help='Create named tag for this run (e.g., baseline, paper_v1)')
     parser.add_argument('--force', action='store_true',
-                       help='Regenerate outputs even if output files already exist for this config hash')
+                       help='Regenerate outputs even if output files already exist for this config hash; '
+                            'also bypasses (and rewrites) the DAS response cache')
     parser.add_argument('--printHash', action='store_true',
                        help='Print the config hash and exit (useful for debugging)')
     parser.add_argument('--workers', type=int, default=15,
-                       help='Number of parallel operations for --getFileInfo (DAS queries) and '
-                            '--submitPreSelectionJobs (CRAB submissions). Default: 15.')
+                       help='Number of parallel operations for --getFileList/--getDatasetInfo/--getFileInfo '
+                            '(datasets queried at once; see also --dasConcurrency) and '
+                            '--submitPreSelectionJobs (CRAB submissions), and health-check threads for '
+                            '--generatePreselectionDatasetJSON. Default: 15.')
 
     # --- lxplus: DAS querying / golden JSON / lumi info -----------------------------
     parser.add_argument('--getFileList', action='store_true',
@@ -109,6 +116,17 @@ def main():
                             '(after copying them down from EOS) and generate preselection_{era}_datasets.json, '
                             'the input format expected by 003-ObjectSelectionI.')
 
+    parser.add_argument('--coalesceFiles', action='store_true',
+                       help='[5b] Merge the small files of each dataset in preselection_{era}_datasets.json into '
+                            'files of --targetSizeMB / --targetEvents with scripts/coalesceFiles.py (haddnano.py), '
+                            'written under {STORAGE}/{config_hash}_coalesced/{era}. The scanned JSON is kept as '
+                            'preselection_{era}_datasets_uncoalesced.json, the merged -> source files mapping goes '
+                            'to preselection_{era}_datasets_provenance.json.')
+    parser.add_argument('--targetSizeMB', type=float, default=2000.0,
+                       help='For --coalesceFiles: target merged file size in MB (default: 2000; 0 = no size limit)')
+    parser.add_argument('--targetEvents', type=int, default=0,
+                       help='For --coalesceFiles: target merged file Events entries (default: 0 = no limit)')
+
     parser.add_argument('--getStatus', action='store_true',
                        help='[6] Get overall status of the preselection processing by comparing expected number of '
                             'files from DAS with the number of files obtained from getFileInfo.py, the number of '
@@ -121,6 +139,8 @@ def main():
                             'expected / unexpected extra branches), plus per-dataset min/max/mean/stddev for '
                             'numeric branches. Writes a JSON report per era.')
 
+    dasClient.add_das_arguments(parser)
+
     parser.add_argument('--filter', nargs='+', default=None, metavar='FILTER',
                        help='Filter by era[/DataMC[/group[/dataset]]]. Use * as wildcard at any level. '
                             'Multiple filters are OR-ed. E.g.: --filter UL2017 --filter UL2018/MC_mu/SingleTop')
@@ -148,12 +168,21 @@ def main():
     print(f"  --resubmitFailedCrabJobs: {args.resubmitFailedCrabJobs}")
     print(f"  --removeSubmitFailedCrabJobs: {args.removeSubmitFailedCrabJobs}")
     print(f"  --generatePreselectionDatasetJSON: {args.generatePreselectionDatasetJSON}")
+    print(f"  --coalesceFiles: {args.coalesceFiles}")
     print(f"  --getStatus: {args.getStatus}")
     print(f"  --verifyOutput: {args.verifyOutput}")
     print(f"  --filter: {args.filter}")
     print(f"  --printHash: {args.printHash}")
     print(f"  --workers: {args.workers}")
     print(f"  --sample: {args.sample}")
+    print(f"  --dasCacheDir: {None if args.noDasCache else args.dasCacheDir} (TTL {args.dasCacheTTL:g} h)")
+    print(f"  --dasFixtures: {args.dasFixtures}")
+
+    # One DAS client for every metadata step below: bounded concurrency and
+    # a persistent response cache, so re-running a step when nothing changed
+    # upstream never reaches DAS (see dasClient.py).
+    das_client = dasClient.client_from_args(args)
+    dasClient.set_client(das_client)
 
     # Paths
     base_dir = Path(__file__).parent.parent
@@ -186,16 +215,21 @@ def main():
         print(f"Config hash: {config_hash}")
         return 0
 
-    # Run getFileList.py if requested
-    if args.getFileList:
-        print("\nRunning getFileList.py to fetch file lists from DAS...")
-        get_file_list_script = base_dir / 'scripts' / 'getFileList.py'
-        if not get_file_list_script.exists():
-            print(f"Error: {get_file_list_script} not found!")
-            return 1
-
+    # Fetch file lists / dataset info from DAS if requested. Both steps query
+    # once per dataset through the cached DAS client, datasets in parallel.
+    for step, enabled, suffix, query_format, fetch in (
+        ("getFileList", args.getFileList, "file_list",
+         "file dataset={dataset}", getFileList.get_file_list),
+        ("getDatasetInfo", args.getDatasetInfo, "dataset_info",
+         "dataset={dataset} | grep dataset.nevents | grep dataset.num_file", getDatasetInfo.get_dataset_info),
+    ):
+        if not enabled:
+            continue
+        what = suffix.replace('_', ' ')
+        print(f"\nRunning {step}.py to fetch {what}s from DAS...")
+        tasks = []
         for era in config['DASQueries']:
-            print(f"\nFetching file list for era: {era}")
+            print(f"\nFetching {what} for era: {era}")
             for DataMC in config['DASQueries'][era]:
                 print(f"  DataMC: {DataMC}")
                 for group in config['DASQueries'][era][DataMC]:
@@ -204,57 +238,38 @@ def main():
                         print(f"    Dataset: {dataset_name}")
                         if not matches_filter(args.filter, era, DataMC, group, dataset_name):
                             continue
-                        output_filename = f"{era}_{DataMC}_{group}_{dataset_name}_file_list.json"
+                        output_filename = f"{era}_{DataMC}_{group}_{dataset_name}_{suffix}.json"
                         queryResults_dir = output_dir / era / DataMC / group / dataset_name
                         queryResults_dir.mkdir(parents=True, exist_ok=True)
                         output_file_path = queryResults_dir / output_filename
                         if output_file_path.exists() and not args.force:
                             print(f"    Output file already exists: {output_file_path} and --force not specified. Skipping DAS query.")
                             continue
-                        query = "file dataset={dataset}".format(dataset=das_query)
-                        cmd = f"python3 {get_file_list_script} -q \"{query}\" -o {output_filename} -outDir {queryResults_dir}"
-                        print(f"    Executing command: {cmd}")
-                        result = subprocess.run(cmd, shell=True)
-                        if result.returncode != 0:
-                            print(f"Error running getFileList.py for dataset: {dataset_name}")
-                            return 1
-                        else:
-                            print(f"    Successfully fetched file list and saved to: {queryResults_dir / output_filename}")
-
-    # Run getDatasetInfo.py if requested
-    if args.getDatasetInfo:
-        print("\nRunning getDatasetInfo.py to fetch dataset info from DAS...")
-        get_dataset_info_script = base_dir / 'scripts' / 'getDatasetInfo.py'
-        if not get_dataset_info_script.exists():
-            print(f"Error: {get_dataset_info_script} not found!")
-            return 1
+                        tasks.append((dataset_name, query_format.format(dataset=das_query), str(output_file_path)))
 
-        for era in config['DASQueries']:
-            print(f"\nFetching dataset info for era: {era}")
-            for DataMC in config['DASQueries'][era]:
-                print(f"  DataMC: {DataMC}")
-                for group in config['DASQueries'][era][DataMC]:
-                    print(f"    Group: {group}")
-                    for dataset_name, das_query in config['DASQueries'][era][DataMC][group].items():
-                        print(f"    Dataset: {dataset_name}")
-                        if not matches_filter(args.filter, era, DataMC, group, dataset_name):
-                            continue
-                        output_filename = f"{era}_{DataMC}_{group}_{dataset_name}_dataset_info.json"
-                        queryResults_dir = output_dir / era / DataMC / group / dataset_name
-                        queryResults_dir.mkdir(parents=True, exist_ok=True)
-                        output_file_path = queryResults_dir / output_filename
-                        if output_file_path.exists() and not args.force:
-                            print(f"    Output file already exists: {output_file_path} and --force not specified. Skipping DAS query.")
-                            continue
-                        query = "dataset={dataset} | grep dataset.nevents | grep dataset.num_file".format(dataset=das_query)
-                        cmd = f"python3 {get_dataset_info_script} -q \"{query}\" -o {output_filename} -outDir {queryResults_dir}"
-                        print(f"    Executing command: {cmd}")
-                        result = subprocess.run(cmd, shell=True)
-                        if result.returncode != 0:
-                            print(f"Error running getDatasetInfo.py for dataset: {dataset_name}")
-                            return 1
-                        else:
-                            print(f"    Successfully fetched dataset info and saved to: {queryResults_dir / output_filename}")
+        failed = []
+        if tasks:
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                futures = {
+                    pool.submit(fetch, query, out_path, das_client): (dataset_name, out_path)
+                    for dataset_name, query, out_path in tasks
+                }
+                for future in as_completed(futures):
+                    dataset_name, out_path = futures[future]
+                    try:
+                        ok = future.result()
+                    except Exception as e:
+                        print(f"    Exception running {step} for dataset {dataset_name}: {e}")
+                        ok = False
+                    if ok:
+                        print(f"    Successfully fetched {what} and saved to: {out_path}")
+                    else:
+                        failed.append(dataset_name)
+        print(f"\n{step}: {len(tasks) - len(failed)} succeeded, {len(failed)} failed "
+              f"(DAS cache: {das_client.hits} hits, {das_client.misses} queries so far)")
+        if failed:
+            print(f"Error running {step}.py for dataset(s): {', '.join(sorted(failed))}")
+            return 1
 
     # Download golden JSONs if requested
     if args.downloadGoldenJSONs:
@@ -378,10 +393,11 @@ def main():
     if args.getFileInfo:
         print("\nRunning getFileInfo.py to fetch file run-lumi information from DAS...")
 
-        # Phase 1: build the flat task list (one dasgoclient query per file),
-        # honoring --force/existing-file skip logic, same as every Pool-based
-        # worker script elsewhere in this pipeline.
-        tasks = []
+        # Phase 1: build the task list, grouped per dataset (one batched
+        # `file,run,lumi dataset=...` DAS query covers all of a dataset's
+        # files), honoring --force/existing-file skip logic, same as every
+        # Pool-based worker script elsewhere in this pipeline.
+        tasks = {}  # das_query -> {file LFN: output path}
         pre_skipped = 0
         for era in config['DASQueries']:
             print(f"\nFetching file run-lumi information for era: {era}")
@@ -409,40 +425,42 @@ def main():
                             if output_file_path.exists() and not args.force:
                                 pre_skipped += 1
                                 continue
-                            tasks.append((file_name, str(output_directory / output_filename)))
+                            tasks.setdefault(das_query, {})[file_name] = str(output_directory / output_filename)
 
-        print(f"\n{len(tasks)} files to query, {pre_skipped} already done / filtered out. "
+        n_tasks = sum(len(file_outputs) for file_outputs in tasks.values())
+        print(f"\n{n_tasks} files in {len(tasks)} datasets to query, {pre_skipped} already done / filtered out. "
               f"Running with {args.workers} parallel workers...")
 
-        # Phase 2: run the DAS queries in parallel. dasgoclient calls are I/O-bound
-        # (waiting on the network), so a thread pool is enough -- no need for
-        # separate processes. Calling getFileInfo.get_file_info() directly here
-        # (instead of spawning `python3 getFileInfo.py` per file, as before) also
-        # drops ~13000 redundant Python-interpreter-startup subprocess launches.
+        # Phase 2: run the DAS queries in parallel, one batched query per
+        # dataset instead of one `lumi file=...` query per file (~13000 before).
+        # dasgoclient calls are I/O-bound (waiting on the network), so a thread
+        # pool is enough; the DAS client bounds how many actually run at once
+        # and serves unchanged datasets from its cache.
         succeeded, failed = 0, 0
         if tasks:
             with ThreadPoolExecutor(max_workers=args.workers) as pool:
                 futures = {
-                    pool.submit(getFileInfo.get_file_info, f"lumi file={file_name}", out_path): (file_name, out_path)
-                    for file_name, out_path in tasks
+                    pool.submit(getFileInfo.get_dataset_file_info, das_query, file_outputs, das_client): das_query
+                    for das_query, file_outputs in tasks.items()
                 }
                 for i, future in enumerate(as_completed(futures), start=1):
-                    file_name, out_path = futures[future]
+                    das_query = futures[future]
                     try:
-                        ok = future.result()
+                        results = future.result()
                     except Exception as e:
-                        print(f"      [{i}/{len(tasks)}] Exception fetching run-lumi information for {file_name}: {e}")
-                        ok = False
-                    if ok:
-                        succeeded += 1
-                    else:
-                        failed += 1
-                        print(f"      [{i}/{len(tasks)}] FAILED: {file_name}")
-                    if i % 200 == 0 or i == len(tasks):
-                        print(f"      Progress: {i}/{len(tasks)} ({succeeded} succeeded, {failed} failed)")
+                        print(f"      [{i}/{len(tasks)}] Exception fetching run-lumi information for {das_query}: {e}")
+                        results = {file_name: False for file_name in tasks[das_query]}
+                    for file_name, ok in results.items():
+                        if ok:
+                            succeeded += 1
+                        else:
+                            failed += 1
+                            print(f"      [{i}/{len(tasks)}] FAILED: {file_name}")
+                    print(f"      Progress: {i}/{len(tasks)} datasets ({succeeded} files succeeded, {failed} failed)")
 
         print(f"\ngetFileInfo: {succeeded} succeeded, {failed} failed, {pre_skipped} pre-skipped "
-              f"out of {len(tasks) + pre_skipped} total.")
+              f"out of {n_tasks + pre_skipped} total "
+              f"(DAS cache: {das_client.hits} hits, {das_client.misses} queries).")
         if tasks and succeeded == 0:
             # Every single query failed -- almost certainly something systemic
             # (expired proxy, DAS outage), not per-file flakiness. Don't let
@@ -717,7 +735,10 @@ def main():
                 sys.executable, str(generateJSON_script),
                 '--outputDirectory', str(output_dir / era),
                 '--outputFileName', output_json_name,
-                '--baseDirectory', base_directory
+                '--baseDirectory', base_directory,
+                '--workers', str(args.workers),
+                '--tag', args.tag,
+                '--configHash', config_hash,
             ]
             print(f"Running command: {' '.join(cmd)}")
             result = subprocess.run(cmd, capture_output=True, text=True)
@@ -726,6 +747,49 @@ def main():
                 return 1
             else:
                 print(f"Successfully generated preselection dataset JSON for {era}: {output_json_path}")
+                # A fresh scan supersedes an earlier --coalesceFiles result.
+                for stale in (f"preselection_{era}_datasets_uncoalesced.json",
+                              f"preselection_{era}_datasets_provenance.json"):
+                    (output_dir / era / stale).unlink(missing_ok=True)
+
+    # Merge small preselection files per dataset, so the 003-ObjectSelectionI
+    # drivers don't spend more time spawning per-file workers than on events.
+    if args.coalesceFiles:
+        print("\nCoalescing small preselection files (scripts/coalesceFiles.py)...")
+        coalesce_script = base_dir / 'scripts' / 'coalesceFiles.py'
+        storageBase = utils.resolve_storage_path(config)
+        for era in config['DASQueries']:
+            if not matches_filter(args.filter, era):
+                continue
+            dataset_json_path = output_dir / era / f"preselection_{era}_datasets.json"
+            scanned_json_path = output_dir / era / f"preselection_{era}_datasets_uncoalesced.json"
+            provenance_path = output_dir / era / f"preselection_{era}_datasets_provenance.json"
+            if provenance_path.exists():
+                if not args.force:
+                    print(f"Dataset JSON for {era} is already coalesced and --force not set. Skipping: {dataset_json_path}")
+                    continue
+            elif dataset_json_path.exists():
+                dataset_json_path.replace(scanned_json_path)
+            else:
+                print(f"Error: preselection dataset JSON not found for era {era} at {dataset_json_path}. "
+                      f"Run --generatePreselectionDatasetJSON first.")
+                continue
+            cmd = [
+                sys.executable, str(coalesce_script),
+                '--datasetJSON', str(scanned_json_path),
+                '--outputJSON', str(dataset_json_path),
+                '--outputBase', str(Path(storageBase) / f"{config_hash}_coalesced" / era),
+                '--targetSizeMB', str(args.targetSizeMB),
+                '--targetEvents', str(args.targetEvents),
+                '--workers', str(args.workers),
+            ]
+            print(f"Running command: {' '.join(cmd)}")
+            result = subprocess.run(cmd)
+            if result.returncode != 0:
+                print(f"Error running coalesceFiles.py for {era}.")
+                if not provenance_path.exists():
+                    scanned_json_path.replace(dataset_json_path)  # first attempt: restore the scanned JSON
+                return 1
 
     # Overall status across DAS expectations / getFileInfo / dataset JSON / CRAB / EOS output
     if args.getStatus:
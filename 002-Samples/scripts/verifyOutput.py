@@ -5,9 +5,17 @@ the "Events" tree, cross-checks the tree's actual branch list against
 config.yaml's branch_selection (catching both missing-expected and
 unexpected-extra branches -- the latter usually means keep_and_drop.txt
 wasn't applied correctly on the CRAB worker), and computes per-dataset
-min/max/mean/stddev for numeric branches (chaining all of a dataset's files
-together, so stats are computed over the real event population rather than
-per file).
+min/max/mean/stddev for numeric branches over every event of the dataset
+(not a capped prefix of it).
+
+Stats are built incrementally: each file contributes per-branch partials
+(count, sum, sum of squares, min, max) that are cached on disk keyed by the
+file's adler32 checksum, together with the file's entry count and branch
+list. A dataset's stats are the merge of its files' partials, so
+re-verifying after a partial reprocess only opens and reads the files whose
+content actually changed. The uncached files' RDataFrame graphs (one per
+file, across all datasets) run concurrently via ROOT.RDF.RunGraphs with
+ImplicitMT.
 
 Input is a preselection_{era}_datasets.json (from --generatePreselectionDatasetJSON),
 keyed {DataMC: {group: {dataset: {filepath: "Events"}}}}.
@@ -15,13 +23,17 @@ keyed {DataMC: {group: {dataset: {filepath: "Events"}}}}.
 Usage:
     python3 verifyOutput.py --datasetJSON <preselection_{era}_datasets.json> \\
         --config <config.yaml> --outputReport <report.json> [--filter ...] \\
-        [--maxEntriesForStats 500000]
+        [--statsCache <dir>] [--threads N]
 """
 
 import argparse
 import json
+import math
+import os
 import re
 import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import ROOT
@@ -74,8 +86,34 @@ def branch_is_expected(name, exact, prefixes):
     return False
 
 
-def check_file_structure(filepath, exact, prefixes, is_data):
-    """Open one file, check tree existence/health and branch completeness.
+def scan_file(filepath):
+    """Open one file and read the structural facts check_file_structure()
+    judges: whether it opens, whether it has an Events tree, its entry count
+    and its branch list. Kept separate from the judging so the facts can be
+    cached alongside the file's stats partials."""
+    try:
+        f = ROOT.TFile.Open(filepath)
+    except OSError:
+        f = None
+    if not f or f.IsZombie():
+        return {"error": "file did not open / is zombie"}
+
+    tree = f.Get("Events")
+    if not tree:
+        f.Close()
+        return {"error": "no 'Events' tree"}
+
+    facts = {
+        "n_entries": tree.GetEntries(),
+        "branches": sorted(b.GetName() for b in tree.GetListOfBranches()),
+    }
+    f.Close()
+    return facts
+
+
+def check_file_structure(filepath, facts, exact, prefixes, is_data):
+    """Check tree existence/health and branch completeness from one file's
+    scan_file() facts.
 
     Returns (ok: bool, info: dict). ok is False only for structural problems
     (won't open, no Events tree, unexpected extra branches). Missing expected
@@ -84,23 +122,16 @@ def check_file_structure(filepath, exact, prefixes, is_data):
     can genuinely have 0 events survive).
     """
     info = {"file": filepath, "errors": [], "warnings": []}
-    f = ROOT.TFile.Open(filepath)
-    if not f or f.IsZombie():
-        info["errors"].append("file did not open / is zombie")
+    if "error" in facts:
+        info["errors"].append(facts["error"])
         return False, info
 
-    tree = f.Get("Events")
-    if not tree:
-        info["errors"].append("no 'Events' tree")
-        f.Close()
-        return False, info
-
-    n_entries = tree.GetEntries()
+    n_entries = facts["n_entries"]
     info["n_entries"] = n_entries
     if n_entries == 0:
         info["warnings"].append("0 entries (may be legitimate for a tightly-cut skim)")
 
-    actual_branches = {b.GetName() for b in tree.GetListOfBranches()}
+    actual_branches = set(facts["branches"])
     info["n_branches"] = len(actual_branches)
 
     unexpected = sorted(b for b in actual_branches if not branch_is_expected(b, exact, prefixes))
@@ -116,7 +147,6 @@ def check_file_structure(filepath, exact, prefixes, is_data):
     if missing:
         info["warnings"].append(f"expected branches not found: {missing}")
 
-    f.Close()
     return (len(info["errors"]) == 0), info
 
 
@@ -127,63 +157,233 @@ def _base_type(root_type_name):
     return root_type_name
 
 
-def compute_dataset_stats(filepaths, max_entries_for_stats):
-    """Chain all of a dataset's files and compute per-branch min/max/mean/stddev.
-
-    Uses RDataFrame's lazy Min/Max/Mean/StdDev actions rather than
-    TTree::Draw + GetV1(): the latter's result buffer needs SetEstimate()
-    sized correctly for every branch's max array multiplicity, and getting
-    that wrong for even one branch (e.g. a GenPart-heavy event) causes a
-    hard-to-diagnose out-of-bounds read -- a real, reproducible segfault we
-    hit while developing this against real preselection output.
-    RDataFrame actions handle both scalar and RVec (jagged-array) columns
-    natively, are lazy (booking all of them costs nothing until the first
-    GetValue() triggers one combined pass over the data instead of a
-    separate full-tree scan per branch), and don't have this failure mode.
+# ---------------------------------------------------------------------------
+# Per-file stats cache
+#
+# {cache_dir}/checksums.json        {filepath: {size, mtime_ns, checksum}}
+# {cache_dir}/files/{checksum}.json {version, facts, partials}
+#
+# One small JSON per file content rather than one big cache file: the HLT_*
+# branches alone put several hundred partials in every entry, and a single
+# file would have to be rewritten in full after every batch.
+# ---------------------------------------------------------------------------
+STATS_CACHE_VERSION = 1
+
+
+def file_checksum(filepath, memo):
+    """adler32 of the file content (the checksum CMS data management tools
+    use), memoized in `memo` by (size, mtime) so unchanged files are not
+    re-read just to be re-hashed. Returns None if the file can't be read."""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    known = memo.get(filepath)
+    if known and known["size"] == st.st_size and known["mtime_ns"] == st.st_mtime_ns:
+        return known["checksum"]
+    value = 1
+    try:
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 24), b""):
+                value = zlib.adler32(chunk, value)
+    except OSError:
+        return None
+    checksum = f"{st.st_size}-{value & 0xffffffff:08x}"
+    memo[filepath] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "checksum": checksum}
+    return checksum
+
+
+def _write_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def load_checksum_memo(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, "checksums.json")) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_checksum_memo(cache_dir, memo):
+    _write_json_atomic(os.path.join(cache_dir, "checksums.json"), memo)
+
+
+def load_cache_entry(cache_dir, checksum):
+    try:
+        with open(os.path.join(cache_dir, "files", f"{checksum}.json")) as f:
+            entry = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return entry if entry.get("version") == STATS_CACHE_VERSION else None
+
+
+def save_cache_entry(cache_dir, checksum, entry):
+    _write_json_atomic(os.path.join(cache_dir, "files", f"{checksum}.json"), entry)
+
+
+def book_file_partials(filepath):
+    """Book (lazily) per-branch count/sum/sum-of-squares/min/max on one
+    file's RDataFrame, for every numeric column.
+
+    Uses RDataFrame actions rather than TTree::Draw + GetV1(): the latter's
+    result buffer needs SetEstimate() sized correctly for every branch's max
+    array multiplicity, and getting that wrong for even one branch (e.g. a
+    GenPart-heavy event) causes a hard-to-diagnose out-of-bounds read -- a
+    real, reproducible segfault we hit while developing this against real
+    preselection output. Sums are accumulated in double via Define'd
+    columns, so float branches and RVec (jagged) branches merge exactly the
+    same way across files.
+
+    Returns (count, booked, errors): the graph's Count() handle (also what
+    ROOT.RDF.RunGraphs is given to trigger this graph), the booked handles
+    per branch, and any branches whose actions could not be booked.
     """
-    rdf = ROOT.RDataFrame("Events", filepaths)
-    n_entries = rdf.Count().GetValue()
-    stats = {"n_files": len(filepaths), "n_entries": n_entries, "branches": {}}
-    if n_entries == 0:
-        return stats
-
-    if n_entries > max_entries_for_stats:
-        rdf = rdf.Range(max_entries_for_stats)
-    stats["n_entries_used_for_stats"] = min(n_entries, max_entries_for_stats)
-
-    col_names = [str(c) for c in rdf.GetColumnNames()]
-    booked = {}
-    for name in col_names:
+    rdf = ROOT.RDataFrame("Events", filepath)
+    count = rdf.Count()
+    booked, errors = {}, {}
+    for name in (str(c) for c in rdf.GetColumnNames()):
+        # "#Jet_pt"-style collection-size columns RDataFrame adds on its own
+        # duplicate the nX branches and are not valid identifiers in the
+        # Define expressions below.
+        if name.startswith("#"):
+            continue
         col_type = str(rdf.GetColumnType(name))
         base_t = _base_type(col_type)
         if base_t in _NON_NUMERIC_TYPES:
             continue
         try:
+            if base_t != col_type:
+                node = (rdf.Define(f"vo_n_{name}", f"double({name}.size())")
+                           .Define(f"vo_s_{name}", f"ROOT::VecOps::Sum({name}, 0.)")
+                           .Define(f"vo_q_{name}", f"ROOT::VecOps::Sum(ROOT::VecOps::Map({name}, [](double x) {{ return x * x; }}), 0.)"))
+                n_values = node.Sum(f"vo_n_{name}")
+            else:
+                node = (rdf.Define(f"vo_s_{name}", f"double({name})")
+                           .Define(f"vo_q_{name}", f"double({name}) * double({name})"))
+                n_values = None  # one value per entry: the graph's Count()
             booked[name] = {
                 "type": col_type,
+                "n": n_values,
+                "sum": node.Sum(f"vo_s_{name}"),
+                "sumsq": node.Sum(f"vo_q_{name}"),
                 "min": rdf.Min(name),
                 "max": rdf.Max(name),
-                "mean": rdf.Mean(name),
-                "std": rdf.StdDev(name),
             }
         except Exception as e:
-            stats["branches"][name] = {"type": col_type, "error": f"could not book stats action: {e}"}
+            errors[name] = {"type": col_type, "error": f"could not book stats action: {e}"}
+    return count, booked, errors
+
 
-    # Actually running the event loop happens lazily on first GetValue() below,
-    # in one combined pass across every booked action.
+def collect_file_partials(count, booked):
+    """Read the values of a (run) book_file_partials() graph into plain
+    JSON-able partials. Raises if the file's event loop itself failed."""
+    n_entries = count.GetValue()
+    partials = {}
     for name, r in booked.items():
         try:
-            stats["branches"][name] = {
+            n = int(r["n"].GetValue()) if r["n"] is not None else n_entries
+            partials[name] = {
                 "type": r["type"],
-                "min": r["min"].GetValue(),
-                "max": r["max"].GetValue(),
-                "mean": r["mean"].GetValue(),
-                "std": r["std"].GetValue(),
+                "n": n,
+                "sum": r["sum"].GetValue(),
+                "sumsq": r["sumsq"].GetValue(),
+                # Min/Max of zero values are +-DBL_MAX sentinels, not data.
+                "min": r["min"].GetValue() if n else None,
+                "max": r["max"].GetValue() if n else None,
             }
         except Exception as e:
-            stats["branches"][name] = {"type": r["type"], "error": str(e)}
+            partials[name] = {"type": r["type"], "error": str(e)}
+    return partials
 
-    return stats
+
+def compute_file_entries(filepaths, checksums, cache_dir, batch_size):
+    """Scan and compute stats partials for every file in `filepaths`.
+
+    Graphs are booked one per file and run batch_size at a time through
+    ROOT.RDF.RunGraphs, which (with ImplicitMT enabled) processes the
+    batch's graphs concurrently -- across datasets, not one dataset after
+    another. Each finished batch is written to the cache straight away, so
+    an interrupted run keeps what it already computed.
+    """
+    entries = {}
+    for start in range(0, len(filepaths), batch_size):
+        batch = filepaths[start:start + batch_size]
+        pending = []
+        for fp in batch:
+            facts = scan_file(fp)
+            entries[fp] = {"version": STATS_CACHE_VERSION, "facts": facts, "partials": {}}
+            if "error" not in facts and facts["n_entries"] > 0:
+                count, booked, errors = book_file_partials(fp)
+                entries[fp]["partials"].update(errors)
+                pending.append((fp, count, booked))
+
+        if pending:
+            try:
+                ROOT.RDF.RunGraphs([count for _, count, _ in pending])
+            except Exception as e:
+                # One bad file aborts the whole concurrent run; fall through
+                # so each graph is re-run on its own by GetValue() below and
+                # only the broken file is flagged.
+                print(f"  [WARN]  RunGraphs failed ({e}); re-running this batch's files one by one.")
+        for fp, count, booked in pending:
+            try:
+                entries[fp]["partials"].update(collect_file_partials(count, booked))
+            except Exception as e:
+                entries[fp]["facts"] = {"error": f"event loop failed: {e}"}
+
+        for fp in batch:
+            # Errors are not cached: a file that failed to open may just
+            # have hit a transient storage problem, so it is retried next run.
+            if checksums.get(fp) and "error" not in entries[fp]["facts"]:
+                save_cache_entry(cache_dir, checksums[fp], entries[fp])
+        print(f"  Stats computed for {min(start + batch_size, len(filepaths))}/{len(filepaths)} files")
+    return entries
+
+
+def merge_partials(file_partials):
+    """Combine per-file partials into dataset-level min/max/mean/stddev."""
+    merged = {}
+    for partials in file_partials:
+        for name, p in partials.items():
+            m = merged.setdefault(name, {"type": p["type"], "n": 0, "sum": 0.0, "sumsq": 0.0,
+                                         "min": None, "max": None})
+            if "error" in m:
+                continue
+            if "error" in p:
+                m["error"] = p["error"]
+                continue
+            m["n"] += p["n"]
+            m["sum"] += p["sum"]
+            m["sumsq"] += p["sumsq"]
+            if p["n"]:
+                m["min"] = p["min"] if m["min"] is None else min(m["min"], p["min"])
+                m["max"] = p["max"] if m["max"] is None else max(m["max"], p["max"])
+
+    branches = {}
+    for name, m in merged.items():
+        if "error" in m:
+            branches[name] = {"type": m["type"], "error": m["error"]}
+            continue
+        n = m["n"]
+        if n == 0:
+            branches[name] = {"type": m["type"], "n_values": 0}
+            continue
+        mean = m["sum"] / n
+        # Sample (n - 1) variance, matching RDataFrame's StdDev action.
+        var = max(m["sumsq"] - m["sum"] * mean, 0.0) / (n - 1) if n > 1 else 0.0
+        branches[name] = {
+            "type": m["type"],
+            "min": m["min"],
+            "max": m["max"],
+            "mean": mean,
+            "std": math.sqrt(var),
+        }
+    return branches
 
 
 def main():
@@ -193,8 +393,14 @@ def main():
     parser.add_argument("--outputReport", required=True, help="Path to write the JSON verification report.")
     parser.add_argument("--include", help='Regex applied to "DataMC/group/dataset"; only matching triples are checked.')
     parser.add_argument("--exclude", help='Regex applied to "DataMC/group/dataset"; matching triples are skipped.')
-    parser.add_argument("--maxEntriesForStats", type=int, default=500_000,
-                        help="Cap on entries drawn per dataset for stats (keeps large full-scale datasets bounded). Default: 500000.")
+    parser.add_argument("--statsCache", default=None,
+                        help="Directory of cached per-file stats partials, keyed by file checksum. "
+                             "Default: verifyOutput_stats_cache/ next to --outputReport.")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(),
+                        help="ImplicitMT threads for the concurrent RDataFrame graphs (and checksum threads). "
+                             "Default: all cores.")
+    parser.add_argument("--graphBatchSize", type=int, default=200,
+                        help="Number of per-file RDataFrame graphs run together per ROOT.RDF.RunGraphs call. Default: 200.")
     args = parser.parse_args()
 
     with open(args.config) as f:
@@ -211,9 +417,7 @@ def main():
     include_pat = re.compile(args.include) if args.include else None
     exclude_pat = re.compile(args.exclude) if args.exclude else None
 
-    report = {"datasets": {}}
-    total_files, total_ok, total_errors, total_warnings = 0, 0, 0, 0
-
+    selected = []  # (label, is_data, filepaths)
     for DataMC, groups in dataset_data.items():
         is_data = DataMC.lower().startswith("data")
         for group, datasets in groups.items():
@@ -224,36 +428,68 @@ def main():
                 if exclude_pat and exclude_pat.search(label):
                     continue
                 filepaths = list(files.keys()) if isinstance(files, dict) else list(files)
-                if not filepaths:
-                    continue
+                if filepaths:
+                    selected.append((label, is_data, filepaths))
+
+    # Look up every file's cached facts/partials by content checksum; only
+    # the files with no cache hit are opened and read.
+    cache_dir = args.statsCache or str(Path(args.outputReport).parent / "verifyOutput_stats_cache")
+    all_files = list(dict.fromkeys(fp for _, _, filepaths in selected for fp in filepaths))
+    memo = load_checksum_memo(cache_dir)
+    with ThreadPoolExecutor(max_workers=max(1, args.threads)) as pool:
+        checksums = dict(zip(all_files, pool.map(lambda fp: file_checksum(fp, memo), all_files)))
+    entries, to_compute = {}, []
+    for fp in all_files:
+        entry = load_cache_entry(cache_dir, checksums[fp]) if checksums[fp] else None
+        if entry is None:
+            to_compute.append(fp)
+        else:
+            entries[fp] = entry
+    print(f"Stats cache {cache_dir}: {len(entries)}/{len(all_files)} files unchanged, "
+          f"reading {len(to_compute)}.")
+    if to_compute:
+        if args.threads > 1:
+            ROOT.EnableImplicitMT(args.threads)
+        entries.update(compute_file_entries(to_compute, checksums, cache_dir, args.graphBatchSize))
+    save_checksum_memo(cache_dir, memo)
+    recomputed = set(to_compute)
+
+    report = {"datasets": {}}
+    total_files, total_ok, total_errors, total_warnings = 0, 0, 0, 0
 
-                print(f"\n=== {label} ({len(filepaths)} files) ===")
-                file_reports = []
-                dataset_ok = True
-                for fp in filepaths:
-                    total_files += 1
-                    ok, info = check_file_structure(fp, exact, prefixes, is_data)
-                    file_reports.append(info)
-                    if ok:
-                        total_ok += 1
-                    else:
-                        dataset_ok = False
-                    total_errors += len(info["errors"])
-                    total_warnings += len(info["warnings"])
-                    for e in info["errors"]:
-                        print(f"  [ERROR] {fp}: {e}")
-                    for w in info["warnings"]:
-                        print(f"  [WARN]  {fp}: {w}")
-                    if not info["errors"] and not info["warnings"]:
-                        print(f"  [OK]    {fp} ({info.get('n_entries', '?')} entries, {info.get('n_branches', '?')} branches)")
-
-                stats = compute_dataset_stats(filepaths, args.maxEntriesForStats)
-                report["datasets"][label] = {
-                    "is_data": is_data,
-                    "ok": dataset_ok,
-                    "files": file_reports,
-                    "stats": stats,
-                }
+    for label, is_data, filepaths in selected:
+        print(f"\n=== {label} ({len(filepaths)} files) ===")
+        file_reports = []
+        dataset_ok = True
+        for fp in filepaths:
+            total_files += 1
+            ok, info = check_file_structure(fp, entries[fp]["facts"], exact, prefixes, is_data)
+            file_reports.append(info)
+            if ok:
+                total_ok += 1
+            else:
+                dataset_ok = False
+            total_errors += len(info["errors"])
+            total_warnings += len(info["warnings"])
+            for e in info["errors"]:
+                print(f"  [ERROR] {fp}: {e}")
+            for w in info["warnings"]:
+                print(f"  [WARN]  {fp}: {w}")
+            if not info["errors"] and not info["warnings"]:
+                print(f"  [OK]    {fp} ({info.get('n_entries', '?')} entries, {info.get('n_branches', '?')} branches)")
+
+        stats = {
+            "n_files": len(filepaths),
+            "n_files_read": sum(fp in recomputed for fp in filepaths),
+            "n_entries": sum(entries[fp]["facts"].get("n_entries", 0) for fp in filepaths),
+            "branches": merge_partials(entries[fp]["partials"] for fp in filepaths),
+        }
+        report["datasets"][label] = {
+            "is_data": is_data,
+            "ok": dataset_ok,
+            "files": file_reports,
+            "stats": stats,
+        }
 
     report["summary"] = {
         "total_files": total_files,
@@ -5,9 +5,9 @@ Applies the era's event-level cut string and runs SelectedObjectsProducer,
 mirroring scripts/runSelection.py's local per-file event loop exactly.
 
 This script is sent to the grid worker node as an inputFile and executed by
-crab_selection.sh. SelectedObjects.py is shipped alongside it (flat, no
-modules/ subpackage) since it isn't part of the installed NanoAODTools
-package.
+crab_selection.sh. SelectedObjects.py and the cutSpec.py it compiles its
+object cuts with are shipped alongside it (flat, no modules/ subpackage)
+since they aren't part of the installed NanoAODTools package.
 
 Unlike the preselection stage, this job's input files are not a DBS-registered
 dataset (Data.userInputFiles was used, not Data.inputDataset), so CRAB has no
@@ -37,6 +37,7 @@ ROOT.gROOT.SetBatch(True)
 ROOT.PyConfig.IgnoreCommandLineOptions = True
 from PhysicsTools.NanoAODTools.postprocessing.framework.postprocessor import PostProcessor
 from SelectedObjects import SelectedObjectsProducer
+import cutSpec
 
 print("Running crab_script_selection.py")
 
@@ -60,28 +61,40 @@ files = [lfn_to_eosuser_xrootd(lfn, _config["LFN_Base"]) for lfn in raw_lfns]
 print("INPUT FILES (raw LFNs):", raw_lfns)
 print("INPUT FILES (resolved):", files)
 
-# scriptArgs: era=VALUE, isData=True/False (passed by submit_selection_flexible.py)
+# scriptArgs: era=VALUE, isData=True/False, columnar=True/False (passed by
+# submit_selection_flexible.py)
 era = None
 is_data = False
+columnar = False
 for arg in sys.argv[1:]:
     if arg.startswith("era="):
         era = arg.split("=", 1)[1]
     elif arg.startswith("isData="):
         is_data = arg.split("=", 1)[1].strip().lower() == "true"
+    elif arg.startswith("columnar="):
+        columnar = arg.split("=", 1)[1].strip().lower() == "true"
 
 if era is None:
     raise RuntimeError("crab_script_selection.py requires scriptArgs era=<era>")
 
-print(f"era={era}, isData={is_data}")
+print(f"era={era}, isData={is_data}, columnar={columnar}")
 
 # Build the same combined cut string run_all.py --generateProcessListJSON builds locally
-_era_cuts = _config["SelectionCuts"][era]
-cut_string = " && ".join(v for v in _era_cuts.values() if v and v.strip())
+cut_string = cutSpec.combined_cut_string(_config, era)
 print("Cut string:", cut_string)
 
-# Same module config the local process-list JSON carries, era-resolved + is_mc flag
+# Same module config the local process-list JSON carries, era-resolved + is_mc
+# flag + the era's ObjectSelection
 _mod_cfg_raw = _config["Modules"]["selectedObjects"]
-mod_cfg = dict(_mod_cfg_raw.get(era, _mod_cfg_raw), is_mc=not is_data)
+mod_cfg = dict(_mod_cfg_raw.get(era, _mod_cfg_raw), is_mc=not is_data,
+               objectSelection=_config["ObjectSelection"][era], columnar=columnar)
+if columnar:
+    try:
+        import uproot, awkward  # noqa: F401
+    except ImportError as e:
+        print(f"[WARNING] columnar=True but {e.name} is not available on this worker; "
+              "using the event-loop path.")
+        mod_cfg["columnar"] = False
 
 # Golden JSON: shipped flat as an inputFile only for data jobs
 json_input = None
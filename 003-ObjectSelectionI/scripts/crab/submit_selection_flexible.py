@@ -34,6 +34,7 @@ Options
     --output-lfn     Base LFN for CRAB output on T3_CH_CERNBOX. Required.
     --work-area      Directory where CRAB project folders are created.
     --sample         Only submit the first file of each matching dataset (for testing).
+    --columnar       Run selectedObjects on its columnar path (scriptArg columnar=True).
 """
 
 import argparse
@@ -52,6 +53,7 @@ PSET        = SCRIPT_DIR / "PSet.py"
 SCRIPT_SH   = SCRIPT_DIR / "crab_selection.sh"
 SCRIPT_PY   = SCRIPT_DIR / "crab_script_selection.py"
 MODULE_PY   = SCRIPT_DIR.parent / "modules" / "SelectedObjects.py"
+CUTSPEC_PY  = SCRIPT_DIR.parent / "cutSpec.py"
 
 # ---------------------------------------------------------------------------
 # Helpers
@@ -62,7 +64,8 @@ def safe_name(s: str) -> str:
     return re.sub(r"[^A-Za-z0-9_]", "_", s)
 
 
-def make_crab_config(era, DataMC, group, key, lfn_files, is_data, output_lfn, golden_json, work_area=None):
+def make_crab_config(era, DataMC, group, key, lfn_files, is_data, output_lfn, golden_json, work_area=None,
+                     columnar=False):
     from WMCore.Configuration import Configuration  # noqa: PLC0415
     cfg = Configuration()
     request_name = f"sel_{safe_name(era)}_{safe_name(group)}_{safe_name(key)}"[:100]
@@ -75,11 +78,11 @@ def make_crab_config(era, DataMC, group, key, lfn_files, is_data, output_lfn, go
     cfg.JobType.pluginName = "Analysis"
     cfg.JobType.psetName   = str(PSET)
     cfg.JobType.scriptExe  = str(SCRIPT_SH)
-    input_files = [str(SCRIPT_PY), str(MODULE_PY), str(CONFIG_YAML)]
+    input_files = [str(SCRIPT_PY), str(MODULE_PY), str(CUTSPEC_PY), str(CONFIG_YAML)]
     if is_data:
         input_files.append(str(golden_json))
     cfg.JobType.inputFiles  = input_files
-    cfg.JobType.scriptArgs  = [f"era={era}", f"isData={is_data}"]
+    cfg.JobType.scriptArgs  = [f"era={era}", f"isData={is_data}", f"columnar={columnar}"]
     cfg.section_("Data")
     cfg.Data.userInputFiles     = lfn_files
     cfg.Data.outputPrimaryDataset = safe_name(f"{group}_{key}")[:100]
@@ -126,6 +129,9 @@ def main():
     parser.add_argument("--sample", action="store_true",
                         help="Only submit the first file of each matching dataset (for testing purposes), "
                              "same convention as --sample elsewhere in this chapter.")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Run selectedObjects on its columnar path (uproot/awkward, same output); "
+                             "workers without them fall back to the event loop.")
     args = parser.parse_args()
 
     output_lfn = args.output_lfn.rstrip("/")
@@ -144,6 +150,7 @@ def main():
         (SCRIPT_SH,    "crab_selection.sh"),
         (SCRIPT_PY,    "crab_script_selection.py"),
         (MODULE_PY,    "SelectedObjects.py"),
+        (CUTSPEC_PY,   "cutSpec.py"),
         (PSET,         "PSet.py"),
         (CONFIG_YAML,  "config.yaml"),
         (args.dataset_json, "dataset JSON"),
@@ -225,7 +232,7 @@ def main():
         label = f"{DataMC}/{group}/{key}"
         try:
             cfg = make_crab_config(args.era, DataMC, group, key, lfn_files, is_data,
-                                    output_lfn, args.golden_json, args.work_area)
+                                    output_lfn, args.golden_json, args.work_area, args.columnar)
             crabCommand("submit", config=cfg)
             print(f"  Submitted: {label}")
             submitted += 1
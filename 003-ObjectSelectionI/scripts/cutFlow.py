@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Cut-flow engine for the SelectionI cuts.
+
+runSelection.py hands PostProcessor one TTreeFormula built by AND-ing every
+SelectionCuts[era] entry (muonCut, bjetCut, jetCut, HLTCut, METFlags), so a
+run says nothing about which cut removes events. Here each named cut becomes a
+columnar predicate over uproot/awkward arrays -- object counts use the
+vectorized form cutSpec.py compiles from ObjectSelection[era], raw strings
+are parsed from their TTreeFormula text (the subset the config uses: branches,
+numbers, C operators, abs()/fabs(), Sum$() and Length$()) -- and evaluated
+per event into a bitmask (bit i set = cut i passes), in one scan of just the
+branches the cuts reference. From the bitmask, per dataset:
+
+  - sequential cut flow (cuts applied in config order),
+  - N-1 table (all cuts but one) and each cut on its own,
+  all both unweighted and weighted (genWeight for MC, 1 for Data),
+  - the final pass mask as per-file entry lists.
+
+Outputs, per dataset, in --outDir:
+    {era}_{DataMC}_{group}_{dataset}_cutflow.json       tables + per-file n_total / n_pass
+    {era}_{DataMC}_{group}_{dataset}_entrylists.npz     passing entry numbers per file
+
+run_all.py --generateProcessListJSON copies each file's n_pass into its task
+when the cut-flow's cuts match the current config, so runSelection.py can skip
+0-pass files without its own TTree::GetEntries(cut) pass over each file.
+
+Usage:
+    python3 cutFlow.py --config ../config.yaml --era UL2017 \\
+        --datasetJSON ../outputs/.../inputs/preselection_UL2017_datasets.json --outDir cutflow/UL2017 -j 8
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import awkward as ak
+import numpy as np
+import uproot
+import yaml
+
+import cutSpec
+
+# --- TTreeFormula subset -> columnar predicate -------------------------------
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+\.\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?|\d+(?:[eE][-+]?\d+)?)
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*\$?)
+      | (?P<op>&&|\|\||==|!=|<=|>=|[<>!&|+\-*/(),])
+    )""", re.VERBOSE)
+
+# Binary operators by C precedence, lowest first.
+_BINARY_LEVELS = [("||",), ("&&",), ("|",), ("&",), ("==", "!="), ("<", ">", "<=", ">="), ("+", "-"), ("*", "/")]
+
+
+def _tokenize(expr):
+    tokens, pos = [], 0
+    expr = expr.rstrip()
+    while pos < len(expr):
+        m = _TOKEN.match(expr, pos)
+        if not m or m.end() == pos:
+            raise ValueError(f"Cannot parse cut string at {expr[pos:]!r}: {expr!r}")
+        kind = m.lastgroup
+        tokens.append((kind, m.group(kind)))
+        pos = m.end()
+    return tokens
+
+
+def _truth(x):
+    return x != 0
+
+
+def _as_int(x):
+    """TTreeFormula's operand cast for & and |: (Long64_t)x, truncating toward zero."""
+    if isinstance(x, ak.Array):
+        return ak.values_astype(x, np.int64)
+    return np.asarray(x).astype(np.int64)
+
+
+def _sum(x):
+    if isinstance(x, ak.Array) and x.ndim > 1:
+        return ak.sum(ak.values_astype(x, np.float64), axis=1)
+    return x
+
+
+def _length(x):
+    if isinstance(x, ak.Array) and x.ndim > 1:
+        return ak.num(x, axis=1)
+    raise ValueError("Length$() of a non-collection branch")
+
+
+_BINARY = {
+    "||": lambda a, b: _truth(a) | _truth(b),
+    "&&": lambda a, b: _truth(a) & _truth(b),
+    # Single & and | are bitwise on integers in TTreeFormula, e.g. (Flag & 2).
+    "|": lambda a, b: np.bitwise_or(_as_int(a), _as_int(b)),
+    "&": lambda a, b: np.bitwise_and(_as_int(a), _as_int(b)),
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "<=": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b,
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": lambda a, b: a / b,
+}
+_FUNCTIONS = {"abs": np.abs, "fabs": np.abs, "Sum$": _sum, "Length$": _length}
+
+
+class _Parser:
+    """Recursive-descent parser producing a closure arrays -> values."""
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.tokens = _tokenize(expr)
+        self.pos = 0
+        self.branches = set()
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        tok = self.peek()
+        if tok[0] is None or (value is not None and tok[1] != value):
+            raise ValueError(f"Expected {value or 'more input'} in cut string {self.expr!r}")
+        self.pos += 1
+        return tok
+
+    def parse(self):
+        node = self.binary(0)
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected {self.peek()[1]!r} in cut string {self.expr!r}")
+        return node
+
+    def binary(self, level):
+        if level == len(_BINARY_LEVELS):
+            return self.unary()
+        node = self.binary(level + 1)
+        while self.peek()[0] == "op" and self.peek()[1] in _BINARY_LEVELS[level]:
+            fn = _BINARY[self.take()[1]]
+            lhs, rhs = node, self.binary(level + 1)
+            node = (lambda f, l, r: lambda arrays: f(l(arrays), r(arrays)))(fn, lhs, rhs)
+        return node
+
+    def unary(self):
+        kind, value = self.peek()
+        if kind == "op" and value == "!":
+            self.take()
+            operand = self.unary()
+            return lambda arrays: ~_truth(operand(arrays))
+        if kind == "op" and value == "-":
+            self.take()
+            operand = self.unary()
+            return lambda arrays: -operand(arrays)
+        return self.primary()
+
+    def primary(self):
+        kind, value = self.take()
+        if kind == "number":
+            # TTreeFormula compares in double: a float64 scalar (unlike a bare
+            # Python float) promotes float32 branches instead of being demoted.
+            number = np.float64(value) if any(c in value for c in ".eE") else int(value)
+            return lambda arrays: number
+        if kind == "op" and value == "(":
+            node = self.binary(0)
+            self.take(")")
+            return node
+        if kind == "name" and self.peek() == ("op", "("):
+            if value not in _FUNCTIONS:
+                raise ValueError(f"Unsupported function {value}() in cut string {self.expr!r}")
+            fn = _FUNCTIONS[value]
+            self.take("(")
+            arg = self.binary(0)
+            self.take(")")
+            return lambda arrays: fn(arg(arrays))
+        if kind == "name":
+            self.branches.add(value)
+            return lambda arrays: arrays[value]
+        raise ValueError(f"Unexpected {value!r} in cut string {self.expr!r}")
+
+
+class CompiledCut:
+    """One TTreeFormula cut string, compiled to a per-event boolean predicate."""
+
+    def __init__(self, expr):
+        self.expr = expr
+        parser = _Parser(expr)
+        self._fn = parser.parse()
+        self.branches = frozenset(parser.branches)
+
+    def __call__(self, arrays):
+        result = _truth(self._fn(arrays))
+        if isinstance(result, ak.Array):
+            if result.ndim > 1:
+                raise ValueError(f"Cut {self.expr!r} is per-object, not per-event (missing Sum$()?)")
+            return ak.to_numpy(result).astype(bool)
+        return np.asarray(result, dtype=bool)
+
+
+def matches_filter(filters, era, data_mc=None, group=None, dataset=None):
+    """Check if era/DataMC/group/dataset matches any of the provided filters (as run_all.py)."""
+    if not filters:
+        return True
+    for f in filters:
+        parts = f.split('/')
+        if parts[0] not in ('*', era):
+            continue
+        if data_mc is not None and len(parts) >= 2 and parts[1] not in ('*', data_mc):
+            continue
+        if group is not None and len(parts) >= 3 and parts[2] not in ('*', group):
+            continue
+        if dataset is not None and len(parts) >= 4 and parts[3] not in ('*', dataset):
+            continue
+        return True
+    return False
+
+
+# --- bitmask cut flow --------------------------------------------------------
+
+def cut_bitmask(cuts, arrays):
+    """uint32 per event: bit i set when cuts[i] passes."""
+    mask = np.zeros(len(arrays), dtype=np.uint32)
+    for i, cut in enumerate(cuts):
+        mask |= cut(arrays).astype(np.uint32) << np.uint32(i)
+    return mask
+
+
+def tally(mask, weights, n_cuts):
+    """Sequential / N-1 / single-cut counts (unweighted and weighted) of one bitmask chunk."""
+    full = np.uint32((1 << n_cuts) - 1)
+    out = {"n_total": int(len(mask)), "w_total": float(weights.sum())}
+    for table, selectors in (
+        ("sequential", [np.uint32((1 << (i + 1)) - 1) for i in range(n_cuts)]),
+        ("n_minus_1", [full & ~np.uint32(1 << i) for i in range(n_cuts)]),
+        ("single", [np.uint32(1 << i) for i in range(n_cuts)]),
+    ):
+        passed = [(mask & sel) == sel for sel in selectors]
+        out[table] = {"n": [int(p.sum()) for p in passed], "w": [float(weights[p].sum()) for p in passed]}
+    return out
+
+
+def merge_tallies(a, b):
+    if a is None:
+        return b
+    out = {"n_total": a["n_total"] + b["n_total"], "w_total": a["w_total"] + b["w_total"]}
+    for table in ("sequential", "n_minus_1", "single"):
+        out[table] = {k: [x + y for x, y in zip(a[table][k], b[table][k])] for k in ("n", "w")}
+    return out
+
+
+def predicates(event_cuts):
+    """Columnar predicate per cutSpec.EventCut: its own for spec cuts, parsed for raw strings."""
+    return [cut if cut.columnar else CompiledCut(cut.expr) for cut in event_cuts]
+
+
+def cut_flow_file(path, event_cuts, is_data, tree_name="Events", weight_branch="genWeight", step_size="200 MB"):
+    """(tally, passing entry numbers) of one file, reading only the branches the cuts use."""
+    cuts = predicates(event_cuts)
+    branches = set().union(*(cut.branches for cut in cuts))
+    with uproot.open(path) as f:
+        tree = f[tree_name]
+        use_weight = not is_data and weight_branch in tree.keys()
+        if use_weight:
+            branches.add(weight_branch)
+        total, passing, offset = None, [], 0
+        full = np.uint32((1 << len(cuts)) - 1)
+        for arrays in tree.iterate(sorted(branches), step_size=step_size, library="ak"):
+            mask = cut_bitmask(cuts, arrays)
+            weights = ak.to_numpy(arrays[weight_branch]).astype(np.float64) if use_weight else np.ones(len(mask))
+            total = merge_tallies(total, tally(mask, weights, len(cuts)))
+            passing.append(np.flatnonzero(mask == full) + offset)
+            offset += len(mask)
+    if total is None:
+        total = tally(np.zeros(0, dtype=np.uint32), np.zeros(0), len(cuts))
+    return total, (np.concatenate(passing) if passing else np.zeros(0, dtype=np.int64)).astype(np.int64)
+
+
+def write_dataset_outputs(out_dir, stem, era, label, cut_names, cut_exprs, files, results):
+    """Merge per-file results of one dataset into its cut-flow JSON and entry-list npz."""
+    total, per_file, lists = None, {}, {}
+    for i, path in enumerate(files):
+        if path not in results:
+            per_file[path] = {"error": "not processed"}
+            continue
+        file_tally, entries = results[path]
+        total = merge_tallies(total, file_tally)
+        per_file[path] = {"n_total": file_tally["n_total"], "n_pass": int(len(entries)), "entry_list": f"f{i}"}
+        lists[f"f{i}"] = entries
+    npz_path = os.path.join(out_dir, f"{stem}_entrylists.npz")
+    tmp_path = f"{npz_path}.tmp.npz"
+    np.savez_compressed(tmp_path, **lists)
+    os.replace(tmp_path, npz_path)
+    report = {
+        "era": era, "dataset": label, "cuts": dict(zip(cut_names, cut_exprs)),
+        "order": cut_names, "totals": total, "files": per_file,
+        "entry_lists": os.path.basename(npz_path),
+    }
+    with open(os.path.join(out_dir, f"{stem}_cutflow.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def print_table(report):
+    t = report["totals"]
+    if t is None:
+        return
+    print(f"\n{report['dataset']}: {t['n_total']} events (sum w = {t['w_total']:.6g})")
+    print(f"  {'cut':12s} {'sequential':>12s} {'eff':>7s} {'N-1':>12s} {'alone':>12s}")
+    for i, name in enumerate(report["order"]):
+        seq = t["sequential"]["n"][i]
+        eff = seq / t["n_total"] if t["n_total"] else 0.0
+        print(f"  {name:12s} {seq:12d} {eff:7.4f} {t['n_minus_1']['n'][i]:12d} {t['single']['n'][i]:12d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-event bitmask cut flow of SelectionCuts[era].")
+    parser.add_argument("--config", required=True, help="Chapter config.yaml (SelectionCuts, ObjectSelection)")
+    parser.add_argument("--era", required=True)
+    parser.add_argument("--datasetJSON", required=True, help="{DataMC: {group: {dataset: {filepath: tree}}}}")
+    parser.add_argument("--outDir", required=True)
+    parser.add_argument("-j", "--workers", type=int, default=8, help="Parallel worker processes (default: 8)")
+    parser.add_argument("--filter", nargs="+", default=None, metavar="FILTER",
+                        help="Filter by era[/DataMC[/group[/dataset]]], as run_all.py")
+    parser.add_argument("--force", action="store_true", help="Recompute datasets whose cut-flow JSON exists")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+    try:
+        event_cuts = list(cutSpec.selection_cuts(config, args.era).values())
+        predicates(event_cuts)  # fail fast on unsupported syntax, before any file is read
+    except ValueError as e:
+        parser.error(str(e))
+    cut_names = [cut.name for cut in event_cuts]
+    cut_exprs = [cut.expr for cut in event_cuts]
+    if len(cut_names) > 32:
+        parser.error("At most 32 cuts fit the uint32 bitmask")
+
+    with open(args.datasetJSON) as f:
+        dataset_json = json.load(f)
+    os.makedirs(args.outDir, exist_ok=True)
+
+    datasets = []
+    for DataMC, groups in dataset_json.items():
+        for group, ds in groups.items():
+            for dataset, files in ds.items():
+                if not matches_filter(args.filter, args.era, DataMC, group, dataset):
+                    continue
+                stem = f"{args.era}_{DataMC}_{group}_{dataset}"
+                if not args.force and os.path.exists(os.path.join(args.outDir, f"{stem}_cutflow.json")):
+                    print(f"Cut flow exists for {stem}, skipping (use --force)")
+                    continue
+                datasets.append((stem, f"{DataMC}/{group}/{dataset}", DataMC.lower().startswith("data"), list(files)))
+
+    results = {}
+    n_files = sum(len(files) for *_, files in datasets)
+    print(f"Cut flow of {len(cut_names)} cuts over {n_files} files in {len(datasets)} datasets, {args.workers} workers")
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(cut_flow_file, path, event_cuts, is_data): path
+                   for _, _, is_data, files in datasets for path in files}
+        for i, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                print(f"  FAILED {path}: {e}")
+            if i % 100 == 0 or i == len(futures):
+                print(f"  Progress: {i}/{len(futures)}")
+
+    failed = False
+    for stem, label, _, files in datasets:
+        report = write_dataset_outputs(args.outDir, stem, args.era, label, cut_names, cut_exprs, files, results)
+        print_table(report)
+        failed |= any("error" in v for v in report["files"].values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
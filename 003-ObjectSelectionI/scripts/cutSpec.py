@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Declarative object/event cut spec, compiled to every form the chapter needs.
+
+config.yaml's ObjectSelection[era] defines each object (Muon, Jet, bJet) once,
+as a list of terms on its collection's branches:
+
+    ObjectSelection:
+      UL2017:
+        Muon:
+          collection: Muon
+          cuts:
+            - {var: pt,  op: ">", value: 29}
+            - {var: eta, op: "<", value: 2.4, abs: true}
+            - {var: tightId}                          # truthiness of a flag
+            - any:                                    # OR of terms
+                - {var: pt,   op: ">", value: 50}
+                - {var: puId, op: ">", value: 0}
+        bJet:
+          extends: Jet                                # Jet's terms, then these
+          cuts:
+            - {var: btagDeepFlavB, op: ">", value: 0.3040}
+
+and SelectionCuts[era] entries are either a raw TTreeFormula string (HLT, MET
+flags) or an object count:
+
+    SelectionCuts:
+      UL2017:
+        muonCut: {count: Muon, op: "==", value: 1}    # -> Sum$(Muon_pt > 29 && ...) == 1
+
+From that one definition this module generates
+  - the TTreeFormula cut string PostProcessor applies (selection_cut_strings),
+  - vectorized NumPy/awkward predicates over uproot arrays, per object
+    (ObjectSelection.mask) and per event (EventCut.__call__), for columnar
+    stages such as cutFlow.py,
+  - a per-object Python function with the thresholds bound in as literals
+    (ObjectSelection.function), for SelectedObjectsProducer's event loop,
+so the cut string and the producer's object ID agree by construction.
+
+Usage (print the generated cut strings):
+    python3 cutSpec.py --config ../config.yaml --era UL2017
+"""
+
+import argparse
+import operator
+
+import numpy as np
+
+_OPS = {
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt,
+    "<=": operator.le, "==": operator.eq, "!=": operator.ne,
+}
+
+
+def _literal(value):
+    """Threshold as it appears in generated code: ints stay ints, everything else a float."""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Cut value must be a number, got {value!r}")
+    if isinstance(value, int):
+        return value
+    return float(value)  # YAML 1.1 reads "1.0e6" as a string
+
+
+def _check_term(term, where):
+    if not isinstance(term, dict):
+        raise ValueError(f"{where}: cut term must be a mapping, got {term!r}")
+    if "any" in term:
+        if set(term) != {"any"} or not term["any"]:
+            raise ValueError(f"{where}: 'any' term must hold a non-empty list and nothing else: {term!r}")
+        for sub in term["any"]:
+            _check_term(sub, where)
+        return
+    unknown = set(term) - {"var", "op", "value", "abs"}
+    if "var" not in term or unknown:
+        raise ValueError(f"{where}: cut term needs 'var' (and only op/value/abs): {term!r}")
+    if ("op" in term) != ("value" in term):
+        raise ValueError(f"{where}: cut term needs both 'op' and 'value', or neither: {term!r}")
+    if "op" in term:
+        if term["op"] not in _OPS:
+            raise ValueError(f"{where}: unsupported op {term['op']!r}, expected one of {sorted(_OPS)}")
+        _literal(term["value"])
+
+
+def _term_expr(term, prefix):
+    """TTreeFormula text of one term on branches `{prefix}{var}`."""
+    if "any" in term:
+        text = " || ".join(_term_expr(sub, prefix) for sub in term["any"])
+        return f"({text})"
+    branch = f"{prefix}{term['var']}"
+    if term.get("abs"):
+        branch = f"abs({branch})"
+    if "op" not in term:
+        return branch
+    return f"{branch} {term['op']} {_literal(term['value'])!r}"
+
+
+def _term_source(term, obj):
+    """Python source of one term on attributes of `obj`."""
+    if "any" in term:
+        return "(" + " or ".join(_term_source(sub, obj) for sub in term["any"]) + ")"
+    attr = f"{obj}.{term['var']}"
+    if term.get("abs"):
+        attr = f"abs({attr})"
+    if "op" not in term:
+        return f"bool({attr})"
+    return f"{attr} {term['op']} {_literal(term['value'])!r}"
+
+
+def _term_mask(term, arrays, prefix):
+    """Per-object boolean (jagged) array of one term."""
+    if "any" in term:
+        masks = [_term_mask(sub, arrays, prefix) for sub in term["any"]]
+        out = masks[0]
+        for m in masks[1:]:
+            out = out | m
+        return out
+    values = arrays[f"{prefix}{term['var']}"]
+    if term.get("abs"):
+        values = np.abs(values)
+    if "op" not in term:
+        return values != 0
+    value = _literal(term["value"])
+    # TTreeFormula compares in double: a float64 scalar (unlike a bare Python
+    # float) promotes float32 branches instead of being demoted (cf. cutFlow.py).
+    return _OPS[term["op"]](values, np.float64(value) if isinstance(value, float) else value)
+
+
+def _term_branches(term, prefix):
+    if "any" in term:
+        return set().union(*(_term_branches(sub, prefix) for sub in term["any"]))
+    return {f"{prefix}{term['var']}"}
+
+
+class ObjectSelection:
+    """One object's compiled selection: `own_terms`, after those of the object it extends."""
+
+    def __init__(self, name, collection, own_terms, base=None):
+        self.name = name
+        self.collection = collection
+        self.own_terms = list(own_terms)
+        self.base = base
+        self.terms = (base.terms if base else []) + self.own_terms
+        if not self.terms:
+            raise ValueError(f"ObjectSelection {name}: no cuts")
+        self.prefix = f"{collection}_"
+        self.branches = frozenset(set().union(*(_term_branches(t, self.prefix) for t in self.terms)))
+
+    def _terms(self, inherited):
+        terms = self.terms if inherited else self.own_terms
+        if not terms:
+            raise ValueError(f"ObjectSelection {self.name}: no cuts of its own")
+        return terms
+
+    def expr(self):
+        """Per-object TTreeFormula expression, e.g. "Muon_pt > 29 && abs(Muon_eta) < 2.4"."""
+        return " && ".join(_term_expr(t, self.prefix) for t in self.terms)
+
+    def mask(self, arrays, inherited=True):
+        """Per-object boolean jagged array over `arrays` (uproot/awkward, flat branch names).
+
+        inherited=False as for function().
+        """
+        terms = self._terms(inherited)
+        out = _term_mask(terms[0], arrays, self.prefix)
+        for term in terms[1:]:
+            out = out & _term_mask(term, arrays, self.prefix)
+        return out
+
+    def function(self, inherited=True):
+        """obj -> bool over NanoAODTools Objects, thresholds inlined as literals.
+
+        inherited=False tests only this object's own terms, e.g. the b-tag of
+        a jet that already passed the Jet selection.
+        """
+        terms = self._terms(inherited)
+        source = (f"def passes_{self.name}(obj):\n"
+                  f"    return {' and '.join(_term_source(t, 'obj') for t in terms)}\n")
+        namespace = {}
+        exec(compile(source, f"<cutSpec {self.name}>", "exec"), namespace)
+        fn = namespace[f"passes_{self.name}"]
+        fn.source = source
+        return fn
+
+
+def object_selections(spec):
+    """{name: ObjectSelection} from one era's ObjectSelection mapping, resolving `extends`."""
+    if not isinstance(spec, dict) or not spec:
+        raise ValueError("ObjectSelection[era] must be a non-empty mapping of objects")
+    resolved = {}
+
+    def resolve(name, chain=()):
+        if name in resolved:
+            return resolved[name]
+        if name not in spec:
+            raise ValueError(f"ObjectSelection: unknown object {name!r}")
+        if name in chain:
+            raise ValueError(f"ObjectSelection: circular 'extends' via {' -> '.join(chain + (name,))}")
+        entry = spec[name]
+        base = resolve(entry["extends"], chain + (name,)) if entry.get("extends") else None
+        collection = entry.get("collection", base.collection if base else None)
+        if collection is None:
+            raise ValueError(f"ObjectSelection {name}: needs 'collection' or 'extends'")
+        if base is not None and collection != base.collection:
+            raise ValueError(f"ObjectSelection {name}: extends {base.name} on a different collection")
+        cuts = entry.get("cuts") or []
+        for term in cuts:
+            _check_term(term, f"ObjectSelection {name}")
+        resolved[name] = ObjectSelection(name, collection, cuts, base)
+        return resolved[name]
+
+    for name in spec:
+        resolve(name)
+    return resolved
+
+
+class EventCut:
+    """One SelectionCuts entry: a raw TTreeFormula string, or a count of selected objects."""
+
+    def __init__(self, name, node, objects):
+        self.name = name
+        if isinstance(node, str):
+            self.expr = node.strip()
+            self.obj, self.op, self.value = None, None, None
+            self.columnar = False
+            self.branches = None  # unknown without parsing the string
+            return
+        if not isinstance(node, dict) or set(node) != {"count", "op", "value"}:
+            raise ValueError(f"SelectionCuts {name}: expected a cut string or "
+                             f"{{count: <object>, op: ..., value: ...}}, got {node!r}")
+        if node["count"] not in objects:
+            raise ValueError(f"SelectionCuts {name}: unknown object {node['count']!r}")
+        if node["op"] not in _OPS:
+            raise ValueError(f"SelectionCuts {name}: unsupported op {node['op']!r}")
+        self.obj, self.op, self.value = objects[node["count"]], node["op"], _literal(node["value"])
+        self.expr = f"Sum$({self.obj.expr()}) {self.op} {self.value!r}"
+        self.columnar = True
+        self.branches = self.obj.branches
+
+    def __call__(self, arrays):
+        """Per-event numpy bool array (count cuts only; raw strings go through cutFlow.CompiledCut)."""
+        if not self.columnar:
+            raise TypeError(f"SelectionCuts {self.name} is a raw cut string, not a spec")
+        import awkward as ak
+        counts = ak.to_numpy(ak.sum(self.obj.mask(arrays), axis=1))
+        return np.asarray(_OPS[self.op](counts, self.value), dtype=bool)
+
+
+def era_objects(config, era):
+    """{name: ObjectSelection} of `era` from a loaded config.yaml."""
+    try:
+        spec = config["ObjectSelection"][era]
+    except KeyError:
+        raise ValueError(f"config.yaml has no ObjectSelection[{era}]")
+    return object_selections(spec)
+
+
+def selection_cuts(config, era):
+    """{name: EventCut} of SelectionCuts[era], skipping empty entries, in config order."""
+    era_cuts = config["SelectionCuts"][era] or {}
+    objects = None
+    out = {}
+    for name, node in era_cuts.items():
+        if node is None or (isinstance(node, str) and not node.strip()):
+            continue
+        if not isinstance(node, str) and objects is None:
+            objects = era_objects(config, era)
+        out[name] = EventCut(name, node, objects or {})
+    return out
+
+
+def selection_cut_strings(config, era):
+    """{name: TTreeFormula string} of SelectionCuts[era] -- what PostProcessor gets, AND-ed."""
+    return {name: cut.expr for name, cut in selection_cuts(config, era).items()}
+
+
+def combined_cut_string(config, era):
+    """The single PostProcessor cut= string for `era`."""
+    return " && ".join(selection_cut_strings(config, era).values())
+
+
+if __name__ == "__main__":
+    import yaml
+
+    parser = argparse.ArgumentParser(description="Print the cut strings and object functions generated from config.yaml.")
+    parser.add_argument("--config", required=True, help="Chapter config.yaml (ObjectSelection, SelectionCuts)")
+    parser.add_argument("--era", required=True)
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+    for name, expr in selection_cut_strings(config, args.era).items():
+        print(f"{name}: {expr}")
+    for name, obj in era_objects(config, args.era).items():
+        print()
+        print(obj.function().source, end="")
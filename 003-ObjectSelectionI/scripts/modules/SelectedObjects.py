@@ -1,10 +1,106 @@
 from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import Module
 from PhysicsTools.NanoAODTools.postprocessing.framework.datamodel import Collection
 
+# Flat import: scripts/ is on sys.path locally (runSelection.py), and CRAB
+# ships cutSpec.py next to this file.
+from cutSpec import object_selections
+
 
 # Sentinel value written to *_pt branches when the object is not found.
 _SENTINEL_PT = -1.0
 
+# Entries per uproot read in columnar mode.
+_CHUNK_ENTRIES = 100000
+
+
+def _tree_entry(event):
+    """Tree entry of `event`. With a cut string or jsonInput, PostProcessor's
+    preSkim hands the loop a TEntryList and event._entry indexes that list,
+    not the tree. Without one, InputTree keeps a null pointer (falsy)."""
+    entrylist = getattr(event._tree, "_entrylist", None)
+    if entrylist:
+        return entrylist.GetEntry(event._entry)
+    return event._entry
+
+
+def _local_cumsum(mask):
+    """Per-event running count of True in a jagged boolean array."""
+    import awkward as ak
+    import numpy as np
+
+    counts = ak.to_numpy(ak.num(mask, axis=1))
+    flat = ak.to_numpy(ak.flatten(mask)).astype(np.int64)
+    total = np.cumsum(flat)
+    starts = np.cumsum(counts) - counts
+    before = np.concatenate([[0], total])[starts]
+    return ak.unflatten(total - np.repeat(before, counts), counts)
+
+
+def _pick(values, index, default, dtype):
+    """values[index] per event as a list, `default` where index is None."""
+    import awkward as ak
+
+    picked = ak.firsts(values[ak.singletons(index)])
+    return ak.fill_none(ak.values_astype(picked, dtype), default).to_list()
+
+
+def selected_object_columns(arrays, objects, bNames, is_mc):
+    """Every SelectedObjectsProducer output column for a chunk of events at once.
+
+    arrays: uproot/awkward arrays with flat NanoAOD branch names (Muon_pt, ...)
+    objects: cutSpec.object_selections() of the era
+    Returns {output branch name: list of per-event values}.
+
+    Same result as the event loop, value for value: the muon is the first of
+    the highest-pT passing muons in collection order, and jets are ordered by
+    a stable descending pT sort (what sorted(..., reverse=True) does) before
+    the first two b-tagged jets and the first two jets outside that pair are
+    taken, found with running counts instead of a Python loop.
+    """
+    import awkward as ak
+    import numpy as np
+
+    columns = {}
+
+    muon_order = ak.argsort(arrays["Muon_pt"], axis=1, ascending=False, stable=True)
+    muon_pass = objects["Muon"].mask(arrays)
+    muon_idx = ak.firsts(muon_order[muon_pass[muon_order]])
+    prefix = bNames["muon"]
+    for field in SelectedObjectsProducer._MUON_FLOAT_FIELDS:
+        default = _SENTINEL_PT if field == "pt" else 0.0
+        columns[f"{prefix}_{field}"] = _pick(arrays[f"Muon_{field}"], muon_idx, default, np.float64)
+    for field in SelectedObjectsProducer._MUON_INT_FIELDS:
+        columns[f"{prefix}_{field}"] = _pick(arrays[f"Muon_{field}"], muon_idx, 0, np.int64)
+    columns[f"{prefix}_tightId"] = _pick(arrays["Muon_tightId"], muon_idx, False, bool)
+
+    jet_idx = ak.local_index(arrays["Jet_pt"], axis=1)[objects["Jet"].mask(arrays)]
+    jet_order = ak.argsort(arrays["Jet_pt"][jet_idx], axis=1, ascending=False, stable=True)
+    sorted_idx = jet_idx[jet_order]
+    btagged = objects["bJet"].mask(arrays, inherited=False)[sorted_idx]
+    b_rank = _local_cumsum(btagged)
+    light = ~(btagged & (b_rank <= 2))
+    l_rank = _local_cumsum(light)
+    slots = {
+        "leadingbJet":    btagged & (b_rank == 1),
+        "subleadingbJet": btagged & (b_rank == 2),
+        "leadingJet":     light & (l_rank == 1),
+        "subleadingJet":  light & (l_rank == 2),
+    }
+    int_fields = SelectedObjectsProducer._JET_INT_FIELDS + (
+        SelectedObjectsProducer._JET_INT_FIELDS_MC if is_mc else [])
+    for jet_key in SelectedObjectsProducer._JET_KEYS:
+        idx = ak.firsts(sorted_idx[slots[jet_key]])
+        prefix = bNames[jet_key]
+        for field in SelectedObjectsProducer._JET_FLOAT_FIELDS:
+            default = _SENTINEL_PT if field == "pt" else 0.0
+            columns[f"{prefix}_{field}"] = _pick(arrays[f"Jet_{field}"], idx, default, np.float64)
+        for field in int_fields:
+            columns[f"{prefix}_{field}"] = _pick(arrays[f"Jet_{field}"], idx, -1, np.int64)
+
+    columns["sel_nJet"] = ak.num(sorted_idx, axis=1).to_list()
+    columns["sel_nbjet"] = ak.sum(btagged, axis=1).to_list()
+    return columns
+
 
 class SelectedObjectsProducer(Module):
     """
@@ -12,30 +108,30 @@ class SelectedObjectsProducer(Module):
     (2 b-tagged + 2 light, taken from the 4 highest-pT selected jets) and
     writes their kinematics to flat branches.
 
-    Selection logic mirrors the event-level cut string in config.yaml so that
-    downstream modules (SF weights, reco, BDT) have a single consistent source
-    of truth and do not need to re-run kinematic cuts independently.
+    Muon, Jet and bJet are compiled from config.yaml's ObjectSelection[era]
+    by cutSpec.py -- the same spec the event-level cut string is generated
+    from -- so downstream modules (SF weights, reco, BDT) have a single
+    consistent source of truth and do not need to re-run kinematic cuts
+    independently.
 
     Output sentinel: *_pt = -1 when the object is absent (no muon found, or
     the top-4 jets do not split into exactly 2b+2l).
 
     Expected config keys
     --------------------
-    kinematics:
-      Muon:
-        lohi:  {var: {low: x, high: y}, ...}
-        value: {var: val, ...}
-      Jet:
-        pt_min:  float
-        eta_max: float
-        jetId:   int
-    bTagThreshold: float
+    objectSelection: ObjectSelection[era] (Muon, Jet, bJet extending Jet),
+                     injected by run_all.py / crab_script_selection.py
     branchNames:
       muon:           str   # prefix, e.g. "SelMuon"
       leadingbJet:    str   # e.g. "leadingbJet"
       subleadingbJet: str
       leadingJet:     str   # leading *light* jet among top-4
       subleadingJet:  str
+    columnar:         bool  # optional (run_all.py --columnar, not config.yaml):
+                            # compute every output column per chunk
+                            # of entries with uproot/awkward in beginFile /
+                            # analyze (selected_object_columns) instead of
+                            # walking Collections event by event
     """
 
     _MUON_FLOAT_FIELDS = ["pt", "eta", "phi", "mass", "pfRelIso04_all"]
@@ -47,20 +143,18 @@ class SelectedObjectsProducer(Module):
 
     def __init__(self, config):
         super().__init__()
-        self.muonCut       = config['kinematics']['Muon']
-        self.jetCut        = config['kinematics']['Jet']
-        self.bTagThreshold = float(config['bTagThreshold'])
         self.bNames        = config['branchNames']
 
-        # Ensure lohi bounds are floats (YAML→JSON round-trip can produce strings)
-        for bounds in self.muonCut["lohi"].values():
-            bounds['low']  = float(bounds['low'])
-            bounds['high'] = float(bounds['high'])
-
-        self._jet_pt_min  = float(self.jetCut['pt_min'])
-        self._jet_eta_max = float(self.jetCut['eta_max'])
-        self._jet_jetId   = int(self.jetCut['jetId'])
+        # Per-object predicates generated once per job with the era's
+        # thresholds inlined, instead of walking the cut config per object.
+        objects = object_selections(config['objectSelection'])
+        self._passes_muon_cuts = objects['Muon'].function()
+        self._passes_jet_cuts  = objects['Jet'].function()
+        # Applied only to jets that already passed the Jet cuts.
+        self._is_btagged       = objects['bJet'].function(inherited=False)
         self._is_mc       = bool(config.get('is_mc', True))
+        self._objects     = objects
+        self._columnar    = bool(config.get('columnar', False))
 
     def beginFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
         self.out = wrappedOutputTree
@@ -86,7 +180,46 @@ class SelectedObjectsProducer(Module):
         self.out.branch("sel_nJet", "I")
         self.out.branch("sel_nbjet", "I")
 
+        if self._columnar:
+            import uproot
+            self._uproot_file = uproot.open(inputFile.GetName())
+            self._tree = self._uproot_file[inputTree.GetName()]
+            jet_fields = self._JET_FLOAT_FIELDS + self._JET_INT_FIELDS + (
+                self._JET_INT_FIELDS_MC if self._is_mc else [])
+            self._read_branches = sorted(
+                set().union(*(obj.branches for obj in self._objects.values()))
+                | {f"Muon_{f}" for f in self._MUON_FLOAT_FIELDS + self._MUON_INT_FIELDS + ["tightId"]}
+                | {f"Jet_{f}" for f in jet_fields}
+            )
+            self._chunk_start, self._chunk_stop, self._chunk = 0, 0, None
+
+    def endFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        if self._columnar:
+            self._uproot_file.close()
+            self._uproot_file, self._tree, self._chunk = None, None, None
+
+    def _load_chunk(self, entry):
+        """Output columns of the _CHUNK_ENTRIES-aligned block of entries holding `entry`."""
+        start = entry - entry % _CHUNK_ENTRIES
+        stop = min(start + _CHUNK_ENTRIES, self._tree.num_entries)
+        arrays = self._tree.arrays(self._read_branches, entry_start=start, entry_stop=stop, library="ak")
+        columns = selected_object_columns(arrays, self._objects, self.bNames, self._is_mc)
+        self._chunk = list(columns.items())
+        self._chunk_start, self._chunk_stop = start, stop
+
     def analyze(self, event):
+        if self._columnar:
+            # PostProcessor visits the entries passing the cut (and golden
+            # JSON) in increasing order.
+            entry = _tree_entry(event)
+            if not self._chunk_start <= entry < self._chunk_stop:
+                self._load_chunk(entry)
+            i = entry - self._chunk_start
+            fill = self.out.fillBranch
+            for name, values in self._chunk:
+                fill(name, values[i])
+            return True
+
         self._fill_muon(event)
         jets = Collection(event, "Jet")
         sel_jets = [j for j in jets if self._passes_jet_cuts(j)]
@@ -137,7 +270,7 @@ class SelectedObjectsProducer(Module):
         bjets = []
         bjets_set = set()
         for j in sorted_jets:
-            if j.btagDeepFlavB > self.bTagThreshold:
+            if self._is_btagged(j):
                 bjets.append(j)
                 bjets_set.add(id(j))
             if len(bjets) == 2:
@@ -180,27 +313,10 @@ class SelectedObjectsProducer(Module):
                 self.out.fillBranch(f"{prefix}_jetId",         -1)
                 self.out.fillBranch(f"{prefix}_puId",          -1)
 
-    def _passes_muon_cuts(self, muon):
-        for var, cut in self.muonCut["lohi"].items():
-            if muon[var] < cut['low'] or muon[var] > cut['high']:
-                return False
-        for var, val in self.muonCut["value"].items():
-            if muon[var] != val:
-                return False
-        return True
-
-    def _passes_jet_cuts(self, jet):
-        return (
-            jet.pt > self._jet_pt_min
-            and abs(jet.eta) < self._jet_eta_max
-            and jet.jetId == self._jet_jetId
-            and (jet.pt > 50 or jet.puId > 0)
-        )
-
     def _fill_jet_counts(self, sel_jets):
         """Count selected jets and b-tagged jets (sel_jets already passed _passes_jet_cuts)."""
         sel_nJet = len(sel_jets)
-        sel_nbjet = sum(1 for j in sel_jets if j.btagDeepFlavB > self.bTagThreshold)
+        sel_nbjet = sum(1 for j in sel_jets if self._is_btagged(j))
 
         self.out.fillBranch("sel_nJet", sel_nJet)
         self.out.fillBranch("sel_nbjet", sel_nbjet)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Read-set profiler for the chapter drivers' --profileReadSet mode.
+
+PostProcessor reads input branches lazily, but nothing records which ones a
+stage's modules actually touch: the input keep/drop files are maintained by
+hand and the ROOT TTreeCache has to learn the read pattern on every file. In
+profile mode a driver runs its modules on a sample of files (--profileFiles
+files spread over each dataset, see sample_tasks(), first --profileEntries
+entries of each, output to a scratch directory) with a ReadSetRecorder
+installed, which
+  - hooks NanoAODTools' Event attribute access -- the path every
+    event.X / Collection / Object read goes through -- and attributes each
+    branch read to the module whose analyze() is running,
+  - adds the branches a module reads outside the event loop (a columnar
+    module's uproot reads, declared as its _read_branches),
+  - adds what PostProcessor itself needs: the cut string's branches, and
+    run/luminosityBlock when a golden JSON is applied,
+  - collects the input branches named in the modules' configs.
+
+A branch read only under rare conditions can still be missed by the sample.
+The branches the cut string and the configs name are therefore always kept,
+and write_outputs() reports those that no profiled event read.
+
+write_outputs() merges the per-file results into, for one stage:
+    {stage}_readset.json                 per-module read sets, files profiled
+    {stage}_keep_and_drop_input.txt      "drop *" + one "keep" per branch read,
+                                         for the drivers' --branchsel
+                                         (nano_postproc.py --bi)
+    {stage}_ttreecache.txt               one branch per line, for the drivers'
+                                         --cacheBranches (TTreeCacheModule)
+
+NOTE: PostProcessor's input branch selection also decides what is copied to
+the output tree -- a branch dropped on input is not in the skim either -- so
+--branchsel with the generated file slims the output to the read set plus the
+modules' new branches. Keep extra branches later stages need by adding "keep"
+lines by hand.
+"""
+
+import json
+import os
+import re
+from collections import defaultdict, OrderedDict
+
+from PhysicsTools.NanoAODTools.postprocessing.framework.datamodel import Event
+from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import Module
+
+_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+class ReadSetRecorder:
+    """Records the branches each wrapped module reads through Event attribute access."""
+
+    _installed = None  # recorder receiving reads in this process
+
+    def __init__(self):
+        self.reads = defaultdict(set)
+        self.available = set()
+        self.current = None
+        self._install()
+
+    def _install(self):
+        ReadSetRecorder._installed = self
+        if getattr(Event, "_readset_original_getattr", None) is not None:
+            return
+        original = Event.__getattr__
+
+        def recording_getattr(event, name):
+            value = original(event, name)  # raises for non-branches: not recorded
+            recorder = ReadSetRecorder._installed
+            if recorder is not None:
+                recorder.reads[recorder.current or "(framework)"].add(name)
+            return value
+
+        Event._readset_original_getattr = original
+        Event.__getattr__ = recording_getattr
+
+    def wrap(self, name, module):
+        """Attribute `module`'s reads to `name`; returns the module."""
+        analyze, begin_file = module.analyze, module.beginFile
+
+        def wrapped_analyze(event):
+            self.current = name
+            try:
+                return analyze(event)
+            finally:
+                self.current = None
+
+        def wrapped_begin_file(inputFile, outputFile, inputTree, wrappedOutputTree):
+            result = begin_file(inputFile, outputFile, inputTree, wrappedOutputTree)
+            self.available.update(b.GetName() for b in inputTree.GetListOfBranches())
+            self.reads[name].update(getattr(module, "_read_branches", None) or ())
+            return result
+
+        module.analyze = wrapped_analyze
+        module.beginFile = wrapped_begin_file
+        return module
+
+    def result(self, path, cut_string=None, json_input=None, module_configs=()):
+        """Picklable summary of one profiled file, for merge in the driver's main process.
+
+        module_configs: the task's [{"name", "config"}] list; every input
+        branch named in a config string is reported under "named".
+        """
+        framework = set()
+        if cut_string:
+            framework.update(n for n in _NAME.findall(cut_string) if n in self.available)
+        if json_input:
+            framework.update({"run", "luminosityBlock"})
+        named = set()
+        for entry in module_configs:
+            named.update(n for n in _config_names(entry.get("config", {})) if n in self.available)
+        return {
+            "file": path,
+            "modules": {name: sorted(branches) for name, branches in self.reads.items()},
+            "framework": sorted(framework),
+            "named": sorted(named),
+            "n_available": len(self.available),
+        }
+
+
+def _config_names(value):
+    """Every identifier in the string values of a (nested) module config."""
+    if isinstance(value, str):
+        yield from _NAME.findall(value)
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _config_names(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _config_names(item)
+
+
+def sample_tasks(tasks, files_per_dataset):
+    """Up to files_per_dataset tasks of each dataset, spread evenly over its files.
+
+    Always includes the first and last file, so a dataset whose conditions
+    change along its file list is profiled at both ends.
+    """
+    datasets = OrderedDict()
+    for task in tasks:
+        key = (task["era"], task.get("DataMC"), task.get("group"), task.get("dataset"))
+        datasets.setdefault(key, []).append(task)
+    sampled = []
+    for files in datasets.values():
+        n, k = len(files), max(1, min(files_per_dataset, len(files)))
+        picks = sorted({0} if k == 1 else {round(i * (n - 1) / (k - 1)) for i in range(k)})
+        sampled.extend(files[i] for i in picks)
+    return sampled
+
+
+class TTreeCacheModule(Module):
+    """Prefills the input tree's TTreeCache with a fixed branch list and skips the learning phase."""
+
+    def __init__(self, branches, cache_size=50 * 1024 * 1024):
+        super().__init__()
+        self.branches = list(branches)
+        self.cache_size = cache_size
+
+    def beginFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        inputTree.SetCacheSize(self.cache_size)
+        names = {b.GetName() for b in inputTree.GetListOfBranches()}
+        for branch in self.branches:
+            if branch in names:
+                inputTree.AddBranchToCache(branch, True)
+        inputTree.StopCacheLearningPhase()
+
+
+def load_branch_list(path):
+    """Branch names from a {stage}_ttreecache.txt (one per line, # comments)."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def write_outputs(out_dir, stage, results):
+    """Merge per-file results and write the stage's read-set JSON, keep/drop file and cache list."""
+    modules = defaultdict(set)
+    framework = set()
+    named = set()
+    for result in results:
+        for name, branches in result["modules"].items():
+            modules[name].update(branches)
+        framework.update(result["framework"])
+        named.update(result.get("named", ()))
+    read_set = set(framework).union(*modules.values()) if modules else set(framework)
+    # Named in a config but never read by the profiled events: kept anyway,
+    # the events that read them may just not have been in the sample.
+    not_read = named - read_set
+    read_set |= not_read
+    n_available = max((r["n_available"] for r in results), default=0)
+
+    os.makedirs(out_dir, exist_ok=True)
+    report = {
+        "stage": stage,
+        "files": [r["file"] for r in results],
+        "n_available": n_available,
+        "n_read": len(read_set),
+        "framework": sorted(framework),
+        "named_not_read": sorted(not_read),
+        "modules": {name: sorted(branches) for name, branches in sorted(modules.items())},
+    }
+    with open(os.path.join(out_dir, f"{stage}_readset.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    header = (f"# Generated by --profileReadSet for stage {stage} from {len(results)} file(s):\n"
+              f"# {len(read_set)} of {n_available} input branches are kept"
+              f" ({len(not_read)} of them only named in the module configs).\n")
+    with open(os.path.join(out_dir, f"{stage}_keep_and_drop_input.txt"), "w") as f:
+        f.write(header + "drop *\n" + "".join(f"keep {b}\n" for b in sorted(read_set)))
+    with open(os.path.join(out_dir, f"{stage}_ttreecache.txt"), "w") as f:
+        f.write(header + "".join(f"{b}\n" for b in sorted(read_set)))
+    return report
@@ -21,6 +21,8 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 import utils
+import datasetCatalog
+import cutSpec
 
 
 def matches_filter(filters, era, data_mc=None, group=None, dataset=None):
@@ -46,6 +48,22 @@ def matches_filter(filters, era, data_mc=None, group=None, dataset=None):
     return False
 
 
+def dataset_json_rows(json_path, era, filters):
+    """The file rows catalog.files() would give for one dataset JSON, read from
+    the JSON itself: (DataMC, group, dataset) sorted, files in JSON order."""
+    with open(json_path) as f:
+        dataset_json = json.load(f)
+    rows = []
+    for DataMC in sorted(dataset_json):
+        for group in sorted(dataset_json[DataMC]):
+            for dataset in sorted(dataset_json[DataMC][group]):
+                if not matches_filter(filters, era, DataMC, group, dataset):
+                    continue
+                rows.extend({"data_mc": DataMC, "grp": group, "dataset": dataset, "path": path}
+                            for path in dataset_json[DataMC][group][dataset])
+    return rows
+
+
 def main(): 
     parser = argparse.ArgumentParser(description='Generate all outputs for 002-Samples')
     parser.add_argument('-t', '--tag', type=str,
@@ -62,6 +80,11 @@ def main():
     parser.add_argument('--previousHash', type=str, default=None,
                        help='[0] Config hash of the 002-Samples run to fetch from (its outputs/{tag}/{hash}/ '
                             'directory). Required by --fetchFromPreviousChapter.')
+    parser.add_argument('--cutFlow', action='store_true',
+                       help='[1a] Run scripts/cutFlow.py on preselection_{era}_datasets.json: evaluates every '
+                            'SelectionCuts[era] cut per event into a bitmask and writes sequential / N-1 cut-flow '
+                            'tables (weighted and unweighted) and per-file entry lists under outputs/.../{era}/cutflow/. '
+                            '--generateProcessListJSON then passes each file\'s pass count to runSelection.py.')
     parser.add_argument('--generateProcessListJSON', action='store_true',
                        help='[1] Generate process list JSON for runSelection.py by reading the per-era '
                             'dataset JSONs produced by --generateDatasetJSON')
@@ -82,13 +105,18 @@ def main():
                        help='[lxplus][CRAB] With --checkCrabStatus: remove CRAB jobs that never submitted successfully.')
     parser.add_argument('--generateDatasetJSON', action='store_true',
                        help='[3] Generate dataset JSON file using the script generateDatasetJSON.py')
+    parser.add_argument('--columnar', action='store_true',
+                       help='[2][2alt] Run selectedObjects on its columnar path (per chunk of entries with '
+                            'uproot/awkward instead of per event). Same output, so it is a flag rather than a '
+                            'config.yaml setting and does not change the config hash. CRAB workers without '
+                            'uproot/awkward fall back to the event loop.')
     parser.add_argument('--printHash', action='store_true',
                        help='Print the config hash and exit (useful for debugging)')
     parser.add_argument('--sample', action='store_true',
                        help='Only add the first file of each dataset to the process list JSON (for testing purposes). '
                             'For --submitSelectionJobs, only submits the first file of each dataset via CRAB.')
     parser.add_argument('--workers', type=int, default=15,
-                       help='Number of parallel workers passed to runSelection.py (default: 15)')
+                       help='Number of parallel workers passed to runSelection.py and generateDatasetJSON.py (default: 15)')
     parser.add_argument('--verifyOutput', action='store_true',
                        help='[4] Run scripts/verifyOutput.py on selectionI_{tag}_{era}_datasets.json (from '
                             '--generateDatasetJSON): checks each skim opens cleanly, has an Events tree, and '
@@ -103,6 +131,7 @@ def main():
     print(f"  --tag: {args.tag}")
     print(f"  --fetchFromPreviousChapter: {args.fetchFromPreviousChapter}")
     print(f"  --previousHash: {args.previousHash}")
+    print(f"  --cutFlow: {args.cutFlow}")
     print(f"  --generateProcessListJSON: {args.generateProcessListJSON}")
     print(f"  --writeBashScript: {args.writeBashScript}")
     print(f"  --submitSelectionJobs: {args.submitSelectionJobs}")
@@ -112,6 +141,7 @@ def main():
     print(f"  --generateDatasetJSON: {args.generateDatasetJSON}")
     print(f"  --sample: {args.sample}")
     print(f"  --workers: {args.workers}")
+    print(f"  --columnar: {args.columnar}")
     print(f"  --force: {args.force}")
     print(f"  --filter: {args.filter}")
     print(f"  --printHash: {args.printHash}")
@@ -173,6 +203,35 @@ def main():
                 print(f"    Fetched {filename} -> {local_path} and {output_path}")
         print("Finished fetching inputs from 002-Samples.")
 
+    # Per-cut bitmask cut flow of the preselection files
+    if args.cutFlow:
+        print("\nRunning cut flow of SelectionCuts over the preselection files (scripts/cutFlow.py)...")
+        cut_flow_script = base_dir / 'scripts' / 'cutFlow.py'
+        for era in config['NgenandXsec']:
+            if not matches_filter(args.filter, era):
+                continue
+            preselection_dataset_json = output_dir / 'inputs' / f'preselection_{era}_datasets.json'
+            if not preselection_dataset_json.exists():
+                print(f"  Warning: Dataset JSON not found: {preselection_dataset_json}. Skipping era {era}.")
+                continue
+            cmd = [
+                sys.executable, str(cut_flow_script),
+                '--config', str(config_path),
+                '--era', era,
+                '--datasetJSON', str(preselection_dataset_json),
+                '--outDir', str(output_dir / era / 'cutflow'),
+                '--workers', str(args.workers),
+            ]
+            if args.filter:
+                cmd += ['--filter'] + args.filter
+            if args.force:
+                cmd.append('--force')
+            print(f"Running command: {' '.join(cmd)}")
+            result = subprocess.run(cmd)
+            if result.returncode != 0:
+                print(f"Error running cutFlow.py for era {era}")
+                return 1
+
     # Generate process list JSON for runSelection.py
     if args.generateProcessListJSON:
         print("\nGenerating process list JSON for runSelection.py...")
@@ -194,85 +253,91 @@ def main():
                 print(f"  Warning: Golden JSON file not found: {golden_json_file}. Data tasks will run without golden JSON filtering for era {era}.")
 
 
-            with open(preselection_dataset_json) as f:
-                datasetJSON = json.load(f)
-
-            # Build combined cut string for this era
-            era_cuts = config['SelectionCuts'][era]
+            # Register the preselection dataset JSON in the dataset catalog
+            # (a no-op when it is unchanged since the last run) and get this
+            # era's files, --filter included, from one indexed query instead
+            # of walking the nested JSON level by level. The JSON stays the
+            # source of truth: a locked or unwritable catalog falls back to it.
+            try:
+                with datasetCatalog.Catalog() as catalog:
+                    catalog.import_dataset_json(preselection_dataset_json.resolve(), era, "preselection")
+                    file_rows = catalog.files(source=str(preselection_dataset_json.resolve()),
+                                              era=era, filters=args.filter)
+            except Exception as e:
+                print(f"  Warning: dataset catalog unavailable ({e}); reading {preselection_dataset_json} directly.")
+                file_rows = dataset_json_rows(preselection_dataset_json, era, args.filter)
+
+            # Build combined cut string for this era, object counts expanded
+            # from ObjectSelection[era] (the spec SelectedObjectsProducer's
+            # object ID is compiled from too)
             try:
-                utils.validate_selection_cuts_consistency(config, era)
+                active_cuts = cutSpec.selection_cut_strings(config, era)
             except ValueError as e:
                 print(f"Error: {e}")
                 return 1
-            cut_string = " && ".join(v for v in era_cuts.values() if v and v.strip())
+            cut_string = " && ".join(active_cuts.values())
 
             era_process_list = []
             era_skipped = 0
-            for DataMC in datasetJSON:
-                if not matches_filter(args.filter, era, DataMC):
+            current_dataset = None
+            for row in file_rows:
+                DataMC, group, dataset, filePath = row["data_mc"], row["grp"], row["dataset"], row["path"]
+                if (DataMC, group, dataset) != current_dataset:
+                    current_dataset = (DataMC, group, dataset)
+                    is_data = DataMC.lower().startswith("data")
+                    modules_key = "Data" if is_data else "MC"
+                    module_names = config.get("ModuleList", {}).get(modules_key, [])
+                    print(f"  Processing {era} / {DataMC} / {group} / {dataset} with modules: {module_names}")
+                    outputDir = os.path.join(
+                        storageBase, "selectionI", args.tag, config_hash, era, DataMC, group, dataset
+                    )
+                    # Build module configs: era-resolved + absolute SF paths
+                    module_configs = []
+                    for mod_name in module_names:
+                        mod_cfg_raw = config.get("Modules", {}).get(mod_name, {})
+                        # Use era-specific sub-config if present, else use top-level config
+                        mod_cfg = mod_cfg_raw.get(era, mod_cfg_raw)
+                        if mod_name == "selectedObjects":
+                            mod_cfg = dict(mod_cfg, is_mc=not is_data,
+                                           objectSelection=config['ObjectSelection'][era])
+                        module_configs.append({"name": mod_name, "config": mod_cfg})
+                    isSample = True
+
+                    # Per-file pass counts from --cutFlow, if it ran with the
+                    # current cuts: runSelection.py then skips 0-pass files
+                    # without its own TTree::GetEntries(cut_string) pass.
+                    n_pass_by_file = {}
+                    cut_flow_json = output_dir / era / 'cutflow' / f"{era}_{DataMC}_{group}_{dataset}_cutflow.json"
+                    if cut_flow_json.exists():
+                        with open(cut_flow_json) as f:
+                            cut_flow = json.load(f)
+                        if cut_flow.get("cuts") == active_cuts:
+                            n_pass_by_file = {path: v["n_pass"] for path, v in cut_flow["files"].items() if "n_pass" in v}
+                        else:
+                            print(f"    Cut flow {cut_flow_json} was made with different cuts; ignoring it.")
+
+                skim_name = os.path.basename(filePath).replace(".root", "_Skim.root")
+                skim_path = os.path.join(outputDir, skim_name)
+                if not args.force and os.path.exists(skim_path):
+                    era_skipped += 1
+                    print(f"    Skim output already exists, skipping: {skim_path}")
                     continue
-                print(f"  Processing {era} / {DataMC}...")
-                is_data = DataMC.lower().startswith("data")
-                modules_key = "Data" if is_data else "MC"
-                module_names = config.get("ModuleList", {}).get(modules_key, [])
-                print(f"  Processing {era} / {DataMC} / with modules: {module_names}")
-                # continue
-                # continue
-                for group in datasetJSON[DataMC]:
-                    if not matches_filter(args.filter, era, DataMC, group):
-                        continue
-                    print(f"  Processing {era} / {DataMC} / {group}...")
-                    # continue
-                    for dataset in datasetJSON[DataMC][group]:
-                        if not matches_filter(args.filter, era, DataMC, group, dataset):
-                            continue
-                        print (f"  Processing {era} / {DataMC} / {group} / {dataset}...")
-                        # continue
-                        # print(storageBase, args.tag, era, DataMC, group, dataset)
-                        outputDir = os.path.join(
-                            storageBase, "selectionI", args.tag, config_hash, era, DataMC, group, dataset
-                        )
-                        isSample = True
-                        for filePath in datasetJSON[DataMC][group][dataset]:
-                            
-                            # print(f"    Found file: {filePath}")
-                            # continue
-
-                            # Build module configs: era-resolved + absolute SF paths
-
-
-
-                            module_configs = []
-                            for mod_name in module_names:
-                                mod_cfg_raw = config.get("Modules", {}).get(mod_name, {})
-                                # Use era-specific sub-config if present, else use top-level config
-                                mod_cfg = mod_cfg_raw.get(era, mod_cfg_raw)
-                                if mod_name == "selectedObjects":
-                                    mod_cfg = dict(mod_cfg, is_mc=not is_data)
-                                module_configs.append({"name": mod_name, "config": mod_cfg})
-
-
-                            skim_name = os.path.basename(filePath).replace(".root", "_Skim.root")
-                            skim_path = os.path.join(outputDir, skim_name)
-                            if not args.force and os.path.exists(skim_path):
-                                era_skipped += 1
-                                print(f"    Skim output already exists, skipping: {skim_path}")
-                                continue
-                            task = {
-                                "era":       era,
-                                "DataMC":    DataMC,
-                                "group":     group,
-                                "dataset":   dataset,
-                                "outputDir": outputDir,
-                                "file":      filePath,
-                                "cut_string": cut_string,
-                                "goldenJSON": str(golden_json_file) if is_data else None,
-                                "branchsel": None,
-                                "modules":   module_configs,
-                                "isSample": isSample
-                            }
-                            era_process_list.append(task)
-                            isSample = False  # Only the first file of each dataset is added when --sample is used
+                task = {
+                    "era":       era,
+                    "DataMC":    DataMC,
+                    "group":     group,
+                    "dataset":   dataset,
+                    "outputDir": outputDir,
+                    "file":      filePath,
+                    "cut_string": cut_string,
+                    "goldenJSON": str(golden_json_file) if is_data else None,
+                    "branchsel": None,
+                    "modules":   module_configs,
+                    "isSample": isSample,
+                    "n_pass_cut": n_pass_by_file.get(filePath),
+                }
+                era_process_list.append(task)
+                isSample = False  # Only the first file of each dataset is added when --sample is used
             era_output_path = output_dir / era / f"{args.tag}_{era}_processListJSON.json"
             era_output_path.parent.mkdir(parents=True, exist_ok=True)
             with open(era_output_path, 'w') as f:
@@ -322,6 +387,7 @@ def main():
                             f"--workers {args.workers} "
                             f"{'--force ' if args.force else ''}"
                             f"{'--sample ' if args.sample else ''}"
+                            f"{'--columnar ' if args.columnar else ''}"
                             f"{'--filter ' + era + '/' + DataMC + '/' + group}"
                             f"{' 2>&1 | tee -a ' + str(output_dir / era / DataMC / group / f'{args.tag}_{era}_{DataMC}_{group}.log')}"
                         )
@@ -378,6 +444,7 @@ def main():
                             f"--dataset-json {dataset_json_path} --golden-json {golden_json_path} "
                             f"--output-lfn {lfn_output_path} --work-area {work_area} "
                             f"{'--sample ' if args.sample else ''}"
+                            f"{'--columnar ' if args.columnar else ''}"
                             f"--include '{DataMC}/{group}/{dataset}'"
                         )
                         print(f"      Executing command: {command}")
@@ -479,7 +546,10 @@ def main():
                 sys.executable, str(generate_dataset_json_script),
                 '--outputDirectory', str(outputDirectory),
                 '--outputFileName', outputFileName,
-                '--baseDirectory', baseDirectory
+                '--baseDirectory', baseDirectory,
+                '--workers', str(args.workers),
+                '--tag', args.tag,
+                '--configHash', config_hash,
             ]
             print(f"Running command: {' '.join(cmd)}")
             result = subprocess.run(cmd, capture_output=True, text=True)
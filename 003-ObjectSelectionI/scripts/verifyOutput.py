@@ -20,9 +20,9 @@ creates/updates:
     missing branch here is always a hard error: unlike 002's Data/MC-only
     NanoAOD branches, there's no legitimate reason this stage's own output
     branches would be absent from a successfully-produced skim.
-  - min/max/mean/stddev per new branch, over the real event population
-    (chained across a dataset's files via RDataFrame, same pattern as
-    002-Samples' verifyOutput.py)
+  - min/max/mean/stddev per new branch, over every event of the dataset
+    (merged from cached per-file partials, same pattern as 002-Samples'
+    verifyOutput.py)
   - two invariants that must ALWAYS hold given SelectedObjectsProducer's
     deterministic greedy jet-assignment algorithm (_fill_jets in
     scripts/modules/SelectedObjects.py); any violation means a real bug,
@@ -36,9 +36,17 @@ creates/updates:
     not a hard failure. SelectionCuts already requires >=1 muon / >=4 jets /
     >=2 b-jets before this module ever runs, so in a healthy pipeline these
     fractions should be ~0; a nonzero rate is flagged as a warning since it
-    can point at a cut-string vs module boundary-condition mismatch (e.g. a
-    ">" vs ">=" difference) that utils.validate_selection_cuts_consistency
-    in run_all.py can't catch since it only compares threshold *values*.
+    can point at a bug in how cutSpec.py compiles ObjectSelection into the
+    cut string vs the module's per-object functions (both come from the same
+    spec, so the thresholds and operators themselves cannot drift apart).
+
+Every per-file quantity here is additive -- stats partials (count, sum,
+sum of squares, min, max), invariant violation counts and sentinel counts --
+so each file's are cached on disk keyed by its adler32 checksum, and a
+dataset's numbers are the merge of its files'. Re-verifying after a partial
+reprocess only opens and reads the files whose content changed; their
+RDataFrame graphs (one per file, across all datasets) run concurrently via
+ROOT.RDF.RunGraphs with ImplicitMT.
 
 Input is a selectionI_{tag}_{era}_datasets.json (from --generateDatasetJSON),
 keyed {DataMC: {group: {dataset: {filepath: "Events"}}}}.
@@ -46,13 +54,18 @@ keyed {DataMC: {group: {dataset: {filepath: "Events"}}}}.
 Usage:
     python3 verifyOutput.py --datasetJSON <selectionI_{tag}_{era}_datasets.json> \\
         --config <config.yaml> --era <era> --outputReport <report.json> \\
-        [--filter ...] [--maxEntriesForStats 500000]
+        [--filter ...] [--statsCache <dir>] [--threads N]
 """
 
 import argparse
+import hashlib
 import json
+import math
+import os
 import re
 import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import ROOT
@@ -96,112 +109,180 @@ def expected_new_branches(branch_names, is_mc):
     return expected
 
 
-def check_file_structure(filepath, expected_branches):
-    """Open one file, check tree existence/health and that every branch this
-    stage is supposed to write is actually present.
+def scan_file(filepath):
+    """Open one file and read the structural facts check_file_structure()
+    judges: whether it opens, whether it has an Events tree, its entry count
+    and its branch list. Kept separate from the judging so the facts can be
+    cached alongside the file's stats partials."""
+    try:
+        f = ROOT.TFile.Open(filepath)
+    except OSError:
+        f = None
+    if not f or f.IsZombie():
+        return {"error": "file did not open / is zombie"}
+
+    tree = f.Get("Events")
+    if not tree:
+        f.Close()
+        return {"error": "no 'Events' tree"}
+
+    facts = {
+        "n_entries": tree.GetEntries(),
+        "branches": sorted(b.GetName() for b in tree.GetListOfBranches()),
+    }
+    f.Close()
+    return facts
+
+
+def check_file_structure(filepath, facts, expected_branches):
+    """Check tree existence/health and that every branch this stage is
+    supposed to write is actually present, from one file's scan_file() facts.
 
     Returns (ok: bool, info: dict). Unlike 002-Samples' verifyOutput.py,
     a missing expected branch is a hard error here, not a warning -- see
     module docstring.
     """
     info = {"file": filepath, "errors": [], "warnings": []}
-    f = ROOT.TFile.Open(filepath)
-    if not f or f.IsZombie():
-        info["errors"].append("file did not open / is zombie")
+    if "error" in facts:
+        info["errors"].append(facts["error"])
         return False, info
 
-    tree = f.Get("Events")
-    if not tree:
-        info["errors"].append("no 'Events' tree")
-        f.Close()
-        return False, info
-
-    n_entries = tree.GetEntries()
+    n_entries = facts["n_entries"]
     info["n_entries"] = n_entries
     if n_entries == 0:
         info["warnings"].append("0 entries (may be legitimate for a tightly-cut skim)")
 
-    actual_branches = {b.GetName() for b in tree.GetListOfBranches()}
+    actual_branches = set(facts["branches"])
     info["n_branches"] = len(actual_branches)
 
     missing = sorted(expected_branches - actual_branches)
     if missing:
         info["errors"].append(f"SelectedObjectsProducer branches missing from output: {missing}")
 
-    f.Close()
     return (len(info["errors"]) == 0), info
 
 
-def compute_dataset_stats(filepaths, new_branches, max_entries_for_stats):
-    """min/max/mean/stddev for just the branches this stage creates/updates
-    -- not the hundreds of original NanoAOD branches passed through
-    untouched, which are 002-Samples' concern, not this stage's.
-
-    Uses RDataFrame's lazy Min/Max/Mean/StdDev actions for the same reason
-    002-Samples' verifyOutput.py does: TTree::Draw + GetV1() needs
-    SetEstimate() sized correctly per branch and got this wrong once,
-    causing a real segfault. RDataFrame actions avoid that failure mode and
-    batch all branches into one combined pass over the data.
+# ---------------------------------------------------------------------------
+# Per-file stats cache -- same layout as 002-Samples' verifyOutput.py:
+#
+# {cache_dir}/checksums.json        {filepath: {size, mtime_ns, checksum}}
+# {cache_dir}/files/{checksum}.json {version, facts, partials, invariants}
+# ---------------------------------------------------------------------------
+STATS_CACHE_VERSION = 1
+
+
+def file_checksum(filepath, memo):
+    """adler32 of the file content (the checksum CMS data management tools
+    use), memoized in `memo` by (size, mtime) so unchanged files are not
+    re-read just to be re-hashed. Returns None if the file can't be read."""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    known = memo.get(filepath)
+    if known and known["size"] == st.st_size and known["mtime_ns"] == st.st_mtime_ns:
+        return known["checksum"]
+    value = 1
+    try:
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 24), b""):
+                value = zlib.adler32(chunk, value)
+    except OSError:
+        return None
+    checksum = f"{st.st_size}-{value & 0xffffffff:08x}"
+    memo[filepath] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "checksum": checksum}
+    return checksum
+
+
+def _write_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def load_checksum_memo(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, "checksums.json")) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_checksum_memo(cache_dir, memo):
+    _write_json_atomic(os.path.join(cache_dir, "checksums.json"), memo)
+
+
+def load_cache_entry(cache_dir, checksum):
+    try:
+        with open(os.path.join(cache_dir, "files", f"{checksum}.json")) as f:
+            entry = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return entry if entry.get("version") == STATS_CACHE_VERSION else None
+
+
+def save_cache_entry(cache_dir, checksum, entry):
+    _write_json_atomic(os.path.join(cache_dir, "files", f"{checksum}.json"), entry)
+
+
+def cache_entry_covers(entry, new_branches, invariants_key):
+    """Whether a cached entry answers everything this run asks of its file:
+    partials for every new branch the file has, and invariant counts booked
+    against the same branchNames (a config change invalidates them)."""
+    if entry["invariants"].get("key") != invariants_key:
+        return False
+    if entry["facts"]["n_entries"] == 0:
+        return True  # nothing was booked for an empty file
+    present = set(entry["facts"]["branches"]) & new_branches
+    return present <= set(entry["partials"])
+
+
+def book_file_partials(rdf, new_branches):
+    """Book (lazily) count/sum/sum-of-squares/min/max for just the branches
+    this stage creates/updates -- not the hundreds of original NanoAOD
+    branches passed through untouched, which are 002-Samples' concern, not
+    this stage's.
+
+    Uses RDataFrame actions for the same reason 002-Samples'
+    verifyOutput.py does: TTree::Draw + GetV1() needs SetEstimate() sized
+    correctly per branch and got this wrong once, causing a real segfault.
+    All of this stage's new branches are scalars, summed in double.
+
+    Returns (booked, errors): the booked handles per branch, and any
+    branches whose actions could not be booked.
     """
-    rdf = ROOT.RDataFrame("Events", filepaths)
-    n_entries = rdf.Count().GetValue()
-    stats = {"n_files": len(filepaths), "n_entries": n_entries, "branches": {}}
-    if n_entries == 0:
-        return stats
-
-    if n_entries > max_entries_for_stats:
-        rdf = rdf.Range(max_entries_for_stats)
-    stats["n_entries_used_for_stats"] = min(n_entries, max_entries_for_stats)
-
     available = {str(c) for c in rdf.GetColumnNames()}
-    booked = {}
+    booked, errors = {}, {}
     for name in sorted(new_branches):
         if name not in available:
             continue  # already reported as a structural error per-file
         col_type = str(rdf.GetColumnType(name))
         try:
+            node = (rdf.Define(f"vo_s_{name}", f"double({name})")
+                       .Define(f"vo_q_{name}", f"double({name}) * double({name})"))
             booked[name] = {
                 "type": col_type,
+                "sum": node.Sum(f"vo_s_{name}"),
+                "sumsq": node.Sum(f"vo_q_{name}"),
                 "min": rdf.Min(name),
                 "max": rdf.Max(name),
-                "mean": rdf.Mean(name),
-                "std": rdf.StdDev(name),
-            }
-        except Exception as e:
-            stats["branches"][name] = {"type": col_type, "error": f"could not book stats action: {e}"}
-
-    # Lazy: the event loop actually runs on the first GetValue() below, in
-    # one combined pass across every booked action.
-    for name, r in booked.items():
-        try:
-            stats["branches"][name] = {
-                "type": r["type"],
-                "min": r["min"].GetValue(),
-                "max": r["max"].GetValue(),
-                "mean": r["mean"].GetValue(),
-                "std": r["std"].GetValue(),
             }
         except Exception as e:
-            stats["branches"][name] = {"type": r["type"], "error": str(e)}
+            errors[name] = {"type": col_type, "error": f"could not book stats action: {e}"}
+    return booked, errors
 
-    return stats
 
+def book_file_invariants(rdf, branch_names):
+    """Book (lazily) the cross-branch invariant violation counts and the
+    per-object sentinel counts that must ALWAYS come out as described in
+    the module docstring given SelectedObjectsProducer's deterministic
+    algorithm. Any nonzero violation count is a real bug.
 
-def check_invariants(filepaths, branch_names, max_entries_for_stats):
-    """Cross-branch invariants that must ALWAYS hold given
-    SelectedObjectsProducer's deterministic algorithm -- see module
-    docstring. Any nonzero violation count is a real bug.
+    Returns {"violations": {label: handle or error str},
+             "sentinels": {label: handle or error str}}.
     """
-    rdf = ROOT.RDataFrame("Events", filepaths)
-    n_entries = rdf.Count().GetValue()
-    result = {"n_entries_checked": 0, "violations": {}, "sentinel_fraction": {}}
-    if n_entries == 0:
-        return result
-    if n_entries > max_entries_for_stats:
-        rdf = rdf.Range(max_entries_for_stats)
-    n_used = min(n_entries, max_entries_for_stats)
-    result["n_entries_checked"] = n_used
-
     lb, slb = branch_names["leadingbJet"], branch_names["subleadingbJet"]
     lj, slj = branch_names["leadingJet"], branch_names["subleadingJet"]
 
@@ -212,25 +293,170 @@ def check_invariants(filepaths, branch_names, max_entries_for_stats):
         f"{lj}_slot_inconsistent":  f"({_LIGHT_JET_SLOTS_EXPR} >= 1) != ({lj}_pt > -0.5)",
         f"{slj}_slot_inconsistent": f"({_LIGHT_JET_SLOTS_EXPR} >= 2) != ({slj}_pt > -0.5)",
     }
-    for label, expr in checks.items():
-        try:
-            result["violations"][label] = rdf.Filter(expr).Count().GetValue()
-        except Exception as e:
-            result["violations"][label] = f"check failed: {e}"
-
     muon_prefix = branch_names["muon"]
     sentinel_branches = {
         "muon": f"{muon_prefix}_pt",
         "leadingbJet": f"{lb}_pt", "subleadingbJet": f"{slb}_pt",
         "leadingJet": f"{lj}_pt", "subleadingJet": f"{slj}_pt",
     }
+
+    booked = {"violations": {}, "sentinels": {}}
+    for label, expr in checks.items():
+        try:
+            booked["violations"][label] = rdf.Filter(expr).Count()
+        except Exception as e:
+            booked["violations"][label] = f"check failed: {e}"
     for label, branch in sentinel_branches.items():
         try:
-            n_missing = rdf.Filter(f"{branch} < -0.5").Count().GetValue()
-            result["sentinel_fraction"][label] = n_missing / n_used
+            booked["sentinels"][label] = rdf.Filter(f"{branch} < -0.5").Count()
+        except Exception as e:
+            booked["sentinels"][label] = f"check failed: {e}"
+    return booked
+
+
+def collect_file_results(count, booked, booked_invariants, invariants_key):
+    """Read the values of a (run) per-file graph into plain JSON-able
+    partials and invariant counts. Raises if the file's event loop itself
+    failed."""
+    n_entries = count.GetValue()
+    partials = {}
+    for name, r in booked.items():
+        try:
+            partials[name] = {
+                "type": r["type"],
+                "n": n_entries,
+                "sum": r["sum"].GetValue(),
+                "sumsq": r["sumsq"].GetValue(),
+                "min": r["min"].GetValue(),
+                "max": r["max"].GetValue(),
+            }
         except Exception as e:
-            result["sentinel_fraction"][label] = f"check failed: {e}"
+            partials[name] = {"type": r["type"], "error": str(e)}
+
+    invariants = {"key": invariants_key, "violations": {}, "sentinels": {}}
+    for kind in ("violations", "sentinels"):
+        for label, handle in booked_invariants[kind].items():
+            if isinstance(handle, str):
+                invariants[kind][label] = handle
+                continue
+            try:
+                invariants[kind][label] = handle.GetValue()
+            except Exception as e:
+                invariants[kind][label] = f"check failed: {e}"
+    return partials, invariants
+
+
+def compute_file_entries(filepaths, checksums, cache_dir, new_branches_of, branch_names,
+                         invariants_key, batch_size):
+    """Scan and compute partials/invariant counts for every file in `filepaths`.
+
+    Graphs are booked one per file and run batch_size at a time through
+    ROOT.RDF.RunGraphs, which (with ImplicitMT enabled) processes the
+    batch's graphs concurrently -- across datasets, not one dataset after
+    another. Each finished batch is written to the cache straight away, so
+    an interrupted run keeps what it already computed.
+    """
+    entries = {}
+    for start in range(0, len(filepaths), batch_size):
+        batch = filepaths[start:start + batch_size]
+        pending = []
+        for fp in batch:
+            facts = scan_file(fp)
+            entries[fp] = {"version": STATS_CACHE_VERSION, "facts": facts, "partials": {},
+                           "invariants": {"key": invariants_key, "violations": {}, "sentinels": {}}}
+            if "error" not in facts and facts["n_entries"] > 0:
+                rdf = ROOT.RDataFrame("Events", fp)
+                count = rdf.Count()
+                booked, errors = book_file_partials(rdf, new_branches_of[fp])
+                entries[fp]["partials"].update(errors)
+                pending.append((fp, count, booked, book_file_invariants(rdf, branch_names)))
+
+        if pending:
+            try:
+                ROOT.RDF.RunGraphs([count for _, count, _, _ in pending])
+            except Exception as e:
+                # One bad file aborts the whole concurrent run; fall through
+                # so each graph is re-run on its own by GetValue() below and
+                # only the broken file is flagged.
+                print(f"  [WARN]  RunGraphs failed ({e}); re-running this batch's files one by one.")
+        for fp, count, booked, booked_invariants in pending:
+            try:
+                partials, invariants = collect_file_results(count, booked, booked_invariants, invariants_key)
+            except Exception as e:
+                entries[fp]["facts"] = {"error": f"event loop failed: {e}"}
+                continue
+            entries[fp]["partials"].update(partials)
+            entries[fp]["invariants"] = invariants
+
+        for fp in batch:
+            # Errors are not cached: a file that failed to open may just
+            # have hit a transient storage problem, so it is retried next run.
+            if checksums.get(fp) and "error" not in entries[fp]["facts"]:
+                save_cache_entry(cache_dir, checksums[fp], entries[fp])
+        print(f"  Stats computed for {min(start + batch_size, len(filepaths))}/{len(filepaths)} files")
+    return entries
+
+
+def merge_partials(file_partials):
+    """Combine per-file partials into dataset-level min/max/mean/stddev."""
+    merged = {}
+    for partials in file_partials:
+        for name, p in partials.items():
+            m = merged.setdefault(name, {"type": p["type"], "n": 0, "sum": 0.0, "sumsq": 0.0,
+                                         "min": None, "max": None})
+            if "error" in m:
+                continue
+            if "error" in p:
+                m["error"] = p["error"]
+                continue
+            m["n"] += p["n"]
+            m["sum"] += p["sum"]
+            m["sumsq"] += p["sumsq"]
+            if p["n"]:
+                m["min"] = p["min"] if m["min"] is None else min(m["min"], p["min"])
+                m["max"] = p["max"] if m["max"] is None else max(m["max"], p["max"])
+
+    branches = {}
+    for name, m in merged.items():
+        if "error" in m:
+            branches[name] = {"type": m["type"], "error": m["error"]}
+            continue
+        n = m["n"]
+        if n == 0:
+            branches[name] = {"type": m["type"], "n_values": 0}
+            continue
+        mean = m["sum"] / n
+        # Sample (n - 1) variance, matching RDataFrame's StdDev action.
+        var = max(m["sumsq"] - m["sum"] * mean, 0.0) / (n - 1) if n > 1 else 0.0
+        branches[name] = {
+            "type": m["type"],
+            "min": m["min"],
+            "max": m["max"],
+            "mean": mean,
+            "std": math.sqrt(var),
+        }
+    return branches
+
+
+def merge_invariants(file_entries):
+    """Sum per-file violation/sentinel counts into the dataset-level
+    invariants result (violation counts, sentinel fractions)."""
+    n_checked = 0
+    violations, sentinels = {}, {}
+    for entry in file_entries:
+        if "error" in entry["facts"] or entry["facts"]["n_entries"] == 0:
+            continue
+        n_checked += entry["facts"]["n_entries"]
+        for totals, counts in ((violations, entry["invariants"]["violations"]),
+                               (sentinels, entry["invariants"]["sentinels"])):
+            for label, value in counts.items():
+                if isinstance(totals.get(label, 0), str):
+                    continue
+                totals[label] = value if isinstance(value, str) else totals.get(label, 0) + value
 
+    result = {"n_entries_checked": n_checked, "violations": violations, "sentinel_fraction": {}}
+    for label, value in sentinels.items():
+        result["sentinel_fraction"][label] = value if isinstance(value, str) else value / n_checked
     return result
 
 
@@ -244,8 +470,14 @@ def main():
     parser.add_argument("--outputReport", required=True, help="Path to write the JSON verification report.")
     parser.add_argument("--include", help='Regex applied to "DataMC/group/dataset"; only matching triples are checked.')
     parser.add_argument("--exclude", help='Regex applied to "DataMC/group/dataset"; matching triples are skipped.')
-    parser.add_argument("--maxEntriesForStats", type=int, default=500_000,
-                        help="Cap on entries drawn per dataset for stats/invariants. Default: 500000.")
+    parser.add_argument("--statsCache", default=None,
+                        help="Directory of cached per-file stats partials and invariant counts, keyed by file "
+                             "checksum. Default: verifyOutput_stats_cache/ next to --outputReport.")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(),
+                        help="ImplicitMT threads for the concurrent RDataFrame graphs (and checksum threads). "
+                             "Default: all cores.")
+    parser.add_argument("--graphBatchSize", type=int, default=200,
+                        help="Number of per-file RDataFrame graphs run together per ROOT.RDF.RunGraphs call. Default: 200.")
     args = parser.parse_args()
 
     with open(args.config) as f:
@@ -256,6 +488,7 @@ def main():
     if not branch_names:
         print(f"ERROR: config.yaml has no Modules.selectedObjects[{args.era}].branchNames -- nothing to verify against.", file=sys.stderr)
         sys.exit(1)
+    invariants_key = hashlib.sha256(json.dumps(branch_names, sort_keys=True).encode()).hexdigest()[:12]
 
     with open(args.datasetJSON) as f:
         dataset_data = json.load(f)
@@ -263,9 +496,7 @@ def main():
     include_pat = re.compile(args.include) if args.include else None
     exclude_pat = re.compile(args.exclude) if args.exclude else None
 
-    report = {"era": args.era, "datasets": {}}
-    total_files, total_ok, total_errors, total_warnings = 0, 0, 0, 0
-
+    selected = []  # (label, is_data, expected_branches, filepaths)
     for DataMC, groups in dataset_data.items():
         is_data = DataMC.lower().startswith("data")
         expected_branches = expected_new_branches(branch_names, is_mc=not is_data)
@@ -277,50 +508,87 @@ def main():
                 if exclude_pat and exclude_pat.search(label):
                     continue
                 filepaths = list(files.keys()) if isinstance(files, dict) else list(files)
-                if not filepaths:
-                    continue
+                if filepaths:
+                    selected.append((label, is_data, expected_branches, filepaths))
+
+    # Look up every file's cached facts/partials by content checksum; only
+    # the files with no (or an incomplete) cache hit are opened and read.
+    cache_dir = args.statsCache or str(Path(args.outputReport).parent / "verifyOutput_stats_cache")
+    new_branches_of = {}
+    for _, _, expected_branches, filepaths in selected:
+        for fp in filepaths:
+            new_branches_of[fp] = expected_branches
+    all_files = list(new_branches_of)
+    memo = load_checksum_memo(cache_dir)
+    with ThreadPoolExecutor(max_workers=max(1, args.threads)) as pool:
+        checksums = dict(zip(all_files, pool.map(lambda fp: file_checksum(fp, memo), all_files)))
+    entries, to_compute = {}, []
+    for fp in all_files:
+        entry = load_cache_entry(cache_dir, checksums[fp]) if checksums[fp] else None
+        if entry is None or not cache_entry_covers(entry, new_branches_of[fp], invariants_key):
+            to_compute.append(fp)
+        else:
+            entries[fp] = entry
+    print(f"Stats cache {cache_dir}: {len(entries)}/{len(all_files)} files unchanged, "
+          f"reading {len(to_compute)}.")
+    if to_compute:
+        if args.threads > 1:
+            ROOT.EnableImplicitMT(args.threads)
+        entries.update(compute_file_entries(to_compute, checksums, cache_dir, new_branches_of,
+                                            branch_names, invariants_key, args.graphBatchSize))
+    save_checksum_memo(cache_dir, memo)
+    recomputed = set(to_compute)
+
+    report = {"era": args.era, "datasets": {}}
+    total_files, total_ok, total_errors, total_warnings = 0, 0, 0, 0
 
-                print(f"\n=== {label} ({len(filepaths)} files) ===")
-                file_reports = []
-                dataset_ok = True
-                for fp in filepaths:
-                    total_files += 1
-                    ok, info = check_file_structure(fp, expected_branches)
-                    file_reports.append(info)
-                    if ok:
-                        total_ok += 1
-                    else:
-                        dataset_ok = False
-                    total_errors += len(info["errors"])
-                    total_warnings += len(info["warnings"])
-                    for e in info["errors"]:
-                        print(f"  [ERROR] {fp}: {e}")
-                    for w in info["warnings"]:
-                        print(f"  [WARN]  {fp}: {w}")
-                    if not info["errors"] and not info["warnings"]:
-                        print(f"  [OK]    {fp} ({info.get('n_entries', '?')} entries)")
-
-                stats = compute_dataset_stats(filepaths, expected_branches, args.maxEntriesForStats)
-                invariants = check_invariants(filepaths, branch_names, args.maxEntriesForStats)
-
-                bad_invariants = {k: v for k, v in invariants["violations"].items() if isinstance(v, int) and v > 0}
-                if bad_invariants:
-                    dataset_ok = False
-                    total_errors += len(bad_invariants)
-                    for k, v in bad_invariants.items():
-                        print(f"  [ERROR] {label}: invariant '{k}' violated in {v} event(s)")
-                for slabel, frac in invariants["sentinel_fraction"].items():
-                    if isinstance(frac, float) and frac > 0:
-                        total_warnings += 1
-                        print(f"  [WARN]  {label}: {slabel} missing (sentinel) in {frac:.1%} of events")
-
-                report["datasets"][label] = {
-                    "is_data": is_data,
-                    "ok": dataset_ok,
-                    "files": file_reports,
-                    "stats": stats,
-                    "invariants": invariants,
-                }
+    for label, is_data, expected_branches, filepaths in selected:
+        print(f"\n=== {label} ({len(filepaths)} files) ===")
+        file_reports = []
+        dataset_ok = True
+        for fp in filepaths:
+            total_files += 1
+            ok, info = check_file_structure(fp, entries[fp]["facts"], expected_branches)
+            file_reports.append(info)
+            if ok:
+                total_ok += 1
+            else:
+                dataset_ok = False
+            total_errors += len(info["errors"])
+            total_warnings += len(info["warnings"])
+            for e in info["errors"]:
+                print(f"  [ERROR] {fp}: {e}")
+            for w in info["warnings"]:
+                print(f"  [WARN]  {fp}: {w}")
+            if not info["errors"] and not info["warnings"]:
+                print(f"  [OK]    {fp} ({info.get('n_entries', '?')} entries)")
+
+        stats = {
+            "n_files": len(filepaths),
+            "n_files_read": sum(fp in recomputed for fp in filepaths),
+            "n_entries": sum(entries[fp]["facts"].get("n_entries", 0) for fp in filepaths),
+            "branches": merge_partials(entries[fp]["partials"] for fp in filepaths),
+        }
+        invariants = merge_invariants(entries[fp] for fp in filepaths)
+
+        bad_invariants = {k: v for k, v in invariants["violations"].items() if isinstance(v, int) and v > 0}
+        if bad_invariants:
+            dataset_ok = False
+            total_errors += len(bad_invariants)
+            for k, v in bad_invariants.items():
+                print(f"  [ERROR] {label}: invariant '{k}' violated in {v} event(s)")
+        for slabel, frac in invariants["sentinel_fraction"].items():
+            if isinstance(frac, float) and frac > 0:
+                total_warnings += 1
+                print(f"  [WARN]  {label}: {slabel} missing (sentinel) in {frac:.1%} of events")
+
+        report["datasets"][label] = {
+            "is_data": is_data,
+            "ok": dataset_ok,
+            "files": file_reports,
+            "stats": stats,
+            "invariants": invariants,
+        }
 
     report["summary"] = {
         "total_files": total_files,
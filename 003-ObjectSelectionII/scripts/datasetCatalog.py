@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+SQLite-backed dataset catalog shared by the chapters.
+
+Every chapter writes and re-reads nested {DataMC: {group: {dataset: {filepath:
+"Events"}}}} JSON files (preselection_{era}_datasets.json,
+selectionII_{tag}_{era}_datasets.json, ...), and every consumer walks them
+level by level re-applying matches_filter(). The catalog keeps the same
+information as rows in one SQLite file, with indexes on the
+stage/era/DataMC/group/dataset columns, so task lists, --filter and status
+reports are single indexed queries:
+
+  files  -- one row per ROOT file: path, era, DataMC, group, dataset, stage,
+            tag, config hash, entries, size, mtime, checksum, health, plus the
+            dataset JSON it was registered from (source) and its position in
+            that JSON (ord, which keeps the JSON's file order).
+  status -- per (file, stage) processing status (e.g. done / failed / empty),
+            written by the stage's driver after its pool finishes.
+
+generateDatasetJSON.py registers every file it scans (healthy or not), and
+import_dataset_json() registers an existing dataset JSON. The JSON files stay
+the interchange format: export_dataset_json() / export_coffea_fileset()
+rebuild them from the catalog.
+
+The catalog lives at {repo}/datasetCatalog.sqlite unless $DATASET_CATALOG
+points elsewhere. It uses WAL mode and a busy timeout, so the chapters'
+drivers can read it while another process writes.
+
+Usage:
+    python3 datasetCatalog.py import  preselection_UL2017_datasets.json --stage preselection --era UL2017
+    python3 datasetCatalog.py export  --stage selectionI --era UL2017 -o selectionI_UL2017_datasets.json [--coffea]
+    python3 datasetCatalog.py status  --stage selectionI [--filter UL2017/MC_mu]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+CATALOG_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path        TEXT PRIMARY KEY,
+    era         TEXT NOT NULL,
+    data_mc     TEXT NOT NULL,
+    grp         TEXT NOT NULL,
+    dataset     TEXT NOT NULL,
+    stage       TEXT NOT NULL,
+    tag         TEXT,
+    config_hash TEXT,
+    tree        TEXT NOT NULL DEFAULT 'Events',
+    entries     INTEGER,
+    size        INTEGER,
+    mtime_ns    INTEGER,
+    checksum    TEXT,
+    healthy     INTEGER NOT NULL DEFAULT 1,
+    source      TEXT,
+    ord         INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_by_dataset ON files (stage, era, data_mc, grp, dataset);
+CREATE INDEX IF NOT EXISTS files_by_source ON files (source, ord);
+
+CREATE TABLE IF NOT EXISTS status (
+    path       TEXT NOT NULL,
+    stage      TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    output     TEXT,
+    message    TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (path, stage)
+);
+CREATE INDEX IF NOT EXISTS status_by_stage ON status (stage, status);
+
+CREATE TABLE IF NOT EXISTS sources (
+    source   TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size     INTEGER NOT NULL,
+    n_files  INTEGER NOT NULL
+);
+"""
+
+_LEVELS = ("era", "data_mc", "grp", "dataset")
+
+
+def default_catalog_path():
+    return os.environ.get("DATASET_CATALOG",
+                          str(Path(__file__).resolve().parent.parent.parent / "datasetCatalog.sqlite"))
+
+
+def filter_clause(filters):
+    """SQL WHERE fragment + params equivalent to run_all.py's matches_filter().
+
+    Each filter is 'era[/DataMC[/group[/dataset]]]' with '*' as a per-level
+    wildcard; filters are OR-ed and a shorter filter matches everything below.
+    """
+    if not filters:
+        return "1", []
+    ors, params = [], []
+    for f in filters:
+        ands = []
+        for column, part in zip(_LEVELS, f.split('/')):
+            if part != '*':
+                ands.append(f"{column} = ?")
+                params.append(part)
+        ors.append("(" + (" AND ".join(ands) or "1") + ")")
+    return "(" + " OR ".join(ors) + ")", params
+
+
+class Catalog:
+    """Thin wrapper around the catalog's sqlite3 connection."""
+
+    def __init__(self, path=None):
+        self.path = path or default_catalog_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=60)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(_SCHEMA)
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version == 0:
+                self.conn.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+            elif version != CATALOG_VERSION:
+                raise RuntimeError(f"Dataset catalog {self.path} has version {version}, expected {CATALOG_VERSION}")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- registration ----------------------------------------------------------
+
+    def register_files(self, rows, source=None):
+        """Insert/replace file rows (dicts with the `files` column names).
+
+        With a source, rows previously registered from that source but not in
+        `rows` are dropped, so re-registering a regenerated dataset JSON also
+        forgets files that have since disappeared.
+        """
+        columns = ("path", "era", "data_mc", "grp", "dataset", "stage", "tag", "config_hash", "tree",
+                   "entries", "size", "mtime_ns", "checksum", "healthy", "source", "ord")
+        defaults = {"tree": "Events", "healthy": 1, "ord": 0}
+        values = [tuple(row.get(c, defaults.get(c)) if c != "source" else row.get(c, source) for c in columns)
+                  for row in rows]
+        with self.conn:
+            if source is not None:
+                self.conn.execute("DELETE FROM files WHERE source = ?", (source,))
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO files ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                values)
+            if source is not None and os.path.exists(source):
+                st = os.stat(source)
+                self.conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+                                  (source, st.st_mtime_ns, st.st_size, len(values)))
+        return len(values)
+
+    def import_dataset_json(self, json_path, era, stage, tag=None, config_hash=None):
+        """Register a nested dataset JSON; a no-op if it is unchanged since the last import."""
+        json_path = str(json_path)
+        st = os.stat(json_path)
+        known = self.conn.execute("SELECT mtime_ns, size, n_files FROM sources WHERE source = ?",
+                                  (json_path,)).fetchone()
+        # A file path has a single row, so if another source re-registered
+        # some of this JSON's files since, it has to be imported again.
+        n_rows = self.conn.execute("SELECT COUNT(*) FROM files WHERE source = ?", (json_path,)).fetchone()[0]
+        if known is not None and tuple(known) == (st.st_mtime_ns, st.st_size, n_rows):
+            return 0
+        with open(json_path) as f:
+            dataset_json = json.load(f)
+        rows = []
+        for DataMC, groups in dataset_json.items():
+            for group, datasets in groups.items():
+                for dataset, files in datasets.items():
+                    for filepath, tree in files.items():
+                        rows.append({"path": filepath, "era": era, "data_mc": DataMC, "grp": group,
+                                     "dataset": dataset, "stage": stage, "tag": tag, "config_hash": config_hash,
+                                     "tree": tree, "ord": len(rows)})
+        return self.register_files(rows, source=json_path)
+
+    def set_status(self, entries, stage):
+        """Record processing status: entries are (path, status, output, message) tuples."""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO status (path, stage, status, output, message, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(path, stage, status, output, message, now) for path, status, output, message in entries])
+
+    # --- queries ---------------------------------------------------------------
+
+    def files(self, stage=None, era=None, filters=None, source=None, healthy_only=True):
+        """File rows matching the selection, in (era, DataMC, group, dataset, JSON) order."""
+        where, params = filter_clause(filters)
+        for column, value in (("stage", stage), ("era", era), ("source", source)):
+            if value is not None:
+                where += f" AND {column} = ?"
+                params.append(value)
+        if healthy_only:
+            where += " AND healthy = 1"
+        return self.conn.execute(
+            f"SELECT * FROM files WHERE {where} ORDER BY era, data_mc, grp, dataset, source, ord", params
+        ).fetchall()
+
+    def export_dataset_json(self, **selection):
+        """{DataMC: {group: {dataset: {filepath: tree}}}}, as the chapters' dataset JSONs."""
+        out = {}
+        for row in self.files(**selection):
+            out.setdefault(row["data_mc"], {}).setdefault(row["grp"], {}).setdefault(
+                row["dataset"], {})[row["path"]] = row["tree"]
+        return out
+
+    def export_coffea_fileset(self, **selection):
+        """coffea fileset: {dataset: {"files": {filepath: tree}, "metadata": {...}}}."""
+        out = {}
+        for row in self.files(**selection):
+            entry = out.setdefault(row["dataset"], {
+                "files": {},
+                "metadata": {"era": row["era"], "DataMC": row["data_mc"], "group": row["grp"],
+                             "isData": row["data_mc"].lower().startswith("data")},
+            })
+            entry["files"][row["path"]] = row["tree"]
+        return out
+
+    def status_summary(self, stage, input_stage=None, filters=None):
+        """Per-dataset (files, entries, done, failed, other) counts for `stage`,
+        over the files of `input_stage` (default: files of every stage)."""
+        where, params = filter_clause(filters)
+        if input_stage is not None:
+            where += " AND f.stage = ?"
+            params.append(input_stage)
+        return self.conn.execute(
+            f"""SELECT f.era, f.data_mc, f.grp, f.dataset,
+                       COUNT(*) AS n_files, SUM(COALESCE(f.entries, 0)) AS n_entries,
+                       SUM(s.status = 'done') AS n_done, SUM(s.status = 'failed') AS n_failed,
+                       SUM(s.status IS NOT NULL AND s.status NOT IN ('done', 'failed')) AS n_other
+                FROM files f LEFT JOIN status s ON s.path = f.path AND s.stage = ?
+                WHERE {where} AND f.healthy = 1
+                GROUP BY f.era, f.data_mc, f.grp, f.dataset
+                ORDER BY f.era, f.data_mc, f.grp, f.dataset""",
+            [stage] + params).fetchall()
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Query and maintain the SQLite dataset catalog.")
+    parser.add_argument("--catalog", default=None, help=f"Catalog path (default: {default_catalog_path()})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="Register a nested dataset JSON")
+    p_import.add_argument("json", help="Dataset JSON ({DataMC: {group: {dataset: {filepath: tree}}}})")
+    p_import.add_argument("--stage", required=True)
+    p_import.add_argument("--era", required=True)
+    p_import.add_argument("--tag", default=None)
+    p_import.add_argument("--configHash", default=None)
+
+    p_export = sub.add_parser("export", help="Write a dataset JSON (or coffea fileset) from the catalog")
+    p_export.add_argument("--stage", required=True)
+    p_export.add_argument("--era", default=None)
+    p_export.add_argument("--filter", nargs="+", default=None, metavar="FILTER")
+    p_export.add_argument("--coffea", action="store_true", help="Write a coffea fileset instead")
+    p_export.add_argument("-o", "--output", required=True)
+
+    p_status = sub.add_parser("status", help="Per-dataset processing status of a stage")
+    p_status.add_argument("--stage", required=True,
+                          help="Stage whose status to report (files are selected by --inputStage)")
+    p_status.add_argument("--inputStage", default=None, help="Stage of the input files (default: all)")
+    p_status.add_argument("--filter", nargs="+", default=None, metavar="FILTER")
+    args = parser.parse_args()
+
+    with Catalog(args.catalog) as catalog:
+        if args.command == "import":
+            n = catalog.import_dataset_json(os.path.abspath(args.json), args.era, args.stage,
+                                            args.tag, args.configHash)
+            print(f"Registered {n} files from {args.json}" if n else f"{args.json} unchanged since last import")
+        elif args.command == "export":
+            selection = dict(stage=args.stage, era=args.era, filters=args.filter)
+            out = catalog.export_coffea_fileset(**selection) if args.coffea else catalog.export_dataset_json(**selection)
+            with open(args.output, "w") as f:
+                json.dump(out, f, indent=4)
+            print(f"Wrote {args.output}")
+        elif args.command == "status":
+            rows = catalog.status_summary(args.stage, args.inputStage, args.filter)
+            print(f"{'era/DataMC/group/dataset':70s} {'files':>7s} {'entries':>12s} {'done':>7s} {'failed':>7s} {'other':>7s}")
+            for r in rows:
+                label = "/".join((r["era"], r["data_mc"], r["grp"], r["dataset"]))
+                print(f"{label:70s} {r['n_files']:7d} {r['n_entries']:12d} {r['n_done'] or 0:7d} "
+                      f"{r['n_failed'] or 0:7d} {r['n_other'] or 0:7d}")
+
+
+if __name__ == "__main__":
+    _main()
@@ -1,77 +1,132 @@
 # This scripts generates dataset JSON file given a base directory and saves it in the given output directory with given name.
+#
+# Health checks run in a thread pool and read only the ROOT file header and the
+# Events TTree metadata through uproot (no baskets are decompressed), instead of
+# a full PyROOT TFile.Open + GetEntries per file, one file at a time. Results
+# are persisted in a health cache keyed by (path, size, mtime), so re-generating
+# a dataset JSON after a few files were added only checks the new/changed ones.
+# The cache also records each file's Events entry count, which downstream
+# schedulers can read instead of reopening the files.
+#
+# Every scanned file (healthy or not, with its entry count/size/mtime) is also
+# registered in the SQLite dataset catalog (datasetCatalog.py), so downstream
+# task lists, --filter and status reports can query it instead of walking the JSON.
 
 import logging
 import os
 import json
 import argparse
-import ROOT
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def is_root_file_healthy(filepath: str) -> bool:
-    """Check if a ROOT file is healthy using PyROOT, with logging info."""
+import uproot
+
+import datasetCatalog
+
+HEALTH_CACHE_VERSION = 1
+
+
+def is_root_file_healthy(filepath: str) -> int:
+    """Check if a ROOT file is healthy using uproot, with logging info.
+
+    Returns the Events entry count if healthy, or -1 if the file should be
+    rejected.
+    """
     if not os.path.exists(filepath):
         logging.error(f"File does not exist: {filepath}")
-        return False
+        return -1
     if not os.path.isfile(filepath):
         logging.error(f"Path is not a file: {filepath}")
-        return False
+        return -1
     if not os.access(filepath, os.R_OK):
         logging.error(f"File not readable: {filepath}")
-        return False
-    if os.path.getsize(filepath) == 0:
+        return -1
+    size = os.path.getsize(filepath)
+    if size == 0:
         logging.error(f"File is empty: {filepath}")
-        return False
+        return -1
     try:
-        f = ROOT.TFile.Open(filepath)
-    except OSError as e:
+        with uproot.open(filepath) as f:
+            # fEND past the physical end of file means the writer never
+            # finished (crashed/interrupted copy) -- the case PyROOT flags
+            # with TFile::kRecovered when it has to rebuild the key list.
+            if f.file.fEND > size:
+                logging.error(f"ROOT file is truncated, may be corrupted: {filepath}")
+                return -1
+
+            if len(f.keys()) == 0:
+                logging.error(f"ROOT file has no keys: {filepath}")
+                return -1
+
+            # checkif events are > 0
+            if "Events" not in f:
+                logging.error(f"ROOT file has no events: {filepath}")
+                return -1
+            num_entries = f["Events"].num_entries
+    except Exception as e:
         logging.error(f"Failed to open ROOT file {filepath}: {e}")
-        return False
-
-    if not f or f.IsZombie():
-        logging.error(f"ROOT file is not openable or is zombie: {filepath}")
-        if f: f.Close()
-        return False
-
-    if f.TestBit(ROOT.TFile.kRecovered):
-        logging.error(f"ROOT file was recovered, may be corrupted: {filepath}")
-        f.Close()
-        return False
-    
-    # checkif events are > 0
-    tree = f.Get("Events")
-    if not tree or tree.GetEntries() == 0:
+        return -1
+
+    if num_entries == 0:
         logging.error(f"ROOT file has no events: {filepath}")
-        f.Close()
-        return False
+        return -1
+
+    return num_entries
+
+
+def load_health_cache(cache_path):
+    """Load the {path: {size, mtime, entries}} health cache, or {} if missing/stale."""
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"Ignoring unreadable health cache {cache_path}: {e}")
+        return {}
+    if cache.get("version") != HEALTH_CACHE_VERSION:
+        logging.warning(f"Ignoring health cache {cache_path} with unexpected version {cache.get('version')}")
+        return {}
+    return cache.get("files", {})
+
 
+def save_health_cache(cache_path, files):
+    """Write the health cache atomically (tmp file + rename), so an interrupted
+    run never leaves a half-written cache behind."""
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"version": HEALTH_CACHE_VERSION, "files": files}, f, indent=1)
+    os.replace(tmp_path, cache_path)
 
-    if not f.GetListOfKeys() or f.GetNkeys() == 0:
-        logging.error(f"ROOT file has no keys: {filepath}")
-        f.Close()
-        return False
 
-    f.Close()
-    return True
+def file_signature(filepath):
+    """(size, mtime_ns) cache key component, or None if the file can't be stat'ed."""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
 
-def generate_dataset_json(base_dir, output_dir, output_name):
+def generate_dataset_json(base_dir, output_dir, output_name, workers=16, cache_path=None, catalog_info=None):
+    """catalog_info: None, or {"path", "stage", "era", "tag", "config_hash"} to
+    register the scanned files in the dataset catalog."""
+    # Phase 1: walk the tree and collect every candidate file, keeping the
+    # DataMC/group/dataset structure (and the os.walk order) of the output.
     dataset_dict = {}
-    totalEraFiles = 0
-    rejected_totalEraFiles = 0
+    candidates = []  # (DataMC, group, dataset, filePath)
     for DataMC in os.listdir(base_dir):
         DataMCDir = os.path.join(base_dir, DataMC)
         if not os.path.isdir(DataMCDir):
             logging.warning(f"Skipping non-directory: {DataMCDir}")
             continue
         dataset_dict[DataMC] = {}
-        totalDataMCFiles = 0
-        rejected_totalDataMCFiles = 0
         for group in os.listdir(DataMCDir):
             sampleDir = os.path.join(DataMCDir, group)
             if not os.path.isdir(sampleDir):
                 logging.warning(f"Skipping non-directory: {sampleDir}")
                 continue
             dataset_dict[DataMC][group] = {}
-            totalGroupFiles = 0
-            rejected_totalGroupFiles = 0
             for dataset in os.listdir(sampleDir):
                 datasetDir = os.path.join(sampleDir, dataset)
                 if not os.path.isdir(datasetDir):
@@ -79,31 +134,78 @@ def generate_dataset_json(base_dir, output_dir, output_name):
                     continue
                 dataset_dict[DataMC][group][dataset] = {}
                 # loop over all root files in datasetDir and it's subdirectories
-                totalDatasetFiles = 0
-                rejected_totalDatasetFiles = 0
                 for dirpath, _, filenames in os.walk(datasetDir):
                     for file in filenames:
                         if file.endswith('.root'):
-                            filePath = os.path.join(dirpath, file)
-                            if is_root_file_healthy(filePath):
-                                # Append {filePath: "Events"} to dataset_dict[DataMC][group][dataset]
-                                dataset_dict[DataMC][group][dataset][filePath] = "Events"
-                                totalDatasetFiles += 1
-                                totalGroupFiles += 1
-                                totalDataMCFiles += 1
-                                totalEraFiles += 1
-                            else:
-                                logging.warning(f"Skipping unhealthy ROOT file: {filePath}")
-                                rejected_totalDatasetFiles += 1
-                                rejected_totalGroupFiles += 1
-                                rejected_totalDataMCFiles += 1
-                                rejected_totalEraFiles += 1
-                logging.info(f"Total healthy (unhealthy) ROOT files in dataset {dataset}: {totalDatasetFiles} ({rejected_totalDatasetFiles})")
-            logging.info(f"Total healthy (unhealthy) ROOT files in group {group}: {totalGroupFiles} ({rejected_totalGroupFiles})")
-        logging.info(f"Total healthy (unhealthy) ROOT files in Data/MC {DataMC}: {totalDataMCFiles} ({rejected_totalDataMCFiles})")
-    logging.info(f"Total healthy (unhealthy) ROOT files in all eras: {totalEraFiles} ({rejected_totalEraFiles})")
-
-    
+                            candidates.append((DataMC, group, dataset, os.path.join(dirpath, file)))
+
+    # Phase 2: health-check everything not already in the cache with a
+    # matching (size, mtime). uproot header reads are I/O-bound, so a thread
+    # pool is enough -- same reasoning as run_all.py's DAS/CRAB thread pools.
+    cache = load_health_cache(cache_path)
+    new_cache = {}
+    signatures = {}
+    to_check = []
+    for _, _, _, filePath in candidates:
+        sig = file_signature(filePath)
+        signatures[filePath] = sig
+        cached = cache.get(filePath)
+        # Only healthy results are reused: a failed check may be a transient
+        # open error (EOS/xrootd hiccup), so it is retried, and logged, every run.
+        if (sig is not None and cached and (cached["size"], cached["mtime_ns"]) == sig
+                and cached["entries"] > 0):
+            new_cache[filePath] = cached
+        else:
+            to_check.append(filePath)
+    logging.info(f"Health cache: {len(candidates) - len(to_check)} of {len(candidates)} ROOT files unchanged and healthy; "
+                 f"checking {len(to_check)} with {workers} workers")
+
+    if to_check:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(is_root_file_healthy, filePath): filePath for filePath in to_check}
+            for i, future in enumerate(as_completed(futures), start=1):
+                filePath = futures[future]
+                entries = future.result()
+                sig = signatures[filePath]
+                # Files that couldn't even be stat'ed have no cache key -- they
+                # get re-checked next time rather than cached as unhealthy.
+                if sig is not None:
+                    new_cache[filePath] = {"size": sig[0], "mtime_ns": sig[1], "entries": entries}
+                if i % 500 == 0 or i == len(to_check):
+                    logging.info(f"Health check progress: {i}/{len(to_check)}")
+
+    # Rewriting the cache from this scan's files only also drops entries for
+    # files that have since been deleted from base_dir.
+    if cache_path:
+        save_health_cache(cache_path, new_cache)
+
+    # Phase 3: assemble the dataset JSON and the per-level summaries.
+    totals = {}
+    for DataMC, group, dataset, filePath in candidates:
+        entry = new_cache.get(filePath)
+        healthy = entry is not None and entry["entries"] > 0
+        if healthy:
+            # Append {filePath: "Events"} to dataset_dict[DataMC][group][dataset]
+            dataset_dict[DataMC][group][dataset][filePath] = "Events"
+        else:
+            logging.warning(f"Skipping unhealthy ROOT file: {filePath}")
+        for key in ((DataMC, group, dataset), (DataMC, group), (DataMC,), ()):
+            counts = totals.setdefault(key, [0, 0])
+            counts[0 if healthy else 1] += 1
+
+    for DataMC in dataset_dict:
+        for group in dataset_dict[DataMC]:
+            for dataset in dataset_dict[DataMC][group]:
+                good, bad = totals.get((DataMC, group, dataset), (0, 0))
+                logging.info(f"Total healthy (unhealthy) ROOT files in dataset {dataset}: {good} ({bad})")
+            good, bad = totals.get((DataMC, group), (0, 0))
+            logging.info(f"Total healthy (unhealthy) ROOT files in group {group}: {good} ({bad})")
+        good, bad = totals.get((DataMC,), (0, 0))
+        logging.info(f"Total healthy (unhealthy) ROOT files in Data/MC {DataMC}: {good} ({bad})")
+    good, bad = totals.get((), (0, 0))
+    logging.info(f"Total healthy (unhealthy) ROOT files in all eras: {good} ({bad})")
+
+
     output_path = os.path.join(output_dir, output_name)
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
@@ -111,14 +213,67 @@ def generate_dataset_json(base_dir, output_dir, output_name):
         json.dump(dataset_dict, json_file, indent=4)
     print(f"Dataset JSON file generated at: {output_path}")
 
+    if catalog_info is not None:
+        rows = []
+        for DataMC, group, dataset, filePath in candidates:
+            entry = new_cache.get(filePath) or {}
+            rows.append({
+                "path": filePath, "era": catalog_info["era"], "data_mc": DataMC, "grp": group,
+                "dataset": dataset, "stage": catalog_info["stage"], "tag": catalog_info.get("tag"),
+                "config_hash": catalog_info.get("config_hash"),
+                "entries": entry["entries"] if entry.get("entries", -1) >= 0 else None,
+                "size": entry.get("size"), "mtime_ns": entry.get("mtime_ns"),
+                "healthy": int(entry.get("entries", -1) > 0), "ord": len(rows),
+            })
+        try:
+            with datasetCatalog.Catalog(catalog_info["path"]) as catalog:
+                catalog.register_files(rows, source=os.path.abspath(output_path))
+            logging.info(f"Registered {len(rows)} files in dataset catalog {catalog_info['path']} "
+                         f"(stage={catalog_info['stage']}, era={catalog_info['era']})")
+        except Exception as e:
+            # The JSON above is still the source of truth; a locked or
+            # unwritable catalog must not fail the step.
+            logging.warning(f"Could not register files in dataset catalog {catalog_info['path']}: {e}")
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate dataset JSON file from a base directory.")
     parser.add_argument("--outputDirectory", required=True, help="Output directory for JSON files")
     parser.add_argument("--outputFileName", required=True, help="Output file name for the JSON file")
     parser.add_argument("--baseDirectory", required=True, help="Base directory for the datasets")
+    parser.add_argument("--workers", type=int, default=16,
+                        help="Number of parallel health-check threads (default: 16)")
+    parser.add_argument("--healthCache", default=None,
+                        help="Health cache JSON keyed by (path, size, mtime), also recording each file's "
+                             "Events entry count. Default: {outputDirectory}/{outputFileName stem}_health_cache.json")
+    parser.add_argument("--noHealthCache", action="store_true",
+                        help="Re-check every file and do not read or write the health cache")
+    parser.add_argument("--catalog", default=None,
+                        help=f"SQLite dataset catalog to register the files in (default: {datasetCatalog.default_catalog_path()})")
+    parser.add_argument("--noCatalog", action="store_true", help="Do not register the files in the dataset catalog")
+    parser.add_argument("--stage", default=None,
+                        help="Catalog stage name (default: outputFileName up to the first '_', e.g. selectionI)")
+    parser.add_argument("--era", default=None, help="Catalog era (default: last component of baseDirectory)")
+    parser.add_argument("--tag", default=None, help="Catalog tag")
+    parser.add_argument("--configHash", default=None, help="Catalog config hash")
     args = parser.parse_args()
 
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-    
-    generate_dataset_json(args.baseDirectory, args.outputDirectory, args.outputFileName)
\ No newline at end of file
+
+    cache_path = None
+    if not args.noHealthCache:
+        cache_path = args.healthCache or os.path.join(
+            args.outputDirectory, f"{os.path.splitext(args.outputFileName)[0]}_health_cache.json")
+
+    catalog_info = None
+    if not args.noCatalog:
+        catalog_info = {
+            "path": args.catalog or datasetCatalog.default_catalog_path(),
+            "stage": args.stage or args.outputFileName.split("_")[0],
+            "era": args.era or os.path.basename(os.path.normpath(args.baseDirectory)),
+            "tag": args.tag,
+            "config_hash": args.configHash,
+        }
+
+    generate_dataset_json(args.baseDirectory, args.outputDirectory, args.outputFileName,
+                          workers=args.workers, cache_path=cache_path, catalog_info=catalog_info)
@@ -116,7 +116,7 @@ def main():
     parser.add_argument('--sample', action='store_true',
                        help='Only add the first file of each dataset to the process list JSON (for testing purposes)')
     parser.add_argument('--workers', type=int, default=15,
-                       help='Number of parallel workers passed to runSelection.py (default: 15)')
+                       help='Number of parallel workers passed to runSelection.py and generateDatasetJSON.py (default: 15)')
     args = parser.parse_args()
 
     # parsing arguments
@@ -672,7 +672,10 @@ def main():
                 sys.executable, str(generate_dataset_json_script),
                 '--outputDirectory', str(outputDirectory),
                 '--outputFileName', outputFileName,
-                '--baseDirectory', baseDirectory
+                '--baseDirectory', baseDirectory,
+                '--workers', str(args.workers),
+                '--tag', args.tag,
+                '--configHash', config_hash,
             ]
             print(f"Running command: {' '.join(cmd)}")
             result = subprocess.run(cmd, capture_output=True, text=True)
@@ -131,7 +131,7 @@ def main():
     parser.add_argument('--sample', action='store_true',
                        help='Only add the first file of each dataset to the process list JSON (for testing)')
     parser.add_argument('--workers', type=int, default=15,
-                       help='Number of parallel workers passed to runReco.py (default: 15)')
+                       help='Number of parallel workers passed to runReco.py and generateDatasetJSON.py (default: 15)')
     args = parser.parse_args()
 
     print("Arguments:")
@@ -337,7 +337,8 @@ def main():
                         f"python3 {base_dir / 'scripts' / 'generateDatasetJSON.py'} "
                         f"--outputDirectory {era_output_dir} "
                         f"--outputFileName {dataset_json.name} "
-                        f"--baseDirectory {reconstruction_base}\n"
+                        f"--baseDirectory {reconstruction_base} "
+                        f"--workers {args.workers}\n"
                     )
                     f.write(
                         f"python3 {base_dir / 'scripts' / 'deltaMassPlots.py'} "
@@ -511,6 +512,9 @@ def main():
                 '--outputDirectory', str(outputDirectory),
                 '--outputFileName',  outputFileName,
                 '--baseDirectory',   baseDirectory,
+                '--workers',         str(args.workers),
+                '--tag',             args.tag,
+                '--configHash',      config_hash,
             ]
             print(f"Running command: {' '.join(cmd)}")
             result = subprocess.run(cmd, capture_output=True, text=True)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Precompiled golden-JSON lumi mask, applied per file before PostProcessor.
+
+PostProcessor's jsonInput filtering builds a run cut string, draws a
+TEntryList and then walks it entry by entry in Python, once per file, inside
+every worker process. Here the golden JSON is instead compiled once into an
+index -- a sorted run array plus per-run [first, last] lumi interval arrays
+(CSR layout: runs, offsets, firsts, lasts) -- and cached as a .npz next to the
+JSON (e.g. SFs/GoldenJSON/<cert>.lumimask.npz, or
+inputs/{era}_goldenJSON.lumimask.npz), rebuilt only when the JSON is newer.
+
+For each Data file, only the run/luminosityBlock columns are read (uproot)
+and the passing entries are found with one vectorized searchsorted. That
+lets the drivers:
+  - skip files with no certified lumis outright (no PostProcessor, no
+    module setup, no event loop),
+  - drop jsonInput entirely for files that are fully certified (the common
+    case once 002-Samples' CRAB preselection already applied the mask),
+  - otherwise hand PostProcessor a jsonInput restricted to the file's own
+    runs, so its run cut string and entry-list walk stay small.
+
+Usage (prebuild the indexes, e.g. for every golden JSON shipped in the repo):
+    python3 lumiMask.py ../../SFs/GoldenJSON/*.txt
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+_LUMI_BITS = np.uint64(32)
+
+
+def index_path(golden_json_path):
+    return os.path.splitext(golden_json_path)[0] + ".lumimask.npz"
+
+
+class LumiMask:
+    """Sorted-run / per-run-interval index of one golden JSON."""
+
+    def __init__(self, runs, offsets, firsts, lasts):
+        self.runs = runs          # (R,) sorted run numbers
+        self.offsets = offsets    # (R+1,) interval slice of each run
+        self.firsts = firsts      # (N,) first lumi of each interval
+        self.lasts = lasts        # (N,) last lumi of each interval
+        # Runs are sorted and each run's intervals are sorted and disjoint, so
+        # (run, first) keys are globally sorted: one searchsorted over them
+        # finds the candidate interval of every event at once.
+        interval_runs = np.repeat(runs, np.diff(offsets)).astype(np.uint64)
+        self._start_keys = (interval_runs << _LUMI_BITS) | firsts.astype(np.uint64)
+        self._end_keys = (interval_runs << _LUMI_BITS) | lasts.astype(np.uint64)
+
+    @classmethod
+    def from_json(cls, golden_json_path):
+        with open(golden_json_path) as f:
+            golden = json.load(f)
+        runs = np.array(sorted(int(r) for r in golden), dtype=np.int64)
+        offsets = np.zeros(len(runs) + 1, dtype=np.int64)
+        firsts, lasts = [], []
+        for i, run in enumerate(runs):
+            ranges = sorted(golden[str(run)])
+            firsts.extend(first for first, _ in ranges)
+            lasts.extend(last for _, last in ranges)
+            offsets[i + 1] = offsets[i] + len(ranges)
+        return cls(runs, offsets, np.array(firsts, dtype=np.int64), np.array(lasts, dtype=np.int64))
+
+    @classmethod
+    def load(cls, golden_json_path):
+        """Load the cached index, (re)building it if missing or older than the JSON."""
+        npz_path = index_path(golden_json_path)
+        if os.path.exists(npz_path) and os.path.getmtime(npz_path) >= os.path.getmtime(golden_json_path):
+            with np.load(npz_path) as z:
+                return cls(z["runs"], z["offsets"], z["firsts"], z["lasts"])
+        mask = cls.from_json(golden_json_path)
+        mask.save(npz_path)
+        return mask
+
+    def save(self, npz_path):
+        # Several worker processes may build the same index at once: write to
+        # a per-process temp file and rename, so readers never see a partial one.
+        tmp_path = f"{npz_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, runs=self.runs, offsets=self.offsets, firsts=self.firsts, lasts=self.lasts)
+        os.replace(tmp_path, npz_path)
+
+    def passes(self, runs, lumis):
+        """Boolean mask of the (run, luminosityBlock) pairs that are certified."""
+        keys = (np.asarray(runs, dtype=np.uint64) << _LUMI_BITS) | np.asarray(lumis, dtype=np.uint64)
+        idx = np.searchsorted(self._start_keys, keys, side="right") - 1
+        safe = np.clip(idx, 0, None)
+        return (idx >= 0) & (keys <= self._end_keys[safe])
+
+    def restricted_to(self, runs):
+        """Golden-JSON-style {run: [[first, last], ...]} dict for just `runs`."""
+        out = {}
+        for run in np.unique(runs):
+            i = np.searchsorted(self.runs, run)
+            if i < len(self.runs) and self.runs[i] == run:
+                lo, hi = self.offsets[i], self.offsets[i + 1]
+                out[str(int(run))] = [[int(a), int(b)] for a, b in zip(self.firsts[lo:hi], self.lasts[lo:hi])]
+        return out
+
+
+def file_entry_list(filepath, mask, tree_name="Events"):
+    """(passing entry numbers, file runs, total entries) for one file."""
+    import uproot
+    with uproot.open(filepath) as f:
+        arrays = f[tree_name].arrays(["run", "luminosityBlock"], library="np")
+    passing = np.flatnonzero(mask.passes(arrays["run"], arrays["luminosityBlock"]))
+    return passing, arrays["run"], len(arrays["run"])
+
+
+def json_input_for_file(filepath, golden_json_path, tree_name="Events"):
+    """Evaluate the golden JSON on one file ahead of PostProcessor.
+
+    Returns (n_pass, n_total, json_input): json_input is None when every
+    entry is certified (no JSON filtering needed), otherwise the golden JSON
+    restricted to the file's runs. n_pass == 0 means the file can be skipped.
+    """
+    mask = LumiMask.load(golden_json_path)
+    passing, runs, n_total = file_entry_list(filepath, mask, tree_name)
+    if len(passing) == n_total:
+        return n_total, n_total, None
+    return len(passing), n_total, mask.restricted_to(runs[passing])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prebuild .lumimask.npz indexes for golden JSON files.")
+    parser.add_argument("goldenJSONs", nargs="+", help="Golden JSON files to index")
+    args = parser.parse_args()
+    for path in args.goldenJSONs:
+        mask = LumiMask.from_json(path)
+        mask.save(index_path(path))
+        print(f"{path}: {len(mask.runs)} runs, {len(mask.firsts)} lumi ranges -> {index_path(path)}")
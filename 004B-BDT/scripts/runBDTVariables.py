@@ -16,7 +16,7 @@ Options:
     --sample: Process only first file of each dataset (isSample=True)
 """
 
-import os, json, argparse, logging, sys, traceback
+import os, json, argparse, logging, shutil, sys, tempfile, traceback
 
 # ---------------------------------------------------------------------------
 # Limit background thread pools BEFORE any library imports.
@@ -43,6 +43,8 @@ from PhysicsTools.NanoAODTools.postprocessing.framework.postprocessor import Pos
 from multiprocessing import Pool
 from tqdm import tqdm
 from modules.BDTvariableModule import BDTvariableModule
+import lumiMask
+import readSetProfiler
 
 
 def matches_filter(filters, era, data_mc=None, group=None, dataset=None):
@@ -104,10 +106,33 @@ def process_file(data):
     cut_string     = data.get("cut_string", None)
     goldenJSON     = data.get("goldenJSON", None)
     branchsel      = data.get("branchsel", None)
+    outputbranchsel = data.get("outputbranchsel", None)
     module_configs = data.get("modules", [])
+    # --profileReadSet: run the modules on the first maxEntries entries into a
+    # scratch directory and return the branches they read (readSetProfiler.py)
+    profile = data.get("profile", None)
+    if profile is not None:
+        outputDir = tempfile.mkdtemp(prefix="readSet_")
 
     os.makedirs(outputDir, exist_ok=True)
 
+    # Golden-JSON lumi mask, evaluated vectorized on just run/luminosityBlock
+    # before PostProcessor (see lumiMask.py): files with no certified lumis
+    # are skipped outright, fully-certified files need no JSON filtering at
+    # all, and the rest get a jsonInput restricted to their own runs.
+    if goldenJSON is not None:
+        try:
+            _n_pass, _n_total, goldenJSON = lumiMask.json_input_for_file(file, goldenJSON)
+            if _n_pass == 0:
+                logging.info(
+                    f"    No certified lumis in {file} "
+                    f"(dataset={key}, {DataMC}, {era}); skipping."
+                )
+                return False
+        except Exception as _e:
+            logging.warning(f"    Lumi-mask pre-check failed for {file}: {_e}; "
+                            f"leaving golden JSON filtering to PostProcessor.")
+
     # Guard against 0-event files (only relevant when a cut_string is given).
     if cut_string is not None:
         try:
@@ -144,6 +169,14 @@ def process_file(data):
         return None
     modules = [m for _, m in modules_with_names]
 
+    recorder = None
+    if profile is not None:
+        recorder = readSetProfiler.ReadSetRecorder()
+        for mod_name, module in modules_with_names:
+            recorder.wrap(mod_name, module)
+    if data.get("cacheBranches"):
+        modules = [readSetProfiler.TTreeCacheModule(data["cacheBranches"])] + modules
+
     try:
         post_processor = PostProcessor(
             outputDir,
@@ -151,12 +184,20 @@ def process_file(data):
             cut=cut_string,
             jsonInput=goldenJSON,
             branchsel=branchsel,
+            outputbranchsel=outputbranchsel,
             modules=modules,
             noOut=False,
             justcount=False,
+            maxEntries=profile["maxEntries"] if profile is not None else None,
             compression="ZLIB:9",
         )
         post_processor.run()
+        if recorder is not None:
+            shutil.rmtree(outputDir, ignore_errors=True)
+            logging.info(f"Profiled branch reads of {file} in {key} of {DataMC}")
+            # The golden JSON as configured: json_input_for_file() drops it for
+            # fully certified files, but other files of the sample still read run/lumi.
+            return recorder.result(file, cut_string, data.get("goldenJSON"), module_configs)
         logging.info(f"Finished processing {file} in {key} of {DataMC}")
         return True
     except Exception as e:
@@ -188,7 +229,35 @@ if __name__ == "__main__":
                        help='Process all files even if output already exists.')
     parser.add_argument('--sample', action='store_true',
                        help='Process only the first file of each dataset (isSample=True).')
+    parser.add_argument('--profileReadSet', default=None, metavar='DIR',
+                       help='Profile mode: run the modules on --profileFiles files of each dataset for '
+                            '--profileEntries entries into a scratch directory, record every branch each module '
+                            'reads, and write bdtVariables_readset.json, bdtVariables_keep_and_drop_input.txt (for '
+                            '--branchsel) and bdtVariables_ttreecache.txt (for --cacheBranches) to DIR. '
+                            'No outputs are written.')
+    parser.add_argument('--profileEntries', type=int, default=20000,
+                       help='Entries per file in --profileReadSet mode (default: 20000)')
+    parser.add_argument('--profileFiles', type=int, default=3,
+                       help='Files per dataset in --profileReadSet mode, spread evenly over its file list '
+                            'from first to last (default: 3)')
+    parser.add_argument('--branchsel', default=None, metavar='FILE',
+                       help="Input keep/drop file (PostProcessor branchsel, nano_postproc.py --bi) overriding the "
+                            "process list's. Branches it drops are neither read nor copied to the output.")
+    parser.add_argument('--outputBranchsel', default=None, metavar='FILE',
+                       help='Output keep/drop file (PostProcessor outputbranchsel, nano_postproc.py --bo), '
+                            'e.g. bdtVariables_keep_and_drop_output.txt from ../../scripts/slimBranches.py')
+    parser.add_argument('--cacheBranches', default=None, metavar='FILE',
+                       help='Branch list (one per line) to prefill the input TTreeCache with, '
+                            'e.g. bdtVariables_ttreecache.txt from --profileReadSet')
     args = parser.parse_args()
+    # Absolute before any chdir; loaded once here rather than in every worker.
+    if args.profileReadSet:
+        args.profileReadSet = os.path.abspath(args.profileReadSet)
+    if args.branchsel:
+        args.branchsel = os.path.abspath(args.branchsel)
+    if args.outputBranchsel:
+        args.outputBranchsel = os.path.abspath(args.outputBranchsel)
+    cache_branches = readSetProfiler.load_branch_list(args.cacheBranches) if args.cacheBranches else None
 
     try:
         with open(args.processListJSON, 'r') as f:
@@ -215,18 +284,39 @@ if __name__ == "__main__":
         if args.sample and not data.get("isSample", False):
             pre_skipped += 1
             continue
-        if not args.force:
+        if not args.force and not args.profileReadSet:
             output_name = os.path.basename(data["file"]).replace(".root", "_BDTVars.root")
             output_path = os.path.join(data["outputDir"], output_name)
             if os.path.exists(output_path):
                 pre_skipped += 1
                 continue
+        if args.profileReadSet:
+            data = dict(data, profile={"maxEntries": args.profileEntries})
+        if args.branchsel:
+            data = dict(data, branchsel=args.branchsel)
+        if args.outputBranchsel:
+            data = dict(data, outputbranchsel=args.outputBranchsel)
+        if cache_branches:
+            data = dict(data, cacheBranches=cache_branches)
         tasks_to_run.append(data)
+    if args.profileReadSet:
+        n_tasks = len(tasks_to_run)
+        tasks_to_run = readSetProfiler.sample_tasks(tasks_to_run, args.profileFiles)
+        pre_skipped += n_tasks - len(tasks_to_run)
 
     logging.info(f"Pre-filtering: {len(tasks_to_run)} tasks to run, {pre_skipped} already done / filtered out.")
     if len(tasks_to_run) == 0:
         logging.info("Nothing to do. Exiting.")
         sys.exit(0)
+
+    # Build (or refresh) each golden JSON's lumi-mask index once here, rather
+    # than having every spawned worker race to build it on its first Data file.
+    for _golden in sorted({d["goldenJSON"] for d in tasks_to_run if d.get("goldenJSON")}):
+        try:
+            lumiMask.LumiMask.load(_golden)
+        except Exception as _e:
+            logging.warning(f"Could not build lumi-mask index for {_golden}: {_e}")
+
     logging.info("Starting parallel processing of datasets...")
 
     num_cores = args.workers
@@ -237,6 +327,16 @@ if __name__ == "__main__":
                             total=len(tasks_to_run),
                             desc="Processing datasets"))
 
+    if args.profileReadSet:
+        profiled = [r for r in results if isinstance(r, dict)]
+        report = readSetProfiler.write_outputs(args.profileReadSet, "bdtVariables", profiled)
+        logging.info(f"Read set of {len(profiled)} profiled file(s): {report['n_read']} of "
+                     f"{report['n_available']} input branches. Written to {args.profileReadSet}")
+        if report["named_not_read"]:
+            logging.warning(f"Kept {len(report['named_not_read'])} branch(es) named in the module configs that no "
+                            f"profiled event read: {', '.join(report['named_not_read'])}")
+        sys.exit(0 if profiled else 1)
+
     succeeded = sum(1 for r in results if r is True)
     zero_ev   = sum(1 for r in results if r is False)
     failed    = sum(1 for r in results if r is None)
@@ -96,7 +96,7 @@ def main():
     parser.add_argument('--sample', action='store_true',
                        help='Only add the first file of each dataset to the process list JSON (for testing)')
     parser.add_argument('--workers', type=int, default=15,
-                       help='Number of parallel workers passed to runBDTVariables.py (default: 15)')
+                       help='Number of parallel workers passed to runBDTVariables.py and generateDatasetJSON.py (default: 15)')
     parser.add_argument('--buildBDTVariableHists', action='store_true',
                        help='Run buildBDTVariableHists.py to create histograms for BDT variables')
     parser.add_argument('--aggregateBDTVariableHists', action='store_true',
@@ -463,6 +463,9 @@ def main():
                 '--outputDirectory', str(outputDirectory),
                 '--outputFileName',  outputFileName,
                 '--baseDirectory',   baseDirectory,
+                '--workers',         str(args.workers),
+                '--tag',             args.tag,
+                '--configHash',      config_hash,
             ]
             print(f"Running command: {' '.join(cmd)}")
             result = subprocess.run(cmd, capture_output=True, text=True)
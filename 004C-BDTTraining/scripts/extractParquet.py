@@ -6,7 +6,9 @@ Reads the BDTVariables ROOT files for one dataset (as listed in a pre-built
 process list JSON), pulls out the configured BDT feature branches plus the
 `y` target branch via uproot, and streams them out to numbered parquet part
 files -- one dataset can produce several `_part{N}.parquet` files if it has
-more events than fit in a single chunk.
+more than maxEvents events. With a partitionBy column in the task (the `y`
+target), parts go to hive-style `y={value}/` subdirectories. Memory per
+worker is bounded by --memoryBudgetMB, not by the size of a file or part.
 
 Usage:
     python scripts/extractParquet.py --processListJSON <json_file> [--workers N] [--force] [--filter ...]
@@ -17,6 +19,8 @@ Options:
     --filter: Filter by era[/DataMC[/group[/dataset]]], use * as wildcard
     --force: Reprocess a dataset even if parquet output already exists
     --sample: Process only the first file of each dataset (isSample=True)
+    --memoryBudgetMB: Per-worker memory budget in MB (default: 1024)
+    --readAhead: Chunks decompressed ahead of the parquet writer (default: 2)
 """
 
 import os
@@ -37,10 +41,14 @@ import argparse
 import glob
 import json
 import logging
+import queue
 import sys
+import threading
 import traceback
 
-import awkward as ak
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import uproot
 from tqdm import tqdm
 
@@ -63,15 +71,94 @@ def matches_filter(filters, era, data_mc=None, group=None, dataset=None):
     return False
 
 
+_DONE = object()  # end-of-stream marker on the read-ahead queue
+
+
+def _read_chunks(files, columns, step_size, chunks, stop):
+    """Reader thread: put {column: numpy array} chunks of `files` on the bounded `chunks` queue."""
+    try:
+        for f in files:
+            with uproot.open(f) as root_file:
+                tree = root_file["Events"]
+                if tree.num_entries == 0:
+                    continue
+                for chunk in tree.iterate(columns, step_size=step_size, library="np"):
+                    if stop.is_set():
+                        return
+                    chunks.put(chunk)
+        chunks.put(_DONE)
+    except BaseException as e:
+        chunks.put(e)
+
+
+class _PartWriter:
+    """Appends row groups to {dataset}_part{N}.parquet files of at most maxEvents rows in `outputDir`.
+
+    Each part is written as {name}.tmp and renamed when complete, so an
+    interrupted run never leaves a part the --force-less skip check would
+    take as done.
+    """
+
+    def __init__(self, outputDir, dataset, maxEvents):
+        self.outputDir, self.dataset, self.maxEvents = outputDir, dataset, maxEvents
+        self.n_parts, self.rows, self.writer, self.path = 0, 0, None, None
+
+    def write(self, table):
+        while table.num_rows:
+            if self.writer is None:
+                os.makedirs(self.outputDir, exist_ok=True)
+                self.path = os.path.join(self.outputDir, f"{self.dataset}_part{self.n_parts}.parquet")
+                self.writer = pq.ParquetWriter(f"{self.path}.tmp", table.schema, compression="zstd")
+            take = min(table.num_rows, self.maxEvents - self.rows)
+            self.writer.write_table(table.slice(0, take), row_group_size=take)
+            self.rows += take
+            table = table.slice(take)
+            if self.rows >= self.maxEvents:
+                self.close()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(f"{self.path}.tmp", self.path)
+            self.n_parts += 1
+            self.rows, self.writer = 0, None
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.remove(f"{self.path}.tmp")
+            self.writer = None
+
+
+def split_by_partition(table, key):
+    """Sort `table` by column `key` and return {value: slice} for each value present."""
+    values = table.column(key).to_numpy()
+    order = np.argsort(values, kind="stable")
+    table, values = table.take(order), values[order]
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(values)) + 1, [len(values)]])
+    return {values[a].item(): table.slice(a, b - a) for a, b in zip(starts[:-1], starts[1:])}
+
+
 def process_dataset(data):
     """Extract one dataset's BDT feature/target branches to parquet part files.
 
-    Reads each source ROOT file in full and accumulates chunks across files,
-    flushing to a numbered `_part{N}.parquet` once the accumulated row count
-    would reach `maxEvents` -- unlike `uproot.iterate`'s `step_size`, this
-    carries a file's remainder forward into the next file's chunk instead of
-    resetting at every file boundary, so a dataset made of many small files
-    doesn't get fragmented into one tiny part per file.
+    Streams each source ROOT file in byte-sized steps (`uproot` `step_size`)
+    from a read-ahead thread, which decompresses the next chunks while the
+    main thread encodes the current one, through a bounded queue. Chunks are
+    appended as row groups to a `pyarrow.parquet.ParquetWriter` -- chunks
+    smaller than a step (file remainders, small files) are first batched up
+    to one step's rows -- and a new `_part{N}.parquet` is started every
+    `maxEvents` rows, carrying a file's remainder forward into the same part
+    so a dataset made of many small files isn't fragmented into one tiny
+    part per file. Peak memory is about (readAhead + 2) steps, whatever the
+    dataset size.
+
+    With `partitionBy` set (run_all.py sets it to the TargetBranch, `y`),
+    rows are sorted by that column and written to hive-style
+    `{partitionBy}={value}/` subdirectories of outputDir, each with its own
+    part numbering, so every file and row group holds a single `y` value and
+    a reader filtering on `y` skips the other directories without opening
+    them (see trainBDT.read_parquet_files).
 
     Args:
         data: Dictionary containing:
@@ -79,57 +166,82 @@ def process_dataset(data):
             - files: list of source *_BDTVars.root file paths
             - outputDir: where to write {dataset}_part{N}.parquet
             - columns: branch names to read (BDT features + target branch)
-            - maxEvents: rows accumulated per output part file
+            - maxEvents: rows per output part file
+            - partitionBy (optional): integer column to partition the output by
+            - memoryBudgetMB (optional): per-worker memory budget (default 1024)
+            - readAhead (optional): chunks decompressed ahead (default 2)
 
     Returns:
         Number of output part files written (0 if the dataset had no events),
         or None if an error occurred.
     """
-    era        = data["era"]
-    DataMC     = data["DataMC"]
-    group      = data.get("group", None)
-    dataset    = data["dataset"]
-    files      = data["files"]
-    outputDir  = data["outputDir"]
-    columns    = data["columns"]
-    maxEvents  = data["maxEvents"]
+    era         = data["era"]
+    DataMC      = data["DataMC"]
+    group       = data.get("group", None)
+    dataset     = data["dataset"]
+    files       = data["files"]
+    outputDir   = data["outputDir"]
+    columns     = data["columns"]
+    maxEvents   = data["maxEvents"]
+    partitionBy = data.get("partitionBy")
+    readAhead   = max(1, data.get("readAhead", 2))
+    step_bytes  = data.get("memoryBudgetMB", 1024) * 1024 * 1024 // (readAhead + 2)
 
     os.makedirs(outputDir, exist_ok=True)
 
-    n_parts = 0
-    pending = []
-    pending_rows = 0
-
-    def flush():
-        nonlocal n_parts, pending, pending_rows
-        if pending_rows == 0:
-            return
-        chunk = ak.concatenate(pending) if len(pending) > 1 else pending[0]
-        out_path = os.path.join(outputDir, f"{dataset}_part{n_parts}.parquet")
-        ak.to_parquet(chunk, out_path)
-        n_parts += 1
-        pending = []
-        pending_rows = 0
+    chunks = queue.Queue(maxsize=readAhead)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_chunks, args=(files, columns, step_bytes, chunks, stop), daemon=True)
+    writers = {}  # partition value (None if unpartitioned) -> _PartWriter
+    pending, pending_bytes = {}, 0
+
+    def flush_pending():
+        nonlocal pending, pending_bytes
+        for value, tables in sorted(pending.items()):
+            if value not in writers:
+                subdir = outputDir if value is None else os.path.join(outputDir, f"{partitionBy}={value}")
+                writers[value] = _PartWriter(subdir, dataset, maxEvents)
+            writers[value].write(pa.concat_tables(tables) if len(tables) > 1 else tables[0])
+        pending, pending_bytes = {}, 0
 
     try:
-        for f in files:
-            tree = uproot.open(f)["Events"]
-            if tree.num_entries == 0:
-                continue
-            pending.append(tree.arrays(columns, library="ak"))
-            pending_rows += tree.num_entries
-            if pending_rows >= maxEvents:
-                flush()
-        flush()
+        reader.start()
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                break
+            if isinstance(chunk, BaseException):
+                raise chunk
+            table = pa.table({c: chunk[c] for c in columns})
+            parts = split_by_partition(table, partitionBy) if partitionBy else {None: table}
+            for value, part in parts.items():
+                pending.setdefault(value, []).append(part)
+            pending_bytes += table.nbytes
+            if pending_bytes >= step_bytes:
+                flush_pending()
+        flush_pending()
+        for writer in writers.values():
+            writer.close()
+        n_parts = sum(writer.n_parts for writer in writers.values())
         logging.info(
             f"Finished {dataset} ({DataMC}/{group}, {era}): "
             f"{n_parts} part file(s) written to {outputDir}"
         )
         return n_parts
     except Exception as e:
+        for writer in writers.values():
+            writer.abort()
         logging.error(f"Error processing dataset {dataset} ({DataMC}, {era}): {e}")
         logging.error(traceback.format_exc())
         return None
+    finally:
+        # Unblock a reader waiting on a full queue so it sees `stop` and exits.
+        stop.set()
+        while reader.is_alive():
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
 
 
 if __name__ == "__main__":
@@ -155,6 +267,11 @@ if __name__ == "__main__":
                        help='Reprocess a dataset even if parquet output already exists.')
     parser.add_argument('--sample', action='store_true',
                        help='Process only the first file of each dataset (isSample=True).')
+    parser.add_argument('--memoryBudgetMB', type=int, default=1024,
+                       help='Per-worker memory budget in MB; sets the uproot read step to '
+                            'budget / (readAhead + 2) (default: 1024)')
+    parser.add_argument('--readAhead', type=int, default=2,
+                       help='Chunks the reader thread decompresses ahead of the parquet writer (default: 2)')
     args = parser.parse_args()
 
     try:
@@ -184,8 +301,10 @@ if __name__ == "__main__":
             continue
         if args.sample:
             data = dict(data, files=data["files"][:1])
+        data = dict(data, memoryBudgetMB=args.memoryBudgetMB, readAhead=args.readAhead)
         if not args.force:
-            existing = glob.glob(os.path.join(data["outputDir"], f"{data['dataset']}_part*.parquet"))
+            existing = glob.glob(os.path.join(data["outputDir"], "**", f"{data['dataset']}_part*.parquet"),
+                                 recursive=True)
             if existing:
                 pre_skipped += 1
                 continue
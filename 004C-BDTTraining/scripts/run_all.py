@@ -32,11 +32,55 @@ import sys
 from pathlib import Path
 import subprocess
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 
 sys.path.insert(0, str(Path(__file__).parent))
 import utils
 
 
+def run_training_jobs(queued, n_parallel, cores_per_job):
+    """Run the (era, trainBDT.py command, output dir) jobs n_parallel at a time.
+
+    With more than one job at a time each era's output goes to its
+    trainBDT_{era}_run_all.log instead of the terminal. Returns the per-era
+    timing summary: wall time, status and the phase timings trainBDT.py
+    records in run_manifest.json.
+    """
+    def run_one(job):
+        era, cmd, bdt_out_dir = job
+        print(f"  Running: {' '.join(cmd)}")
+        start = time.time()
+        if n_parallel > 1:
+            with open(bdt_out_dir / f'trainBDT_{era}_run_all.log', 'a') as log:
+                result = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT)
+        else:
+            result = subprocess.run(cmd)
+        return era, bdt_out_dir, result.returncode, start, time.time()
+
+    timing = {}
+    with ThreadPoolExecutor(max_workers=n_parallel) as pool:
+        for future in as_completed([pool.submit(run_one, job) for job in queued]):
+            era, bdt_out_dir, returncode, start, end = future.result()
+            record = {
+                'status': 'ok' if returncode == 0 else 'failed',
+                'start': datetime.fromtimestamp(start).isoformat(timespec='seconds'),
+                'wall_s': round(end - start, 1),
+                'cores': cores_per_job,
+            }
+            manifest_path = bdt_out_dir / 'run_manifest.json'
+            if returncode == 0 and manifest_path.exists():
+                with open(manifest_path) as f:
+                    record['timings_s'] = json.load(f).get('timings_s', {})
+            timing[era] = record
+            if returncode == 0:
+                print(f"  Successfully trained BDT for era {era} in {end - start:.0f} s: {bdt_out_dir}")
+            else:
+                print(f"  Error training BDT for era {era} (see {bdt_out_dir / f'trainBDT_{era}.log'}).")
+    return dict(sorted(timing.items()))
+
+
 def matches_filter(filters, era, data_mc=None, group=None, dataset=None):
     """Check if era/DataMC/group/dataset matches any of the provided filters.
 
@@ -89,6 +133,10 @@ def main():
                             'and only its first file (for testing)')
     parser.add_argument('--workers', type=int, default=8,
                        help='Number of parallel workers passed to extractParquet.py (default: 8)')
+    parser.add_argument('--memoryBudgetMB', type=int, default=1024,
+                       help='Per-worker memory budget in MB passed to extractParquet.py (default: 1024)')
+    parser.add_argument('--readAhead', type=int, default=2,
+                       help='Read-ahead chunks per worker passed to extractParquet.py (default: 2)')
     parser.add_argument('--trainBDT', action='store_true',
                        help='[4] Train the qqbar-vs-gg XGBoost classifier per era from the parquet '
                             'outputs of a (possibly different) extraction run. Requires --parquetHash.')
@@ -97,6 +145,15 @@ def main():
                             '(its outputs/{tag}/{hash}/ directory, containing Parquet_{tag}_{era}_datasets.json '
                             'per era). Required by --trainBDT. Deliberately decoupled from config.yaml\'s own '
                             'hash so that tuning training_config.yaml never forces parquet re-extraction.')
+    parser.add_argument('--trainAllEras', action='store_true',
+                       help='With --trainBDT: train one model on all (filtered) eras combined, written to '
+                            'outputs/{tag}/{parquetHash}/combined/bdt/{training_hash}/ (intended for '
+                            'training_config.yaml ExternalMemory.enabled: true)')
+    parser.add_argument('--trainJobs', type=int, default=1,
+                       help='With --trainBDT: number of eras trained concurrently (default: 1)')
+    parser.add_argument('--trainCores', type=int, default=None,
+                       help='With --trainBDT: total core budget split evenly between the concurrent trainings, '
+                            'passed to trainBDT.py --cores (default: all cores when --trainJobs > 1)')
     parser.add_argument('--trainWriteBashScript', action='store_true',
                        help='[4] Write a bash script with the per-era trainBDT.py commands instead of '
                             'running them directly (mirrors --writeBashScript for extraction).')
@@ -111,11 +168,16 @@ def main():
     print(f"  --generateDatasetJSON: {args.generateDatasetJSON}")
     print(f"  --sample: {args.sample}")
     print(f"  --workers: {args.workers}")
+    print(f"  --memoryBudgetMB: {args.memoryBudgetMB}")
+    print(f"  --readAhead: {args.readAhead}")
     print(f"  --force: {args.force}")
     print(f"  --filter: {args.filter}")
     print(f"  --printHash: {args.printHash}")
     print(f"  --trainBDT: {args.trainBDT}")
     print(f"  --parquetHash: {args.parquetHash}")
+    print(f"  --trainAllEras: {args.trainAllEras}")
+    print(f"  --trainJobs: {args.trainJobs}")
+    print(f"  --trainCores: {args.trainCores}")
     print(f"  --trainWriteBashScript: {args.trainWriteBashScript}")
 
     base_dir      = Path(__file__).parent.parent
@@ -127,7 +189,8 @@ def main():
 
     config = utils.load_config(config_path)
     eras   = config.get('Eras', [])
-    columns = list(config['BDTVariables']) + list(config.get('AdditionalFeatures', [])) + [config['TargetBranch']]
+    columns = (list(config['BDTVariables']) + list(config.get('AdditionalFeatures', []))
+               + list(config.get('EventIDBranches', [])) + [config['TargetBranch']])
     max_events = config['MaxEventsPerParquet']
 
     output_dir, config_hash, is_new_run = utils.create_output_directory(
@@ -219,9 +282,8 @@ def main():
                             storageBase, "BDTParquet", args.tag, config_hash, era, DataMC, group, dataset
                         )
 
-                        existing = (
-                            os.path.isdir(outputDir)
-                            and any(fn.endswith('.parquet') for fn in os.listdir(outputDir))
+                        existing = os.path.isdir(outputDir) and any(
+                            fn.endswith('.parquet') for _, _, fns in os.walk(outputDir) for fn in fns
                         )
                         if not args.force and existing:
                             era_skipped += 1
@@ -230,15 +292,16 @@ def main():
 
                         files = list(datasetJSON[DataMC][group][dataset].keys())
                         task = {
-                            "era":        era,
-                            "DataMC":     DataMC,
-                            "group":      group,
-                            "dataset":    dataset,
-                            "outputDir":  outputDir,
-                            "files":      files,
-                            "columns":    columns,
-                            "maxEvents":  max_events,
-                            "isSample":   isSample,
+                            "era":         era,
+                            "DataMC":      DataMC,
+                            "group":       group,
+                            "dataset":     dataset,
+                            "outputDir":   outputDir,
+                            "files":       files,
+                            "columns":     columns,
+                            "maxEvents":   max_events,
+                            "partitionBy": config['TargetBranch'],
+                            "isSample":    isSample,
                         }
                         era_process_list.append(task)
                         isSample = False
@@ -271,6 +334,8 @@ def main():
                     f"python3 {base_dir / 'scripts' / 'extractParquet.py'} "
                     f"--processListJSON {process_list_json} "
                     f"--workers {args.workers} "
+                    f"--memoryBudgetMB {args.memoryBudgetMB} "
+                    f"--readAhead {args.readAhead} "
                     f"{'--force ' if args.force else ''}"
                     f"{'--sample ' if args.sample else ''}"
                     f"--filter {era}"
@@ -333,6 +398,8 @@ def main():
         bash_script_path = base_dir / 'scripts' / f"train_all_{args.tag}.sh"
         bash_lines = ["#!/bin/bash\n"]
 
+        # (label, [dataset JSONs]) per training job: one per era, or one for all eras.
+        jobs = []
         for era in eras:
             if not matches_filter(args.filter, era):
                 continue
@@ -342,7 +409,18 @@ def main():
                 print(f"  Warning: {dataset_json_path} not found, skipping era {era}. "
                       f"(Has --generateDatasetJSON been run for --parquetHash {args.parquetHash}?)")
                 continue
-
+            jobs.append((era, [dataset_json_path]))
+        if args.trainAllEras and jobs:
+            jobs = [("combined", [path for _, paths in jobs for path in paths])]
+
+        n_parallel = max(1, min(args.trainJobs, len(jobs)))
+        cores_per_job = None
+        if args.trainCores or n_parallel > 1:
+            cores_per_job = max(1, (args.trainCores or os.cpu_count() or 1) // n_parallel)
+            print(f"Training {n_parallel} era(s) at a time with {cores_per_job} core(s) each")
+
+        queued = []  # (era, cmd, bdt_out_dir)
+        for era, dataset_json_paths in jobs:
             bdt_out_dir = parquet_run_dir / era / 'bdt' / training_hash
             if bdt_out_dir.exists() and (bdt_out_dir / 'best_params.json').exists() and not args.force:
                 print(f"  Training output already exists for era {era}, skipping: {bdt_out_dir}")
@@ -353,34 +431,46 @@ def main():
 
             cmd = [
                 sys.executable, str(train_script),
-                '--datasetJSON', str(dataset_json_path),
+                '--datasetJSON', *[str(path) for path in dataset_json_paths],
                 '--trainingConfig', str(training_config_path),
                 '--outputDir', str(bdt_out_dir),
                 '--era', era,
                 '--parquetHash', args.parquetHash,
             ]
+            if cores_per_job:
+                cmd += ['--cores', str(cores_per_job)]
             if args.sample:
                 cmd.append('--sample')
             if args.force:
                 cmd.append('--force')
-
-            if args.trainWriteBashScript:
-                bash_lines.append(' '.join(cmd) +
-                                   f" 2>&1 | tee -a {bdt_out_dir / f'trainBDT_{era}_run_all.log'}\n")
-                print(f"  Queued training command for era {era} in {bash_script_path}")
-            else:
-                print(f"  Running: {' '.join(cmd)}")
-                result = subprocess.run(cmd)
-                if result.returncode != 0:
-                    print(f"Error training BDT for era {era} (see {bdt_out_dir / f'trainBDT_{era}.log'}).")
-                    return 1
-                print(f"  Successfully trained BDT for era {era}: {bdt_out_dir}")
+            queued.append((era, cmd, bdt_out_dir))
 
         if args.trainWriteBashScript:
+            for n, (era, cmd, bdt_out_dir) in enumerate(queued, start=1):
+                line = ' '.join(cmd) + f" 2>&1 | tee -a {bdt_out_dir / f'trainBDT_{era}_run_all.log'}"
+                if n_parallel > 1:
+                    line = f"{line} &"
+                bash_lines.append(line + "\n")
+                if n_parallel > 1 and (n % n_parallel == 0 or n == len(queued)):
+                    bash_lines.append("wait\n")
+                print(f"  Queued training command for era {era} in {bash_script_path}")
             with open(bash_script_path, 'w') as f:
                 f.writelines(bash_lines)
             os.chmod(bash_script_path, 0o755)
             print(f"\nBash script written to: {bash_script_path}")
+        elif queued:
+            timing = run_training_jobs(queued, n_parallel, cores_per_job)
+            timing_path = parquet_run_dir / f"train_timing_{training_hash}.json"
+            with open(timing_path, 'w') as f:
+                json.dump(timing, f, indent=4)
+            print(f"\nTiming summary (also in {timing_path}):")
+            for era, record in timing.items():
+                phases = ', '.join(f"{k} {v:.0f}s" for k, v in record.get('timings_s', {}).items())
+                print(f"  {era:<16} {record['wall_s']:>8.0f}s wall  {record['status']:<7} {phases}")
+            failed = [era for era, record in timing.items() if record['status'] != 'ok']
+            if failed:
+                print(f"Error training BDT for era(s) {failed} (see trainBDT_{{era}}.log in their output directories).")
+                return 1
 
         print(f"\nTraining hash for this run: {training_hash}")
 
@@ -5,9 +5,10 @@ Worker script to train the qqbar-vs-gg XGBoost classifier for one era.
 Reads the parquet outputs of a 004C-BDTTraining extraction run for a single
 dataset (per training_config.yaml's TrainingSample -- nominal
 ttbar_SemiLeptonic), keeps only events with y in {1, 2} (qqbar / gg hard
-scattering, dropping qg/qq'/qq-same-flavour/undefined), balances the two
+scattering, dropping qg/qq'/qq-same-flavour/undefined -- pushed down into
+the parquet read, so the other y partitions are never opened), balances the two
 classes, grid-searches an XGBoost classifier, computes built-in and
-permutation feature importance, and optionally retrains on the top-N most
+mean-|SHAP| (or permutation) feature importance, and optionally retrains on the top-N most
 important features. Mirrors the structure of the old (now-deleted, git
 history commit f7fd8f5) 004B-BDT/scripts/old_ignore/BDT.py, corrected to
 filter strictly to y in {1, 2} instead of qqbar-vs-everything-else, and
@@ -20,10 +21,14 @@ Usage:
 """
 
 import argparse
+import itertools
 import json
 import logging
 import os
+import shutil
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -33,12 +38,15 @@ matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import pyarrow.parquet as pq
+import pyarrow as pa
+import pyarrow.dataset as ds
+from sklearn.base import BaseEstimator, ClassifierMixin
 from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
 from sklearn.inspection import permutation_importance
-from sklearn.metrics import accuracy_score, confusion_matrix, roc_auc_score, roc_curve
-from sklearn.model_selection import GridSearchCV, train_test_split
+from sklearn.metrics import accuracy_score, confusion_matrix, get_scorer, roc_auc_score, roc_curve
+from sklearn.model_selection import GridSearchCV, PredefinedSplit, StratifiedKFold, train_test_split
+import xgboost as xgb
 from xgboost import XGBClassifier
 
 sys.path.insert(0, str(Path(__file__).parent))
@@ -79,22 +87,34 @@ def resolve_parquet_files(dataset_json_path, training_sample):
     return list(files_dict.keys())
 
 
-def read_parquet_files(files, columns, sample=False):
-    dfs = []
-    total_rows = 0
-    for path in files:
-        table = pq.read_table(path, columns=columns)
-        df = table.to_pandas()
-        dfs.append(df)
-        total_rows += len(df)
-        logging.info(f"  Read {len(df)} rows from {os.path.basename(path)} (running total {total_rows})")
-        if sample and total_rows >= SAMPLE_ROW_CAP:
-            logging.info(f"  --sample: reached {total_rows} rows, stopping read early.")
-            break
-    df = pd.concat(dfs, ignore_index=True)
-    if sample and len(df) > SAMPLE_ROW_CAP:
-        df = df.iloc[:SAMPLE_ROW_CAP].reset_index(drop=True)
-    return df
+def read_parquet_files(files, columns, target_branch, labels, sample=False):
+    """Read `columns` of the events with target_branch in `labels` from the parquet part files.
+
+    The files are opened as one pyarrow dataset with hive partitioning on
+    target_branch, so for extraction output partitioned by `y` the parts in
+    other `y=...` directories are pruned from the path alone, and the
+    filter is also pushed down to row-group statistics (for unpartitioned
+    parts). Only `columns` are decoded, and the result is converted to
+    pandas without a per-column consolidation copy.
+    """
+    partitioning = ds.partitioning(pa.schema([(target_branch, pa.int32())]), flavor="hive")
+    dataset = ds.dataset(files, format="parquet", partitioning=partitioning)
+    label_values = sorted(int(k) for k in labels)
+    selection = ds.field(target_branch).isin(label_values)
+    n_kept = sum(1 for _ in dataset.get_fragments(filter=selection))
+    logging.info(f"  {n_kept} of {len(files)} part file(s) can contain {target_branch} in {label_values}")
+
+    if sample:
+        # Equal share per label, so the smoke pass still has both classes.
+        per_label = SAMPLE_ROW_CAP // len(label_values)
+        table = pa.concat_tables([
+            dataset.head(per_label, columns=columns, filter=ds.field(target_branch) == value)
+            for value in label_values
+        ])
+        logging.info(f"  --sample: read {table.num_rows} rows ({per_label} per label at most).")
+    else:
+        table = dataset.to_table(columns=columns, filter=selection)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
 
 
 def derive_binary_label(df, target_branch, labels):
@@ -128,6 +148,58 @@ def balance_classes(df, method, random_state):
         raise ValueError(f"Unknown ClassBalancing.method: {method}")
 
 
+# Split.mode "event_hash": every per-event decision is a function of
+# (run, luminosityBlock, event) alone, so it is the same in every batch,
+# re-extraction or enlarged sample. One salt per decision keeps the test,
+# fold and balancing draws of an event independent.
+EVENT_ID_COLUMNS = ["run", "luminosityBlock", "event"]
+SALT_TEST, SALT_FOLD, SALT_BALANCE = 1, 2, 3
+
+
+def _splitmix64(x):
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def event_uniform(df, seed, salt):
+    """Uniform [0, 1) per row from a hash of its (run, luminosityBlock, event), `seed` and `salt`."""
+    run, lumi, event = (df[c].to_numpy().astype(np.uint64) for c in EVENT_ID_COLUMNS)
+    with np.errstate(over="ignore"):
+        key = _splitmix64((run << np.uint64(32)) ^ lumi ^ np.uint64(seed * 4 + salt))
+        h = _splitmix64(key ^ event)
+    return (h >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def hash_balance_and_split(df, method, split_cfg, n_folds):
+    """balance_classes + train_test_split by event hash; also assigns each train event a CV fold.
+
+    "downsample" keeps an event of class c if its balancing hash is below
+    n_minority / n_c, so the classes come out equal in expectation and the
+    kept events barely change when files are added. Returns
+    (df_train, df_test, train folds, balancing mode).
+    """
+    seed = split_cfg["random_state"]
+    counts = df["y_binary"].value_counts().reindex([0, 1], fill_value=0).to_numpy()
+    logging.info(f"Before balancing: class 0 = {counts[0]}, class 1 = {counts[1]}")
+    if method == "downsample":
+        keep_probability = counts.min() / np.maximum(counts, 1)
+        df = df[event_uniform(df, seed, SALT_BALANCE) < keep_probability[df["y_binary"].to_numpy()]]
+        logging.info(f"Hash-downsampled to {len(df)} events "
+                     f"(class 0 = {int((df['y_binary'] == 0).sum())}, class 1 = {int((df['y_binary'] == 1).sum())}).")
+        balancing_mode = None
+    elif method == "scale_pos_weight":
+        balancing_mode = "scale_pos_weight"
+    else:
+        raise ValueError(f"Unknown ClassBalancing.method: {method}")
+
+    is_test = event_uniform(df, seed, SALT_TEST) < split_cfg["test_size"]
+    df_train, df_test = df[~is_test], df[is_test]
+    folds = (event_uniform(df_train, seed, SALT_FOLD) * n_folds).astype(int)
+    return df_train, df_test, folds, balancing_mode
+
+
 def build_preprocessor(float_features, integer_features):
     return ColumnTransformer(
         transformers=[
@@ -146,17 +218,33 @@ def make_xgb(fixed_params, regularization_params, extra=None):
     return XGBClassifier(**params)
 
 
-def run_grid_search(X_train, y_train, fixed_params, regularization_params, param_grid, grid_cfg, extra_params=None):
-    base_bdt = make_xgb(fixed_params, regularization_params, extra_params)
+def core_split(grid_cfg):
+    """(parallel trials, XGBoost threads per trial) within GridSearch.cores (0/absent: all cores).
+
+    GridSearch.n_jobs (-1: as many trials as cores) sets the parallel
+    trials; each trial's XGBoost gets an equal share of the rest, instead of
+    every trial starting one thread per core.
+    """
+    cores = grid_cfg.get("cores") or os.cpu_count() or 1
+    trials = grid_cfg.get("n_jobs", 1)
+    trials = cores if trials in (None, -1) else max(1, min(trials, cores))
+    return trials, max(1, cores // trials)
+
+
+def run_grid_search(X_train, y_train, fixed_params, regularization_params, param_grid, grid_cfg, extra_params=None,
+                    folds=None):
+    trials, threads = core_split(grid_cfg)
+    logging.info(f"Core budget: {trials} parallel fit(s) x {threads} XGBoost thread(s)")
+    base_bdt = make_xgb(fixed_params, regularization_params, dict(extra_params or {}, n_jobs=threads))
     n_combos = int(np.prod([len(v) for v in param_grid.values()]))
     logging.info(f"Parameter grid: {param_grid}")
     logging.info(f"Total combinations to test: {n_combos} (x cv={grid_cfg['cv']} folds)")
     grid_search = GridSearchCV(
         estimator=base_bdt,
         param_grid=param_grid,
-        cv=grid_cfg["cv"],
+        cv=PredefinedSplit(folds) if folds is not None else grid_cfg["cv"],
         scoring=grid_cfg["scoring"],
-        n_jobs=grid_cfg["n_jobs"],
+        n_jobs=trials,
         verbose=grid_cfg["verbose"],
     )
     grid_search.fit(X_train, y_train)
@@ -165,6 +253,136 @@ def run_grid_search(X_train, y_train, fixed_params, regularization_params, param
     return grid_search
 
 
+class SearchResult:
+    """The GridSearchCV attributes the rest of main() uses, for run_halving_search."""
+
+    def __init__(self, best_estimator, best_params, best_score):
+        self.best_estimator_ = best_estimator
+        self.best_params_ = best_params
+        self.best_score_ = best_score
+
+
+class BoosterClassifier(ClassifierMixin, BaseEstimator):
+    """A trained binary Booster as a fitted sklearn classifier, so the
+    GridSearch.scoring scorer (sklearn.metrics.get_scorer) can score it on a DMatrix."""
+
+    classes_ = np.array([0, 1])
+
+    def __init__(self, booster=None):
+        self.booster = booster
+
+    def predict_proba(self, X):
+        p = self.booster.predict(X)
+        return np.column_stack([1 - p, p])
+
+    def predict(self, X):
+        return (self.booster.predict(X) > 0.5).astype(int)
+
+
+def to_booster_params(params):
+    """XGBClassifier constructor args -> xgboost.train params (n_estimators is the round count, not a param)."""
+    renames = {"n_jobs": "nthread", "random_state": "seed"}
+    return {renames.get(k, k): v for k, v in params.items() if k != "n_estimators"}
+
+
+def run_halving_search(X_train, y_train, fixed_params, regularization_params, param_grid, grid_cfg, extra_params=None,
+                       folds=None):
+    """Successive halving over the ParamGrid, with n_estimators as the resource.
+
+    Every combination of the other grid parameters starts as a candidate and
+    is boosted, on each CV fold, up to the smallest n_estimators value; the
+    best 1/halving_factor by mean CV score (the GridSearch.scoring scorer, as
+    GridSearchCV uses it) continue boosting -- from where they stopped, not
+    from scratch -- to the next n_estimators value, and so on.
+    Each n_estimators value a candidate reaches is a scored grid point, so
+    one boosting run per candidate and fold covers what GridSearchCV fits
+    separately at 100/300/500. The fold QuantileDMatrix objects are built
+    once and shared by all trials, which run GridSearch.n_jobs at a time
+    with the threads of GridSearch.cores split between them (core_split).
+    The best grid point is refit on the whole training split.
+    """
+    trials, threads = core_split(grid_cfg)
+    scorer = get_scorer(grid_cfg["scoring"])
+    factor = grid_cfg.get("halving_factor", 3)
+    rungs = sorted(set(param_grid["n_estimators"]))
+    others = {k: v for k, v in param_grid.items() if k != "n_estimators"}
+    candidates = [dict(zip(others, values)) for values in itertools.product(*others.values())]
+
+    base = dict(fixed_params)
+    base.update(regularization_params)
+    base.update(extra_params or {})
+    base["n_jobs"] = threads
+    max_bin = base.get("max_bin", 256)
+
+    fold_data = []
+    splitter = PredefinedSplit(folds) if folds is not None else StratifiedKFold(n_splits=grid_cfg["cv"])
+    for train_idx, valid_idx in splitter.split(X_train, y_train):
+        dtrain = xgb.QuantileDMatrix(X_train.iloc[train_idx], y_train.iloc[train_idx], max_bin=max_bin)
+        dvalid = xgb.QuantileDMatrix(X_train.iloc[valid_idx], y_train.iloc[valid_idx], ref=dtrain, max_bin=max_bin)
+        fold_data.append((dtrain, dvalid, y_train.iloc[valid_idx].to_numpy()))
+    if not fold_data:
+        raise ValueError("Successive halving needs at least one CV fold")
+    logging.info(f"Successive halving: {len(candidates)} candidates x {len(fold_data)} folds, "
+                 f"n_estimators rungs {rungs}, factor {factor}; "
+                 f"core budget {trials} parallel trial(s) x {threads} XGBoost thread(s)")
+
+    boosters = {}  # (candidate index, fold index) -> Booster boosted up to the previous rung
+
+    def advance(task):
+        index, fold, rounds = task
+        dtrain, dvalid, y_valid = fold_data[fold]
+        booster = xgb.train(to_booster_params({**base, **candidates[index]}), dtrain,
+                            num_boost_round=rounds, xgb_model=boosters.get((index, fold)))
+        return index, fold, booster, scorer(BoosterClassifier(booster), dvalid, y_valid)
+
+    scores = {}  # (candidate index, n_estimators) -> mean CV score (higher is better)
+    alive, done_rounds = list(range(len(candidates))), 0
+    with ThreadPoolExecutor(max_workers=trials) as pool:
+        for rung, n_estimators in enumerate(rungs):
+            tasks = [(i, f, n_estimators - done_rounds) for i in alive for f in range(len(fold_data))]
+            fold_scores = {i: [] for i in alive}
+            for index, fold, booster, score in pool.map(advance, tasks):
+                boosters[(index, fold)] = booster
+                fold_scores[index].append(score)
+            for i in alive:
+                scores[(i, n_estimators)] = float(np.mean(fold_scores[i]))
+            done_rounds = n_estimators
+            ranked = sorted(alive, key=lambda i: scores[(i, n_estimators)], reverse=True)
+            best = ranked[0]
+            logging.info(f"Rung {rung} (n_estimators={n_estimators}): {len(alive)} candidate(s), "
+                         f"best {grid_cfg['scoring']} {scores[(best, n_estimators)]:.4f} for {candidates[best]}")
+            alive = ranked[:max(1, -(-len(alive) // factor))]
+            for key in [k for k in boosters if k[0] not in alive]:
+                del boosters[key]
+
+    (best_index, best_n), best_score = max(scores.items(), key=lambda item: item[1])
+    best_params = dict(candidates[best_index], n_estimators=best_n)
+    logging.info(f"Successive halving completed! Best parameters: {best_params}")
+    logging.info(f"Best cross-validation {grid_cfg['scoring']}: {best_score:.4f}")
+
+    bdt = make_xgb(fixed_params, regularization_params,
+                   dict(extra_params or {}, **best_params, n_jobs=trials * threads))
+    bdt.fit(X_train, y_train)
+    return SearchResult(bdt, best_params, best_score)
+
+
+def run_search(X_train, y_train, fixed_params, regularization_params, param_grid, grid_cfg, extra_params=None,
+               folds=None):
+    """GridSearch.mode: "halving" (run_halving_search) or "grid" (GridSearchCV, the default).
+
+    `folds` (CV fold per training row, from hash_balance_and_split) replaces
+    the stratified GridSearch.cv split.
+    """
+    mode = grid_cfg.get("mode", "grid")
+    if mode == "halving":
+        return run_halving_search(X_train, y_train, fixed_params, regularization_params,
+                                  param_grid, grid_cfg, extra_params, folds)
+    if mode == "grid":
+        return run_grid_search(X_train, y_train, fixed_params, regularization_params,
+                               param_grid, grid_cfg, extra_params, folds)
+    raise ValueError(f"Unknown GridSearch.mode: {mode}")
+
+
 def evaluate(bdt, X_test, y_test):
     y_pred_proba = bdt.predict_proba(X_test)[:, 1]
     y_pred = bdt.predict(X_test)
@@ -176,49 +394,96 @@ def evaluate(bdt, X_test, y_test):
     return y_pred, y_pred_proba, accuracy, auc_score, cm
 
 
-def compute_importances(bdt, features, X_test, y_test, perm_cfg, output_dir):
-    importance_df = pd.DataFrame({
+def shap_importance(bdt, features, X_test, shap_cfg):
+    """Mean |SHAP value| per feature, from XGBoost's exact TreeSHAP (pred_contribs) on a test subsample.
+
+    One prediction pass over at most shap_cfg["n_samples"] rows, instead of
+    n_repeats full-test-set predictions per feature. importance_std is the
+    standard error of the mean |SHAP|, the counterpart of permutation
+    importance's spread over repeats.
+    """
+    n_samples = min(shap_cfg.get("n_samples", 20000), len(X_test))
+    X_sample = X_test.sample(n=n_samples, random_state=shap_cfg.get("random_state", 42))
+    contribs = bdt.get_booster().predict(xgb.DMatrix(X_sample[features]), pred_contribs=True)
+    abs_shap = np.abs(contribs[:, :-1])  # last column is the bias term
+    return pd.DataFrame({
         "feature": features,
-        "importance": bdt.feature_importances_,
-    }).sort_values("importance", ascending=False)
-    importance_df.to_csv(output_dir / "feature_importance.csv", index=False)
-    logging.info("Built-in (gain) feature importance:\n" + importance_df.to_string(index=False))
+        "importance_mean": abs_shap.mean(axis=0),
+        "importance_std": abs_shap.std(axis=0) / np.sqrt(n_samples),
+    }).sort_values("importance_mean", ascending=False)
 
+
+def permutation_importance_df(bdt, features, X_test, y_test, perm_cfg):
     perm = permutation_importance(
         bdt, X_test, y_test,
         n_repeats=perm_cfg["n_repeats"],
         random_state=perm_cfg["random_state"],
         scoring=perm_cfg["scoring"],
-        n_jobs=-1,
+        n_jobs=perm_cfg.get("n_jobs", -1),
     )
-    perm_df = pd.DataFrame({
+    return pd.DataFrame({
         "feature": features,
         "importance_mean": perm.importances_mean,
         "importance_std": perm.importances_std,
     }).sort_values("importance_mean", ascending=False)
-    perm_df.to_csv(output_dir / "permutation_importance.csv", index=False)
-    logging.info("Permutation importance:\n" + perm_df.to_string(index=False))
 
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
+
+def compute_importances(bdt, features, X_test, y_test, fs_cfg, output_dir):
+    """Built-in (gain) importance plus the FeatureSelection.ranking importance used for top-N selection.
+
+    ranking "shap" (default): mean |SHAP| -> shap_importance.csv; permutation
+    importance is then only computed with permutation_cross_check: true.
+    ranking "permutation": permutation importance -> permutation_importance.csv.
+    Both CSVs have the columns feature, importance_mean, importance_std.
+    Returns (gain importance, ranking importance).
+    """
+    importance_df = pd.DataFrame({
+        "feature": features,
+        "importance": bdt.feature_importances_,
+    }).sort_values("importance", ascending=False)
+    importance_df.to_csv(output_dir / "feature_importance.csv", index=False)
+    logging.info("Built-in (gain) feature importance:\n" + importance_df.to_string(index=False))
+
+    ranking = fs_cfg.get("ranking", "shap")
+    panels = []  # (dataframe, title, x label)
+    if ranking == "shap":
+        shap_df = shap_importance(bdt, features, X_test, fs_cfg.get("shap", {}))
+        shap_df.to_csv(output_dir / "shap_importance.csv", index=False)
+        logging.info("Mean |SHAP| importance:\n" + shap_df.to_string(index=False))
+        panels.append((shap_df, "SHAP Feature Importance", "Mean |SHAP value| (log-odds)"))
+        ranking_df = shap_df
+    elif ranking != "permutation":
+        raise ValueError(f"Unknown FeatureSelection.ranking: {ranking}")
+    if ranking == "permutation" or fs_cfg.get("permutation_cross_check", False):
+        perm_df = permutation_importance_df(bdt, features, X_test, y_test, fs_cfg["permutation_importance"])
+        perm_df.to_csv(output_dir / "permutation_importance.csv", index=False)
+        logging.info("Permutation importance:\n" + perm_df.to_string(index=False))
+        panels.append((perm_df, "Permutation Feature Importance", "Drop in ROC-AUC"))
+        if ranking == "permutation":
+            ranking_df = perm_df
+
+    fig, axes = plt.subplots(1, 1 + len(panels), figsize=(8 * (1 + len(panels)), 6))
+    ax1 = axes[0]
     imp_sorted = importance_df.sort_values("importance")
     ax1.barh(imp_sorted["feature"], imp_sorted["importance"])
     ax1.set_xlabel("Importance"); ax1.set_ylabel("Feature")
     ax1.set_title("Built-in Feature Importance (gain)", fontweight="bold")
     ax1.grid(axis="x", alpha=0.3)
 
-    perm_sorted = perm_df.sort_values("importance_mean")
-    ax2.barh(perm_sorted["feature"], perm_sorted["importance_mean"],
-             xerr=perm_sorted["importance_std"], capsize=3)
-    ax2.axvline(x=0, color="red", linestyle="--", linewidth=1, label="Zero importance")
-    ax2.set_xlabel("Drop in ROC-AUC"); ax2.set_ylabel("Feature")
-    ax2.set_title("Permutation Feature Importance", fontweight="bold")
-    ax2.legend(); ax2.grid(axis="x", alpha=0.3)
+    for ax, (df, title, xlabel) in zip(axes[1:], panels):
+        df_sorted = df.sort_values("importance_mean")
+        ax.barh(df_sorted["feature"], df_sorted["importance_mean"],
+                xerr=df_sorted["importance_std"], capsize=3)
+        ax.axvline(x=0, color="red", linestyle="--", linewidth=1, label="Zero importance")
+        ax.set_xlabel(xlabel); ax.set_ylabel("Feature")
+        ax.set_title(title, fontweight="bold")
+        ax.legend(); ax.grid(axis="x", alpha=0.3)
 
     plt.tight_layout()
     plt.savefig(output_dir / "feature_importance_comparison.png", dpi=300, bbox_inches="tight")
     plt.close(fig)
 
-    return importance_df, perm_df
+    return importance_df, ranking_df
 
 
 def save_roc_curve(y_test, y_pred_proba, auc_score, output_dir, title):
@@ -244,9 +509,297 @@ def save_scores(df_test, y_test, y_pred_proba, y_pred, target_branch, out_path):
     logging.info(f"Scores saved to {out_path}")
 
 
+# ---------------------------------------------------------------------------
+# External-memory training (ExternalMemory.enabled): the same label filter,
+# balancing, split and imputation as the in-memory path, applied per parquet
+# batch so the training sample never has to fit in memory.
+# ---------------------------------------------------------------------------
+
+class StreamSpec:
+    """How the parquet batches are turned into (imputed features, binary label) for one training run.
+
+    Every per-row decision (balancing keep, test split) is drawn from an
+    RNG seeded with (random_state, batch index), or with Split.mode
+    "event_hash" from the event's hash (event_uniform), so the statistics
+    pass, the XGBoost iterators and the evaluation pass all see the same
+    rows in the same split.
+    """
+
+    def __init__(self, files, cfg, sample=False):
+        self.float_features = [f for f in cfg["Features"] if f not in cfg.get("IntegerFeatures", [])]
+        self.integer_features = list(cfg.get("IntegerFeatures", []))
+        self.features = self.float_features + self.integer_features
+        self.target_branch = cfg["TargetBranch"]
+        self.labels = {int(k): int(v) for k, v in cfg["Labels"].items()}
+        self.batch_rows = cfg["ExternalMemory"].get("batch_rows", 500000)
+        self.random_state = cfg["Split"]["random_state"]
+        self.test_size = cfg["Split"]["test_size"]
+        self.event_hash = cfg["Split"].get("mode", "random") == "event_hash"
+        self.max_rows = SAMPLE_ROW_CAP if sample else None
+        partitioning = ds.partitioning(pa.schema([(self.target_branch, pa.int32())]), flavor="hive")
+        self.dataset = ds.dataset(files, format="parquet", partitioning=partitioning)
+        self.keep_probability = {cls: 1.0 for cls in set(self.labels.values())}  # set by stream_statistics
+        self.fill_values = {}  # set by stream_statistics
+
+    def batches(self, columns):
+        """(batch index, pandas batch, binary label, test-split mask, balancing-keep mask) per parquet batch."""
+        label_lookup = np.full(max(self.labels) + 1, -1, dtype=np.int8)
+        for y_val, cls in self.labels.items():
+            label_lookup[y_val] = cls
+        if self.event_hash:
+            columns = columns + [c for c in EVENT_ID_COLUMNS if c not in columns]
+        scanner = self.dataset.to_batches(
+            columns=columns, filter=ds.field(self.target_branch).isin(sorted(self.labels)),
+            batch_size=self.batch_rows,
+        )
+        # --sample: an equal share of max_rows per label, as in read_parquet_files.
+        per_label = self.max_rows // len(self.labels) if self.max_rows is not None else None
+        n_read = {y_val: 0 for y_val in self.labels}
+        for index, batch in enumerate(scanner):
+            df = batch.to_pandas()
+            if per_label is not None:
+                if min(n_read.values()) >= per_label:
+                    break
+                y_raw = df[self.target_branch].to_numpy()
+                rank = np.zeros(len(df), dtype=np.int64)
+                for y_val in self.labels:
+                    is_val = y_raw == y_val
+                    rank[is_val] = n_read[y_val] + np.arange(is_val.sum())
+                    n_read[y_val] += int(is_val.sum())
+                df = df[rank < per_label].reset_index(drop=True)
+            label = label_lookup[df[self.target_branch].to_numpy()]
+            keep_probability = np.array([self.keep_probability[c] for c in (0, 1)])[label]
+            if self.event_hash:
+                is_test = event_uniform(df, self.random_state, SALT_TEST) < self.test_size
+                keep = event_uniform(df, self.random_state, SALT_BALANCE) < keep_probability
+            else:
+                rng = np.random.default_rng([self.random_state, index])
+                is_test = rng.random(len(df)) < self.test_size
+                keep = rng.random(len(df)) < keep_probability
+            yield index, df, label, is_test, keep
+
+    def split(self, which):
+        """(X, binary label, original target) batches of the "train" or "test" split, imputed."""
+        for _, df, label, is_test, keep in self.batches(self.features + [self.target_branch]):
+            mask = keep & (is_test if which == "test" else ~is_test)
+            if not mask.any():
+                continue
+            X = df.loc[mask, self.features].fillna(self.fill_values)
+            for col in self.integer_features:
+                X[col] = X[col].round().astype(int)
+            yield X.reset_index(drop=True), label[mask], df[self.target_branch].to_numpy()[mask]
+
+
+def _median_from_counts(counts):
+    """np.median of the values whose occurrence counts are `counts` ({value: count})."""
+    values = sorted(counts)
+    cumulative = np.cumsum([counts[v] for v in values])
+    n = cumulative[-1]
+    lower = values[int(np.searchsorted(cumulative, (n - 1) // 2 + 1))]
+    upper = values[int(np.searchsorted(cumulative, n // 2 + 1))]
+    return (lower + upper) / 2
+
+
+def stream_statistics(spec, balancing_method):
+    """Fit balancing, class weight and imputation statistics in streaming passes over the parts.
+
+    Pass 1 reads only the target column to count classes (all rows, as
+    balance_classes does before the split) and sets spec.keep_probability
+    for "downsample". Pass 2 reads the features of the kept train rows and
+    sets spec.fill_values: the mean of each float feature and the median of
+    each integer feature, as build_preprocessor's imputers would fit them.
+    Returns (extra XGBoost params, {"train": n, "test": n} after balancing).
+    """
+    class_counts = np.zeros(2, dtype=np.int64)
+    for _, _, label, _, _ in spec.batches([spec.target_branch]):
+        class_counts += np.bincount(label, minlength=2)
+    logging.info(f"Before balancing: class 0 = {class_counts[0]}, class 1 = {class_counts[1]}")
+    if balancing_method == "downsample":
+        n_min = class_counts.min()
+        spec.keep_probability = {c: (n_min / class_counts[c] if class_counts[c] else 0.0) for c in (0, 1)}
+        logging.info(f"Downsampling: keep probability per class {spec.keep_probability}")
+    elif balancing_method != "scale_pos_weight":
+        raise ValueError(f"Unknown ClassBalancing.method: {balancing_method}")
+
+    sums = {f: 0.0 for f in spec.float_features}
+    counts = {f: 0 for f in spec.float_features}
+    int_counts = {f: {} for f in spec.integer_features}
+    n_split = {"train": 0, "test": 0}
+    train_classes = np.zeros(2, dtype=np.int64)
+    for _, df, label, is_test, keep in spec.batches(spec.features + [spec.target_branch]):
+        train = keep & ~is_test
+        n_split["train"] += int(train.sum())
+        n_split["test"] += int((keep & is_test).sum())
+        train_classes += np.bincount(label[train], minlength=2)
+        for f in spec.float_features:
+            values = df[f].to_numpy()[train]
+            sums[f] += float(np.nansum(values))
+            counts[f] += int(np.count_nonzero(~np.isnan(values)))
+        for f in spec.integer_features:
+            values, n = np.unique(df[f].to_numpy()[train], return_counts=True)
+            for v, c in zip(values.tolist(), n.tolist()):
+                if not np.isnan(v):
+                    int_counts[f][v] = int_counts[f].get(v, 0) + c
+    spec.fill_values = {f: sums[f] / counts[f] if counts[f] else 0.0 for f in spec.float_features}
+    spec.fill_values.update({f: _median_from_counts(int_counts[f]) if int_counts[f] else 0
+                             for f in spec.integer_features})
+    logging.info(f"Train: {n_split['train']} events (class0={train_classes[0]}, class1={train_classes[1]})")
+    logging.info(f"Test:  {n_split['test']} events")
+    logging.info(f"Imputation values fitted on the train split: {spec.fill_values}")
+
+    extra_params = {}
+    if balancing_method == "scale_pos_weight":
+        spw = train_classes[0] / train_classes[1] if train_classes[1] > 0 else 1.0
+        extra_params["scale_pos_weight"] = float(spw)
+        logging.info(f"scale_pos_weight computed from train split: {spw:.4f}")
+    return extra_params, n_split
+
+
+class ParquetBatchIter(xgb.DataIter):
+    """Feeds one split of a StreamSpec to XGBoost's external-memory DMatrix, a parquet batch at a time."""
+
+    def __init__(self, spec, which, cache_prefix):
+        self.spec, self.which = spec, which
+        self._batches = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def reset(self):
+        self._batches = None
+
+    def next(self, input_data):
+        if self._batches is None:
+            self._batches = self.spec.split(self.which)
+        batch = next(self._batches, None)
+        if batch is None:
+            return False
+        X, label, _ = batch
+        input_data(data=X, label=label)
+        return True
+
+
+def build_streamed_preprocessor(spec, X_fit):
+    """build_preprocessor's imputers, with the statistics from stream_statistics, for the joblib model bundle."""
+    preprocessor = build_preprocessor(spec.float_features, spec.integer_features).fit(X_fit)
+    for name, features in (("float_imputer", spec.float_features), ("int_imputer", spec.integer_features)):
+        imputer = preprocessor.named_transformers_[name]
+        imputer.statistics_ = np.array([spec.fill_values[f] for f in features], dtype=float)
+    return preprocessor
+
+
+def train_external_memory(files, cfg, output_dir, era, parquet_hash, training_hash, sample=False):
+    """Train one model at ExternalMemory.params without loading the training sample into memory.
+
+    No hyperparameter search and no reduced-feature retrain: the point of
+    this mode is the full nominal sample (optionally several eras at once),
+    at a grid point chosen with the in-memory search on a subsample.
+    Returns the number of train+test events used.
+    """
+    ext_cfg = cfg["ExternalMemory"]
+    spec = StreamSpec(files, cfg, sample=sample)
+    extra_params, n_split = stream_statistics(spec, cfg["ClassBalancing"]["method"])
+
+    cache_dir = Path(ext_cfg.get("cache_dir") or output_dir / "xgb_cache")
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    params = dict(cfg["FixedParams"])
+    params.update(cfg["RegularizationParams"])
+    params.update(extra_params)
+    params.update(ext_cfg["params"])
+    max_bin = params.get("max_bin", 256)
+    try:
+        dtrain = xgb.ExtMemQuantileDMatrix(
+            ParquetBatchIter(spec, "train", str(cache_dir / "train")), max_bin=max_bin)
+        dtest = xgb.ExtMemQuantileDMatrix(
+            ParquetBatchIter(spec, "test", str(cache_dir / "test")), max_bin=max_bin, ref=dtrain)
+        logging.info(f"External-memory training at {ext_cfg['params']} on {dtrain.num_row()} events")
+        booster = xgb.train(to_booster_params(params), dtrain, num_boost_round=params["n_estimators"],
+                            evals=[(dtest, "test")], verbose_eval=50)
+        del dtrain, dtest
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    bdt = XGBClassifier(**params)
+    bdt.load_model(bytearray(booster.save_raw("ubj")))
+
+    # Evaluation pass: scores for every test event, features kept for a subsample only.
+    n_keep = cfg["FeatureSelection"].get("shap", {}).get("n_samples", 20000)
+    y_test, y_original, y_pred_proba, X_subsample = [], [], [], []
+    n_kept = 0
+    for X, label, original in spec.split("test"):
+        y_test.append(label)
+        y_original.append(original)
+        y_pred_proba.append(booster.inplace_predict(X))
+        if n_kept < n_keep:
+            X_subsample.append(X.iloc[:n_keep - n_kept])
+            n_kept += len(X_subsample[-1])
+    y_test = pd.Series(np.concatenate(y_test))
+    y_pred_proba = np.concatenate(y_pred_proba)
+    y_pred = (y_pred_proba > 0.5).astype(int)
+    X_subsample = pd.concat(X_subsample, ignore_index=True)
+    accuracy = accuracy_score(y_test, y_pred)
+    auc_score = roc_auc_score(y_test, y_pred_proba)
+    cm = confusion_matrix(y_test, y_pred)
+    logging.info(f"Model accuracy: {accuracy:.4f}, AUC: {auc_score:.4f}")
+    logging.info(f"Confusion matrix:\n{cm}")
+
+    compute_importances(bdt, spec.features, X_subsample, y_test.iloc[:len(X_subsample)],
+                        cfg["FeatureSelection"], output_dir)
+    save_roc_curve(y_test, y_pred_proba, auc_score, output_dir, f"ROC curve -- {era} (external memory)")
+
+    best_params = {
+        "era": era,
+        "parquetHash": parquet_hash,
+        "training_hash": training_hash,
+        "n_train": n_split["train"],
+        "n_test": n_split["test"],
+        "class_balance": {"method": cfg["ClassBalancing"]["method"], **extra_params},
+        "search_mode": "external_memory",
+        "best_parameters": dict(ext_cfg["params"]),
+        "best_cv_auc": None,
+        "test_accuracy": float(accuracy),
+        "test_auc": float(auc_score),
+        "confusion_matrix": cm.tolist(),
+        "timestamp": datetime.now().isoformat(),
+    }
+    with open(output_dir / "best_params.json", "w") as f:
+        json.dump(best_params, f, indent=4)
+
+    joblib.dump({"model": bdt, "imputer": build_streamed_preprocessor(spec, X_subsample),
+                 "features": spec.features}, output_dir / "bdt_model.pkl")
+    logging.info(f"Full model saved to {output_dir / 'bdt_model.pkl'}")
+    save_scores(pd.DataFrame({spec.target_branch: np.concatenate(y_original)}), y_test,
+                y_pred_proba, y_pred, spec.target_branch, output_dir / "scores.csv")
+    return n_split["train"] + n_split["test"]
+
+
+def apply_core_budget(cfg, cores):
+    """Confine every parallel step of the training to `cores` threads (trainBDT.py --cores)."""
+    cfg["GridSearch"]["cores"] = cores
+    cfg["FixedParams"]["n_jobs"] = cores
+    cfg["FeatureSelection"].setdefault("permutation_importance", {})["n_jobs"] = cores
+
+
+def write_manifest(output_dir, training_hash, args, files, n_events, features, timings):
+    manifest = utils.create_output_metadata(training_hash, "trainBDT.py")
+    manifest.update({
+        "era": args.era,
+        "parquetHash": args.parquetHash,
+        "datasetJSON": args.datasetJSON,
+        "source_parquet_files": files,
+        "n_events_after_label_filter_and_balancing": int(n_events),
+        "features": features,
+        "cores": args.cores,
+        "timings_s": {**{phase: round(seconds, 1) for phase, seconds in timings.items()},
+                      "total": round(sum(timings.values()), 1)},
+    })
+    with open(output_dir / "run_manifest.json", "w") as f:
+        json.dump(manifest, f, indent=4)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Train the qqbar-vs-gg XGBoost classifier for one era.")
-    parser.add_argument("--datasetJSON", required=True, help="Path to Parquet_{tag}_{era}_datasets.json")
+    parser.add_argument("--datasetJSON", required=True, nargs="+",
+                        help="Path(s) to Parquet_{tag}_{era}_datasets.json; several train one model on all "
+                             "of their TrainingSample files (e.g. all eras combined)")
     parser.add_argument("--trainingConfig", required=True, help="Path to training_config.yaml")
     parser.add_argument("--outputDir", required=True, help="Directory to write all training artifacts")
     parser.add_argument("--era", required=True, help="Era label (logging/manifest only)")
@@ -257,7 +810,15 @@ def main():
     parser.add_argument("--force", action="store_true",
                         help="Accepted for symmetry with extractParquet.py; run_all.py already gates on "
                              "this before invoking, so it has no effect inside this script.")
+    parser.add_argument("--cores", type=int, default=None,
+                        help="Thread budget for this training: overrides GridSearch.cores, FixedParams.n_jobs "
+                             "and the permutation-importance n_jobs (set by run_all.py --trainJobs)")
     args = parser.parse_args()
+    start = time.perf_counter()
+    timings = {}
+
+    def mark(phase):
+        timings[phase] = time.perf_counter() - start - sum(timings.values())
 
     output_dir = Path(args.outputDir)
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -270,27 +831,50 @@ def main():
     logging.info(f"Training config hash: {training_hash}")
 
     cfg = utils.load_config(args.trainingConfig)
+    if args.cores:
+        apply_core_budget(cfg, args.cores)
+        logging.info(f"Core budget: {args.cores}")
     features = list(cfg["Features"])
     integer_features = list(cfg.get("IntegerFeatures", []))
     float_features = [f for f in features if f not in integer_features]
     ordered_features = float_features + integer_features
     target_branch = cfg["TargetBranch"]
 
-    files = resolve_parquet_files(args.datasetJSON, cfg["TrainingSample"])
+    files = [path for dataset_json in args.datasetJSON
+             for path in resolve_parquet_files(dataset_json, cfg["TrainingSample"])]
     logging.info(f"Found {len(files)} parquet part file(s) for {cfg['TrainingSample']}")
 
+    if cfg.get("ExternalMemory", {}).get("enabled", False):
+        logging.info("\n" + "=" * 60)
+        logging.info("EXTERNAL-MEMORY TRAINING")
+        logging.info("=" * 60)
+        n_events = train_external_memory(files, cfg, output_dir, args.era, args.parquetHash,
+                                         training_hash, sample=args.sample)
+        mark("external_memory_training")
+        write_manifest(output_dir, training_hash, args, files, n_events, ordered_features, timings)
+        logging.info(f"Finished training for era {args.era}.")
+        return
+
     logging.info("Reading parquet files...")
-    df = read_parquet_files(files, features + [target_branch], sample=args.sample)
+    split_cfg = cfg["Split"]
+    event_hash = split_cfg.get("mode", "random") == "event_hash"
+    columns = features + [target_branch] + (EVENT_ID_COLUMNS if event_hash else [])
+    df = read_parquet_files(files, columns, target_branch, cfg["Labels"], sample=args.sample)
     logging.info(f"Total events read: {len(df)}")
 
+    mark("read")
     df = derive_binary_label(df, target_branch, cfg["Labels"])
-    df, balancing_mode = balance_classes(df, cfg["ClassBalancing"]["method"], cfg["ClassBalancing"]["random_state"])
-
-    split_cfg = cfg["Split"]
-    df_train, df_test = train_test_split(
-        df, test_size=split_cfg["test_size"], random_state=split_cfg["random_state"],
-        stratify=df["y_binary"] if split_cfg.get("stratify", True) else None,
-    )
+    folds = None
+    if event_hash:
+        df_train, df_test, folds, balancing_mode = hash_balance_and_split(
+            df, cfg["ClassBalancing"]["method"], split_cfg, cfg["GridSearch"]["cv"])
+    else:
+        df, balancing_mode = balance_classes(df, cfg["ClassBalancing"]["method"],
+                                             cfg["ClassBalancing"]["random_state"])
+        df_train, df_test = train_test_split(
+            df, test_size=split_cfg["test_size"], random_state=split_cfg["random_state"],
+            stratify=df["y_binary"] if split_cfg.get("stratify", True) else None,
+        )
     logging.info(f"Train: {len(df_train)} events (class0={sum(df_train['y_binary'] == 0)}, "
                  f"class1={sum(df_train['y_binary'] == 1)})")
     logging.info(f"Test:  {len(df_test)} events (class0={sum(df_test['y_binary'] == 0)}, "
@@ -321,19 +905,21 @@ def main():
     logging.info("\n" + "=" * 60)
     logging.info("GRID SEARCH (full feature set)")
     logging.info("=" * 60)
-    grid_search = run_grid_search(
+    grid_search = run_search(
         X_train, y_train, cfg["FixedParams"], cfg["RegularizationParams"],
-        cfg["ParamGrid"], cfg["GridSearch"], extra_params,
+        cfg["ParamGrid"], cfg["GridSearch"], extra_params, folds,
     )
     bdt = grid_search.best_estimator_
     y_pred, y_pred_proba, accuracy, auc_score, cm = evaluate(bdt, X_test, y_test)
+    mark("search")
 
     logging.info("\n" + "=" * 60)
     logging.info("FEATURE IMPORTANCE ANALYSIS")
     logging.info("=" * 60)
-    importance_df, perm_df = compute_importances(
-        bdt, ordered_features, X_test, y_test, cfg["FeatureSelection"]["permutation_importance"], output_dir,
+    importance_df, ranking_df = compute_importances(
+        bdt, ordered_features, X_test, y_test, cfg["FeatureSelection"], output_dir,
     )
+    mark("importance")
     save_roc_curve(y_test, y_pred_proba, auc_score, output_dir, f"ROC curve -- {args.era} (full model)")
 
     best_params = {
@@ -343,6 +929,7 @@ def main():
         "n_train": len(df_train),
         "n_test": len(df_test),
         "class_balance": {"method": cfg["ClassBalancing"]["method"], **extra_params},
+        "search_mode": cfg["GridSearch"].get("mode", "grid"),
         "best_parameters": grid_search.best_params_,
         "best_cv_auc": float(grid_search.best_score_),
         "test_accuracy": float(accuracy),
@@ -366,7 +953,7 @@ def main():
         logging.info(f"RETRAINING WITH TOP {select_n} FEATURES")
         logging.info("=" * 60)
         select_n = min(select_n, len(ordered_features))
-        selected_features = perm_df.head(select_n)["feature"].tolist()
+        selected_features = ranking_df.head(select_n)["feature"].tolist()
         removed_features = [f for f in ordered_features if f not in selected_features]
         logging.info(f"Selected features ({select_n}): {selected_features}")
         logging.info(f"Removed features ({len(removed_features)}): {removed_features}")
@@ -393,9 +980,9 @@ def main():
             X_train_reduced[col] = X_train_reduced[col].round().astype(int)
             X_test_reduced[col] = X_test_reduced[col].round().astype(int)
 
-        grid_search_reduced = run_grid_search(
+        grid_search_reduced = run_search(
             X_train_reduced, y_train, cfg["FixedParams"], cfg["RegularizationParams"],
-            cfg["ParamGrid"], cfg["GridSearch"], extra_params,
+            cfg["ParamGrid"], cfg["GridSearch"], extra_params, folds,
         )
         bdt_reduced = grid_search_reduced.best_estimator_
         y_pred_r, y_pred_proba_r, accuracy_r, auc_r, cm_r = evaluate(bdt_reduced, X_test_reduced, y_test)
@@ -429,17 +1016,9 @@ def main():
         save_scores(df_test, y_test, y_pred_proba_r, y_pred_r, target_branch,
                     output_dir / "scores_reduced.csv")
 
-    manifest = utils.create_output_metadata(training_hash, "trainBDT.py")
-    manifest.update({
-        "era": args.era,
-        "parquetHash": args.parquetHash,
-        "datasetJSON": args.datasetJSON,
-        "source_parquet_files": files,
-        "n_events_after_label_filter_and_balancing": int(len(df)),
-        "features": ordered_features,
-    })
-    with open(output_dir / "run_manifest.json", "w") as f:
-        json.dump(manifest, f, indent=4)
+    if select_n:
+        mark("reduced_retrain")
+    write_manifest(output_dir, training_hash, args, files, len(df_train) + len(df_test), ordered_features, timings)
 
     logging.info(f"Finished training for era {args.era}.")
 
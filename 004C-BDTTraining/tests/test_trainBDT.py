@@ -0,0 +1,44 @@
+import logging
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("matplotlib")
+pytest.importorskip("xgboost")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import trainBDT  # noqa: E402
+
+FIXED_PARAMS = {"objective": "binary:logistic", "eval_metric": "auc", "random_state": 42, "tree_method": "hist"}
+PARAM_GRID = {"n_estimators": [5, 10], "max_depth": [2, 3], "learning_rate": [0.3]}
+GRID_CFG = {"cv": 3, "scoring": "roc_auc", "n_jobs": 1, "cores": 1, "halving_factor": 2}
+
+
+def make_data(n=600, seed=0):
+    rng = np.random.default_rng(seed)
+    y = pd.Series(rng.integers(0, 2, n))
+    X = pd.DataFrame({"a": rng.normal(y, 1.0), "b": rng.normal(0, 1, n)})
+    return X, y
+
+
+@pytest.mark.parametrize("folds", [None, np.arange(600) % 3])
+def test_halving_search_scores_every_fold(folds, caplog):
+    X, y = make_data()
+    with caplog.at_level(logging.INFO):
+        result = trainBDT.run_halving_search(X, y, FIXED_PARAMS, {}, PARAM_GRID, GRID_CFG, folds=folds)
+    assert np.isfinite(result.best_score_)
+    assert 0.5 < result.best_score_ <= 1.0
+    assert "x 3 folds" in caplog.text
+    assert result.best_params_["n_estimators"] in PARAM_GRID["n_estimators"]
+
+
+def test_halving_search_uses_configured_scoring():
+    X, y = make_data()
+    grid_cfg = dict(GRID_CFG, scoring="neg_log_loss")
+    result = trainBDT.run_halving_search(X, y, FIXED_PARAMS, {}, PARAM_GRID, grid_cfg)
+    # A log loss, not an AUC: negative, as sklearn's scorer reports it
+    assert np.isfinite(result.best_score_)
+    assert result.best_score_ < 0
@@ -2,17 +2,28 @@
 Extract reco kinematics, gen-level top/antitop rapidities and mtt_gen (signal mode),
 and event weights from BDTScore ROOT files into a single parquet file.
 
+Files are converted in parallel worker processes, each streaming its file in
+chunks into a per-file parquet part; the parts are then streamed into the
+output with one ParquetWriter. A manifest of per-file checksums next to the
+parts lets a re-run skip files that have not changed since they were converted.
+
 Usage:
   python getParquet.py input_dir output.parquet           # background (reco + weights only)
   python getParquet.py --signal input_dir output.parquet  # signal (adds gen columns)
+  python getParquet.py --workers 8 --stepSize "200 MB" input_dir output.parquet
 """
 
 import argparse
 import glob
+import hashlib
+import json
+import multiprocessing
 import os
 
 import awkward as ak
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import uproot
 
 
@@ -37,6 +48,9 @@ GEN_BRANCHES = [
     "GenPart_pt", "GenPart_eta", "GenPart_phi", "GenPart_mass",
 ]
 
+# Bump when the output columns change, so stale per-file parts are not reused.
+MANIFEST_VERSION = 1
+
 
 def compute_rapidity(pt, eta, mass):
     pz = pt * np.sinh(eta)
@@ -94,20 +108,11 @@ def build_weights(a):
     }
 
 
-def process_file(path, is_signal):
-    tree = uproot.open(path)["Events"]
-    if tree.num_entries == 0:
-        return None
-
-    branches = RECO_BRANCHES + WEIGHT_BRANCHES + (GEN_BRANCHES if is_signal else [])
-    
-    # Filter to only branches that exist in the file
-    available_branches = [b for b in branches if b in tree.keys()]
-    arrays = tree.arrays(available_branches)
-    
+def _columns(arrays, n):
+    """Output columns of one chunk of reco + weight branches, as an awkward record array."""
     # If LHEWeightSign is missing, create it as ones
-    if "LHEWeightSign" not in available_branches:
-        arrays["LHEWeightSign"] = np.ones(tree.num_entries)
+    if "LHEWeightSign" not in arrays.fields:
+        arrays["LHEWeightSign"] = np.ones(n)
 
     result = {
         "yt":       arrays["yt"],
@@ -120,39 +125,144 @@ def process_file(path, is_signal):
     yt_lab, ytbar_lab = compute_lab_yt_ytbar(arrays)
     result["yt_lab"]    = yt_lab
     result["ytbar_lab"] = ytbar_lab
+    return result
 
-    if is_signal:
-        pdgId = arrays["GenPart_pdgId"]
-        sf    = arrays["GenPart_statusFlags"]
-        pt    = arrays["GenPart_pt"]
-        eta   = arrays["GenPart_eta"]
-        phi   = arrays["GenPart_phi"]
-        mass  = arrays["GenPart_mass"]
-
-        isLastCopy = (sf >> 13) & 1
-        top_mask  = (pdgId ==  6) & (isLastCopy == 1)
-        atop_mask = (pdgId == -6) & (isLastCopy == 1)
-
-        top_pt   = ak.firsts(pt[top_mask]);   top_eta  = ak.firsts(eta[top_mask])
-        top_phi  = ak.firsts(phi[top_mask]);  top_mass = ak.firsts(mass[top_mask])
-        atop_pt  = ak.firsts(pt[atop_mask]);  atop_eta = ak.firsts(eta[atop_mask])
-        atop_phi = ak.firsts(phi[atop_mask]); atop_mass = ak.firsts(mass[atop_mask])
-
-        gen_yt    = compute_rapidity(top_pt,  top_eta,  top_mass)
-        gen_ytbar = compute_rapidity(atop_pt, atop_eta, atop_mass)
-        mtt_gen   = compute_mtt(top_pt, top_eta, top_phi, top_mass,
-                                atop_pt, atop_eta, atop_phi, atop_mass)
-
-        result["gen_yt"]    = gen_yt
-        result["gen_ytbar"] = gen_ytbar
-        result["mtt_gen"]   = mtt_gen
 
-        combined = ak.Array(result)
-        # Drop events where gen top/antitop selection failed (shouldn't happen in ttbar MC)
-        valid = ~(ak.is_none(gen_yt) | ak.is_none(gen_ytbar))
-        return combined[valid]
+def _gen_tops(tree, pdgId, sf, entry_start, entry_stop):
+    """(top, antitop) as (pt, eta, phi, mass) of the first last-copy t / tbar per event.
 
-    return ak.Array(result)
+    The search runs on the integer pdgId/statusFlags collections only; the
+    GenPart kinematics of the same entry range are read afterwards and reduced
+    to the two picked particles straight away, so the full jagged float
+    collections of a chunk never outlive this function.
+    """
+    isLastCopy = (sf >> 13) & 1
+    index = ak.local_index(pdgId)
+    top_idx  = ak.firsts(index[(pdgId ==  6) & (isLastCopy == 1)])
+    atop_idx = ak.firsts(index[(pdgId == -6) & (isLastCopy == 1)])
+
+    kin = tree.arrays(["GenPart_pt", "GenPart_eta", "GenPart_phi", "GenPart_mass"],
+                      entry_start=entry_start, entry_stop=entry_stop)
+    top_sel  = ak.singletons(top_idx)
+    atop_sel = ak.singletons(atop_idx)
+    top  = tuple(ak.firsts(kin[f"GenPart_{v}"][top_sel])  for v in ("pt", "eta", "phi", "mass"))
+    atop = tuple(ak.firsts(kin[f"GenPart_{v}"][atop_sel]) for v in ("pt", "eta", "phi", "mass"))
+    return top, atop
+
+
+def iterate_file(path, is_signal, step_size="100 MB"):
+    """Yield the output columns of `path` as pyarrow tables, one per `step_size` chunk of Events."""
+    with uproot.open(path) as f:
+        tree = f["Events"]
+        if tree.num_entries == 0:
+            return
+
+        branches = RECO_BRANCHES + WEIGHT_BRANCHES
+        if is_signal:
+            branches += ["GenPart_pdgId", "GenPart_statusFlags"]
+        # Filter to only branches that exist in the file
+        available_branches = [b for b in branches if b in tree.keys()]
+
+        for arrays, report in tree.iterate(available_branches, step_size=step_size, report=True):
+            result = _columns(arrays, len(arrays))
+
+            if is_signal:
+                top, atop = _gen_tops(tree, arrays["GenPart_pdgId"], arrays["GenPart_statusFlags"],
+                                      report.tree_entry_start, report.tree_entry_stop)
+                gen_yt    = compute_rapidity(top[0],  top[1],  top[3])
+                gen_ytbar = compute_rapidity(atop[0], atop[1], atop[3])
+                mtt_gen   = compute_mtt(*top, *atop)
+
+                result["gen_yt"]    = gen_yt
+                result["gen_ytbar"] = gen_ytbar
+                result["mtt_gen"]   = mtt_gen
+
+                combined = ak.Array(result)
+                # Drop events where gen top/antitop selection failed (shouldn't happen in ttbar MC)
+                valid = ~(ak.is_none(gen_yt) | ak.is_none(gen_ytbar))
+                combined = combined[valid]
+            else:
+                combined = ak.Array(result)
+
+            if len(combined):
+                yield ak.to_arrow_table(combined, extensionarray=False)
+
+
+def file_checksum(path, block=1 << 20):
+    """Cheap content fingerprint of a ROOT file: size, mtime and a sha1 of its first and last MiB.
+
+    The head holds the file UUID and the tail the keys list, so a rewritten or
+    re-produced file gets a new checksum without hashing gigabytes.
+    """
+    st = os.stat(path)
+    h = hashlib.sha1(f"{st.st_size}:{st.st_mtime_ns}".encode())
+    with open(path, "rb") as f:
+        h.update(f.read(block))
+        if st.st_size > block:
+            f.seek(max(block, st.st_size - block))
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def convert_file(task):
+    """Worker: stream one ROOT file into its own parquet part. Returns (path, checksum, events)."""
+    path, part_path, is_signal, step_size = task
+    checksum = file_checksum(path)
+    tmp_path = part_path + ".tmp"
+    writer, n = None, 0
+    try:
+        for table in iterate_file(path, is_signal, step_size):
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema, compression="zstd")
+            writer.write_table(table.cast(writer.schema))
+            n += table.num_rows
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_path)
+        raise
+    if writer is not None:
+        writer.close()
+        os.replace(tmp_path, part_path)
+    return path, checksum, n
+
+
+def load_manifest(path, is_signal):
+    """Per-file entries of a previous run, or {} if there is none or it was made in the other mode."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("signal") != is_signal:
+        return {}
+    return manifest.get("files", {})
+
+
+def assemble(output, parts):
+    """Stream the per-file parts, in order, into one parquet file through a single ParquetWriter.
+
+    Parts are read a row group at a time. Their schemas are unified with type
+    promotion (e.g. float32 weights of one file, float64 of another where
+    LHEWeightSign was missing), as ak.concatenate did for the in-memory version.
+    """
+    schema = pa.unify_schemas([pq.read_schema(p) for p in parts], promote_options="permissive")
+    tmp_path = output + ".tmp"
+    total = 0
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+        for part in parts:
+            pf = pq.ParquetFile(part)
+            for i in range(pf.num_row_groups):
+                table = pf.read_row_group(i)
+                writer.write_table(table.select(schema.names).cast(schema))
+                total += table.num_rows
+    os.replace(tmp_path, output)
+    return total
+
+
+def step_size(value):
+    """uproot step_size from the command line: entries if all digits, else a size string like '100 MB'."""
+    value = value.strip()
+    return int(value) if value.isdigit() else value
 
 
 def main():
@@ -161,27 +271,65 @@ def main():
     parser.add_argument("output", help="Output parquet file path")
     parser.add_argument("--signal", action="store_true",
                         help="Signal mode: also extract gen top/antitop columns")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Worker processes converting files in parallel (default: 4)")
+    parser.add_argument("--stepSize", type=step_size, default="100 MB",
+                        help="Chunk size: a number of entries (e.g. 200000) or a memory size "
+                             "with a unit (e.g. '100 MB') (default: '100 MB')")
+    parser.add_argument("--partsDir", default=None,
+                        help="Directory for the per-file parquet parts and their manifest "
+                             "(default: {output stem}_parts next to the output)")
+    parser.add_argument("--force", action="store_true",
+                        help="Convert every file again, ignoring the manifest")
     args = parser.parse_args()
 
     files = sorted(glob.glob(os.path.join(args.input_dir, "*.root")))
     if not files:
         raise RuntimeError(f"No ROOT files found in {args.input_dir}")
 
-    chunks = []
+    parts_dir = args.partsDir or f"{os.path.splitext(os.path.abspath(args.output))[0]}_parts"
+    os.makedirs(parts_dir, exist_ok=True)
+    manifest_path = os.path.join(parts_dir, "manifest.json")
+    previous = {} if args.force else load_manifest(manifest_path, args.signal)
+
+    def part_of(path):
+        return os.path.join(parts_dir, os.path.splitext(os.path.basename(path))[0] + ".parquet")
+
+    entries, tasks = {}, []
     for path in files:
-        chunk = process_file(path, args.signal)
-        n = len(chunk) if chunk is not None else 0
-        if chunk is not None and n > 0:
-            chunks.append(chunk)
+        entry = previous.get(path)
+        if (entry is not None and entry["checksum"] == file_checksum(path)
+                and (entry["events"] == 0 or os.path.exists(part_of(path)))):
+            entries[path] = entry
+            print(f"  {os.path.basename(path)}: {entry['events']} events (unchanged, skipped)")
+        else:
+            tasks.append((path, part_of(path), args.signal, args.stepSize))
+
+    def record(path, checksum, n):
+        entries[path] = {"checksum": checksum, "events": n}
         print(f"  {os.path.basename(path)}: {n} events")
-
-    if not chunks:
+        # Written after every file, so an interrupted run resumes where it stopped.
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "signal": args.signal, "files": entries}, f, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    if tasks:
+        print(f"Converting {len(tasks)} of {len(files)} files with {min(args.workers, len(tasks))} worker(s)")
+    if args.workers > 1 and len(tasks) > 1:
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(min(args.workers, len(tasks))) as pool:
+            for result in pool.imap_unordered(convert_file, tasks):
+                record(*result)
+    else:
+        for task in tasks:
+            record(*convert_file(task))
+
+    parts = [part_of(path) for path in files if entries[path]["events"] > 0]
+    if not parts:
         raise RuntimeError("No events found across all files")
 
-    combined = ak.concatenate(chunks)
-    print(f"\nTotal events: {len(combined)}")
-
-    ak.to_parquet(combined, args.output)
+    total = assemble(args.output, parts)
+    print(f"\nTotal events: {total}")
     print(f"Saved to {args.output}")
 
 
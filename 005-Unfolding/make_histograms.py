@@ -4,9 +4,14 @@ Build unrolled reco and gen TH1D histograms from the signal parquet (closure tes
 Usage:
     python make_histograms.py signal.parquet output.root \\
         --xsec 365.5 --ngen 110787582 --lumi 19520.0
+
+    # or take xsec/ngen/lumi from a lumiXinfo JSON (scripts/genWeightIndex.py):
+    python make_histograms.py signal.parquet output.root \\
+        --lumiXinfo UL2017_lumiXinfo.json --dataset UL2017_ttbar_SemiLeptonic
 """
 
 import argparse
+import json
 import os
 
 import numpy as np
@@ -31,13 +36,11 @@ def make_Nplus_Nminus(y_top, y_antitop):
 
 
 def get_unrolled_bin(mtt, is_Nplus, is_Nminus, edges):
+    """Unrolled bin index: N+ bins 0..n-1, N- bins n..2n-1, -1 outside [edges[0], edges[-1]) or neither."""
     n = len(edges) - 1
-    result = np.full(len(mtt), -1, dtype=int)
-    for i in range(n):
-        in_bin = (mtt >= edges[i]) & (mtt < edges[i + 1])
-        result[in_bin & is_Nplus]  = i
-        result[in_bin & is_Nminus] = n + i
-    return result
+    i = np.digitize(mtt, edges) - 1  # edges[i] <= mtt < edges[i+1]; NaN lands past the last edge
+    in_range = (i >= 0) & (i < n)
+    return np.where(in_range & is_Nplus, i, np.where(in_range & is_Nminus, n + i, -1))
 
 
 def make_labels(edges):
@@ -63,10 +66,26 @@ def main():
     parser = argparse.ArgumentParser(description="Build unrolled reco/gen histograms from signal parquet")
     parser.add_argument("parquet", help="Signal parquet produced by getParquet.py --signal")
     parser.add_argument("output",  help="Output ROOT file")
-    parser.add_argument("--xsec",  type=float, required=True, help="Cross section in pb")
-    parser.add_argument("--ngen",  type=int,   required=True, help="Number of generated events")
-    parser.add_argument("--lumi",  type=float, required=True, help="Luminosity in pb-1")
+    parser.add_argument("--xsec",  type=float, default=None, help="Cross section in pb")
+    parser.add_argument("--ngen",  type=float, default=None, help="Number of generated events (or sum of weights)")
+    parser.add_argument("--lumi",  type=float, default=None, help="Luminosity in pb-1")
+    parser.add_argument("--lumiXinfo", default=None,
+                        help="lumiXinfo JSON (scripts/genWeightIndex.py) providing any of --xsec/--ngen/--lumi not given")
+    parser.add_argument("--dataset", default=None, help="lumiXinfo key of the signal sample, e.g. UL2017_ttbar_SemiLeptonic")
     args = parser.parse_args()
+    if args.lumiXinfo:
+        if not args.dataset:
+            parser.error("--lumiXinfo needs --dataset")
+        with open(args.lumiXinfo) as f:
+            lumiXinfo = json.load(f)
+        if args.xsec is None:
+            args.xsec = lumiXinfo["cross_sections"][args.dataset]
+        if args.ngen is None:
+            args.ngen = lumiXinfo["generated_events"][args.dataset]
+        if args.lumi is None:
+            args.lumi = lumiXinfo["Luminosity"]
+    if None in (args.xsec, args.ngen, args.lumi):
+        parser.error("--xsec, --ngen and --lumi are required unless provided by --lumiXinfo")
 
     df = pd.read_parquet(args.parquet)
     lumi_scale = args.xsec * args.lumi / args.ngen
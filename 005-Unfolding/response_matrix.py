@@ -7,9 +7,14 @@ Reads from a parquet file produced by:
 Usage:
     python response_matrix.py signal.parquet output.root \\
         --xsec 365.5 --ngen 110787582 --lumi 19520.0
+
+    # or take xsec/ngen/lumi from a lumiXinfo JSON (scripts/genWeightIndex.py):
+    python response_matrix.py signal.parquet output.root \\
+        --lumiXinfo UL2017_lumiXinfo.json --dataset UL2017_ttbar_SemiLeptonic
 """
 
 import argparse
+import json
 import os
 
 import numpy as np
@@ -42,13 +47,11 @@ def make_Nplus_Nminus(y_top, y_antitop):
 
 
 def get_unrolled_bin(mtt, is_Nplus, is_Nminus, edges):
+    """Unrolled bin index: N+ bins 0..n-1, N- bins n..2n-1, -1 outside [edges[0], edges[-1]) or neither."""
     n = len(edges) - 1
-    result = np.full(len(mtt), -1, dtype=int)
-    for i in range(n):
-        in_bin = (mtt >= edges[i]) & (mtt < edges[i + 1])
-        result[in_bin & is_Nplus]  = i
-        result[in_bin & is_Nminus] = n + i
-    return result
+    i = np.digitize(mtt, edges) - 1  # edges[i] <= mtt < edges[i+1]; NaN lands past the last edge
+    in_range = (i >= 0) & (i < n)
+    return np.where(in_range & is_Nplus, i, np.where(in_range & is_Nminus, n + i, -1))
 
 
 def make_labels(edges):
@@ -73,12 +76,39 @@ def make_response_matrix(name, title, with_errors, n_gen, n_reco, gen_edges, rec
     return h
 
 
-def fill_response_matrix(h, gen_bin, reco_bin, weights):
-    # Valid bins → bin centre (+0.5); failed/out-of-range → underflow (-0.5)
-    g_fill = np.where(gen_bin >= 0, gen_bin + 0.5, -0.5).astype(np.float64)
-    r_fill = np.where(reco_bin >= 0, reco_bin + 0.5, -0.5).astype(np.float64)
-    w_fill = weights.astype(np.float64)
-    h.FillN(len(g_fill), g_fill, r_fill, w_fill, 1)
+def accumulate_response(gen_bin, reco_bin, weights, n_gen, n_reco):
+    """Sum of weights and of weights squared per (gen, reco) bin, for every weight column at once.
+
+    The flat bin index is computed once and shared by one np.bincount per
+    column of `weights` (n_events, n_weights). Index 0 on each axis is the
+    underflow that failed/out-of-range events go to, as in the TH2D.
+    Returns (sumw, sumw2), each of shape (n_weights, n_gen + 1, n_reco + 1).
+    """
+    flat = (gen_bin + 1) * (n_reco + 1) + (reco_bin + 1)
+    size = (n_gen + 1) * (n_reco + 1)
+    n_weights = weights.shape[1]
+    sumw  = np.empty((n_weights, size))
+    sumw2 = np.empty((n_weights, size))
+    for k in range(n_weights):
+        w = weights[:, k]
+        sumw[k]  = np.bincount(flat, weights=w,     minlength=size)
+        sumw2[k] = np.bincount(flat, weights=w * w, minlength=size)
+    shape = (n_weights, n_gen + 1, n_reco + 1)
+    return sumw.reshape(shape), sumw2.reshape(shape)
+
+
+def fill_response_matrix(h, sumw, sumw2, n_entries):
+    """Set the contents and errors of `h` from one (n_gen + 1, n_reco + 1) slice, underflow included.
+
+    Errors are always set: weighted FillN switched Sumw2 on by itself, so the
+    systematics carried sum-of-weights-squared too until zero_bin_errors.
+    """
+    for gx in range(sumw.shape[0]):
+        for ry in range(sumw.shape[1]):
+            h.SetBinContent(gx, ry, sumw[gx, ry])
+            h.SetBinError(gx, ry, np.sqrt(sumw2[gx, ry]))
+    h.ResetStats()
+    h.SetEntries(n_entries)
 
 
 def zero_bin_errors(h):
@@ -91,10 +121,26 @@ def main():
     parser = argparse.ArgumentParser(description="Build response matrix from signal parquet")
     parser.add_argument("parquet", help="Signal parquet produced by getParquet.py --signal")
     parser.add_argument("output",  help="Output ROOT file")
-    parser.add_argument("--xsec",  type=float, required=True, help="Cross section in pb")
-    parser.add_argument("--ngen",  type=int,   required=True, help="Number of generated events")
-    parser.add_argument("--lumi",  type=float, required=True, help="Luminosity in pb-1")
+    parser.add_argument("--xsec",  type=float, default=None, help="Cross section in pb")
+    parser.add_argument("--ngen",  type=float, default=None, help="Number of generated events (or sum of weights)")
+    parser.add_argument("--lumi",  type=float, default=None, help="Luminosity in pb-1")
+    parser.add_argument("--lumiXinfo", default=None,
+                        help="lumiXinfo JSON (scripts/genWeightIndex.py) providing any of --xsec/--ngen/--lumi not given")
+    parser.add_argument("--dataset", default=None, help="lumiXinfo key of the signal sample, e.g. UL2017_ttbar_SemiLeptonic")
     args = parser.parse_args()
+    if args.lumiXinfo:
+        if not args.dataset:
+            parser.error("--lumiXinfo needs --dataset")
+        with open(args.lumiXinfo) as f:
+            lumiXinfo = json.load(f)
+        if args.xsec is None:
+            args.xsec = lumiXinfo["cross_sections"][args.dataset]
+        if args.ngen is None:
+            args.ngen = lumiXinfo["generated_events"][args.dataset]
+        if args.lumi is None:
+            args.lumi = lumiXinfo["Luminosity"]
+    if None in (args.xsec, args.ngen, args.lumi):
+        parser.error("--xsec, --ngen and --lumi are required unless provided by --lumiXinfo")
 
     df = pd.read_parquet(args.parquet)
     lumi_scale = args.xsec * args.lumi / args.ngen
@@ -128,17 +174,23 @@ def main():
     os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
     fout = ROOT.TFile(args.output, "RECREATE")
 
+    # All weight columns in one pass over the events: nominal first, then the systematics
+    weight_cols = ["weight_nominal"] + [col for pair in SYST_PAIRS for col in pair]
+    weights = df[weight_cols].to_numpy(dtype=np.float64)[in_matrix] * lumi_scale
+    sumw, sumw2 = accumulate_response(gen_bin[in_matrix], reco_bin[in_matrix], weights,
+                                      n_gen_bins, n_reco_bins)
+    n_entries = int(np.sum(in_matrix))
+
     # Nominal response matrix (with stat errors via Sumw2)
     h_nominal = make_response_matrix(
         "response_matrix_nominal", "Nominal response matrix;Gen bin;Reco bin",
         True, n_gen_bins, n_reco_bins, GEN_MTT_EDGES, RECO_MTT_EDGES,
     )
-    w_nominal = df["weight_nominal"].values * lumi_scale
-    fill_response_matrix(h_nominal, gen_bin[in_matrix], reco_bin[in_matrix], w_nominal[in_matrix])
+    fill_response_matrix(h_nominal, sumw[0], sumw2[0], n_entries)
     h_nominal.Write()
 
     # Systematic variations (no stat errors stored — zero them out)
-    for up_col, dn_col in SYST_PAIRS:
+    for k, (up_col, dn_col) in enumerate(SYST_PAIRS):
         source = up_col.replace("weight_", "").replace("Up", "")
         h_up = make_response_matrix(
             f"response_matrix_{source}Up",   f"{source} Up;Gen bin;Reco bin",
@@ -148,10 +200,8 @@ def main():
             f"response_matrix_{source}Down", f"{source} Down;Gen bin;Reco bin",
             False, n_gen_bins, n_reco_bins, GEN_MTT_EDGES, RECO_MTT_EDGES,
         )
-        w_up = df[up_col].values * lumi_scale
-        w_dn = df[dn_col].values * lumi_scale
-        fill_response_matrix(h_up, gen_bin[in_matrix], reco_bin[in_matrix], w_up[in_matrix])
-        fill_response_matrix(h_dn, gen_bin[in_matrix], reco_bin[in_matrix], w_dn[in_matrix])
+        fill_response_matrix(h_up, sumw[1 + 2 * k], sumw2[1 + 2 * k], n_entries)
+        fill_response_matrix(h_dn, sumw[2 + 2 * k], sumw2[2 + 2 * k], n_entries)
         zero_bin_errors(h_up)
         zero_bin_errors(h_dn)
         h_up.Write()
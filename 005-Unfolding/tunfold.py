@@ -15,11 +15,18 @@ Usage:
         --histograms unrolled_histograms.root \\
         --matrix     response_matrix.root \\
         --outdir     results/
+
+    # plus Poisson pseudo-experiments and per-systematic re-unfoldings in worker processes:
+    python tunfold.py --histograms unrolled_histograms.root --matrix response_matrix.root \\
+        --outdir results/ --toys 2000 --workers 8
 """
 
 import argparse
 import ctypes
+import math
+import multiprocessing
 import os
+import time
 
 import numpy as np
 import ROOT
@@ -42,6 +49,238 @@ n_gen_bins  = 2 * n_gen_mtt
 # Match names used in response_matrix.py SYST_PAIRS
 SYSTEMATICS = ["pileup", "prefiring", "muonID", "btag"]
 
+# Range of the per-bin toy pull distributions written to unfolding_results.root
+PULL_EDGES = np.linspace(-5.0, 5.0, 51)
+
+
+def make_unfold(h_matrix):
+    return ROOT.TUnfoldDensity(
+        h_matrix,
+        ROOT.TUnfold.kHistMapOutputHoriz,
+        ROOT.TUnfold.kRegModeCurvature,
+        ROOT.TUnfold.kEConstraintArea,
+        ROOT.TUnfoldDensity.kDensityModeBinWidth,
+    )
+
+
+def bin_values(h, n):
+    return np.array([h.GetBinContent(i + 1) for i in range(n)])
+
+
+def load_hist(f, name):
+    h = f.Get(name)
+    if not h:
+        raise RuntimeError(f"Object '{name}' not found in {f.GetName()}")
+    h.SetDirectory(0)
+    return h
+
+
+class RunningStats:
+    """Per-bin count, mean and sum of squared deviations, updated a batch at a
+    time and mergeable across workers (Chan et al.), so no toy is kept."""
+
+    def __init__(self, n_bins):
+        self.n = 0
+        self.mean = np.zeros(n_bins)
+        self.m2 = np.zeros(n_bins)
+
+    def update(self, values):
+        batch = RunningStats(values.shape[1])
+        batch.n = len(values)
+        if batch.n:
+            batch.mean = values.mean(axis=0)
+            batch.m2 = ((values - batch.mean) ** 2).sum(axis=0)
+        self.merge(batch)
+
+    def merge(self, other):
+        n = self.n + other.n
+        if n == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.n / n
+        self.m2 = self.m2 + other.m2 + delta**2 * self.n * other.n / n
+        self.n = n
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else np.zeros_like(self.mean)
+
+
+# --- Toy / systematic workers: each process builds its own TUnfoldDensity ---
+_WORKER = {}
+
+
+def init_worker(histograms, matrix, tau):
+    ROOT.TH1.AddDirectory(False)
+    f_proc = ROOT.TFile.Open(histograms)
+    f_resp = ROOT.TFile.Open(matrix)
+    h_data = load_hist(f_proc, "ttbar_SemiLeptonic_reco_nominal")
+    h_truth = load_hist(f_proc, "ttbar_SemiLeptonic_gen_nominal")
+    h_matrix = load_hist(f_resp, "response_matrix_nominal")
+    f_proc.Close()
+    f_resp.Close()
+    _WORKER.update(
+        matrix=matrix, tau=tau, h_data=h_data,
+        h_toy=h_data.Clone("h_toy"),
+        expected=bin_values(h_data, n_reco_bins),
+        truth=bin_values(h_truth, n_gen_bins),
+        unfold=make_unfold(h_matrix),
+    )
+
+
+def _unfold_at_tau(unfold, h_input, tau):
+    """Unfold `h_input` at fixed tau; (values, input-stat errors) per gen bin, or None if SetInput fails."""
+    if unfold.SetInput(h_input) >= 10000:
+        return None
+    unfold.DoUnfold(tau)
+    h_out = unfold.GetOutput("h_toy_unfolded")
+    h_cov = unfold.GetEmatrixInput("h_toy_cov_input")
+    ROOT.SetOwnership(h_out, True)
+    ROOT.SetOwnership(h_cov, True)
+    values = bin_values(h_out, n_gen_bins)
+    errors = np.sqrt(np.maximum([h_cov.GetBinContent(i + 1, i + 1) for i in range(n_gen_bins)], 0.0))
+    return values, errors
+
+
+def run_toys(task):
+    """Unfold `count` Poisson toys of the nominal reco spectrum; returns their streaming statistics.
+
+    Toys are seeded from (seed, first toy index), so results do not depend on
+    how the toys are split across workers.
+    """
+    first, count, seed = task
+    w = _WORKER
+    rng = np.random.default_rng([seed, first])
+    pulls, biases, failed = [], [], 0
+    for counts in rng.poisson(w["expected"], size=(count, n_reco_bins)):
+        for i, n in enumerate(counts):
+            w["h_toy"].SetBinContent(i + 1, n)
+            w["h_toy"].SetBinError(i + 1, math.sqrt(n))
+        result = _unfold_at_tau(w["unfold"], w["h_toy"], w["tau"])
+        if result is None or not np.all(result[1] > 0):
+            failed += 1
+            continue
+        values, errors = result
+        biases.append(values - w["truth"])
+        pulls.append((values - w["truth"]) / errors)
+
+    pulls = np.array(pulls).reshape(-1, n_gen_bins)
+    biases = np.array(biases).reshape(-1, n_gen_bins)
+    pull_stats, bias_stats = RunningStats(n_gen_bins), RunningStats(n_gen_bins)
+    pull_stats.update(pulls)
+    bias_stats.update(biases)
+    clipped = np.clip(pulls, PULL_EDGES[0], PULL_EDGES[-1] - 1e-9)
+    pull_hist = np.stack([np.histogram(clipped[:, i], PULL_EDGES)[0] for i in range(n_gen_bins)])
+    return {"pull": pull_stats, "bias": bias_stats, "covered": (np.abs(pulls) <= 1.0).sum(axis=0),
+            "pull_hist": pull_hist, "failed": failed}
+
+
+def run_systematic(task):
+    """Unfold the nominal input through one varied response matrix at the nominal tau."""
+    name, direction = task
+    w = _WORKER
+    f_resp = ROOT.TFile.Open(w["matrix"])
+    h = f_resp.Get(f"response_matrix_{name}{direction}")
+    if not h:
+        f_resp.Close()
+        return name, direction, None
+    h.SetDirectory(0)
+    f_resp.Close()
+    result = _unfold_at_tau(make_unfold(h), w["h_data"], w["tau"])
+    return name, direction, None if result is None else result[0]
+
+
+def run_task(task):
+    kind, payload = task
+    return kind, (run_toys if kind == "toys" else run_systematic)(payload)
+
+
+def run_toy_mode(histograms, matrix, tau, n_toys, workers, seed):
+    """Distribute the toys (in chunks) and the up/down re-unfoldings over `workers` processes.
+
+    Returns (aggregated toy statistics, {(syst, direction): unfolded values}).
+    """
+    chunk = max(1, math.ceil(n_toys / (4 * max(workers, 1))))
+    tasks = [("sys", (name, d)) for name in SYSTEMATICS for d in ("Up", "Down")]
+    tasks += [("toys", (first, min(chunk, n_toys - first), seed)) for first in range(0, n_toys, chunk)]
+
+    toys = {"pull": RunningStats(n_gen_bins), "bias": RunningStats(n_gen_bins),
+            "covered": np.zeros(n_gen_bins), "pull_hist": np.zeros((n_gen_bins, len(PULL_EDGES) - 1)),
+            "failed": 0}
+    shifted = {}
+    start, done_toys = time.time(), 0
+
+    def collect(kind, result):
+        nonlocal done_toys
+        if kind == "sys":
+            name, direction, values = result
+            shifted[(name, direction)] = values
+            return
+        toys["pull"].merge(result["pull"])
+        toys["bias"].merge(result["bias"])
+        toys["covered"] += result["covered"]
+        toys["pull_hist"] += result["pull_hist"]
+        toys["failed"] += result["failed"]
+        done_toys += result["pull"].n + result["failed"]
+        print(f"  {done_toys}/{n_toys} toys ({time.time() - start:.0f} s)")
+
+    print(f"\nRunning {n_toys} toys and {len(SYSTEMATICS)} x 2 systematic re-unfoldings "
+          f"with {workers} worker(s), tau = {tau:.8f}")
+    if workers > 1:
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(workers, initializer=init_worker, initargs=(histograms, matrix, tau)) as pool:
+            for kind, result in pool.imap_unordered(run_task, tasks):
+                collect(kind, result)
+    else:
+        init_worker(histograms, matrix, tau)
+        for task in tasks:
+            collect(*run_task(task))
+    return toys, shifted
+
+
+def toy_summary_histograms(toys, shifted, h_unfolded, labels):
+    """Pull mean/width, bias, 1-sigma coverage and pull distributions per gen bin, and the systematic shifts."""
+    n = toys["pull"].n
+    out = []
+
+    def th1(name, title, values, errors=None):
+        h = ROOT.TH1D(name, title, n_gen_bins, 0, n_gen_bins)
+        h.SetDirectory(0)
+        for i in range(n_gen_bins):
+            h.GetXaxis().SetBinLabel(i + 1, labels[i])
+            h.SetBinContent(i + 1, values[i])
+            h.SetBinError(i + 1, 0.0 if errors is None else errors[i])
+        out.append(h)
+        return h
+
+    sqrt_n = math.sqrt(max(n, 1))
+    pull_std, bias_std = toys["pull"].std, toys["bias"].std
+    coverage = toys["covered"] / max(n, 1)
+    th1("h_toy_pull_mean", "Toy pull mean;Gen bin;<pull>", toys["pull"].mean, pull_std / sqrt_n)
+    th1("h_toy_pull_width", "Toy pull width;Gen bin;#sigma(pull)", pull_std,
+        pull_std / math.sqrt(2 * max(n - 1, 1)))
+    th1("h_toy_bias", "Toy bias;Gen bin;<unfolded - truth>", toys["bias"].mean, bias_std / sqrt_n)
+    th1("h_toy_coverage", "Toy 1#sigma coverage;Gen bin;Fraction of toys", coverage,
+        np.sqrt(coverage * (1 - coverage) / max(n, 1)))
+
+    h2 = ROOT.TH2D("h2_toy_pulls", "Toy pulls;Gen bin;Pull",
+                   n_gen_bins, 0, n_gen_bins, len(PULL_EDGES) - 1, PULL_EDGES[0], PULL_EDGES[-1])
+    h2.SetDirectory(0)
+    for i in range(n_gen_bins):
+        h2.GetXaxis().SetBinLabel(i + 1, labels[i])
+        for j, c in enumerate(toys["pull_hist"][i]):
+            h2.SetBinContent(i + 1, j + 1, c)
+    h2.SetEntries(n * n_gen_bins)
+    out.append(h2)
+
+    nominal = bin_values(h_unfolded, n_gen_bins)
+    for (name, direction), values in sorted(shifted.items()):
+        if values is not None:
+            th1(f"h_sys_shift_{name}{direction}", f"{name} {direction} - nominal;Gen bin;#Delta unfolded",
+                values - nominal)
+    return out
+
+
 
 def main():
     parser = argparse.ArgumentParser(description="TUnfold unfolding for ttbar charge asymmetry")
@@ -53,6 +292,13 @@ def main():
                         help="Output directory for plots and ROOT file")
     parser.add_argument("--era",        default="UL2016preVFP",
                         help="Era label for plot titles")
+    parser.add_argument("--toys",       type=int, default=0,
+                        help="Poisson pseudo-experiments unfolded at the optimal tau, plus one "
+                             "re-unfolding per systematic variation (default: 0 = off)")
+    parser.add_argument("--workers",    type=int, default=4,
+                        help="Worker processes for --toys (default: 4)")
+    parser.add_argument("--seed",       type=int, default=12345,
+                        help="Random seed of the toys (default: 12345)")
     args = parser.parse_args()
 
     os.makedirs(args.outdir, exist_ok=True)
@@ -77,13 +323,7 @@ def main():
     h_matrix.SetDirectory(0)
 
     # --- TUnfoldDensity setup ---
-    unfold = ROOT.TUnfoldDensity(
-        h_matrix,
-        ROOT.TUnfold.kHistMapOutputHoriz,
-        ROOT.TUnfold.kRegModeCurvature,
-        ROOT.TUnfold.kEConstraintArea,
-        ROOT.TUnfoldDensity.kDensityModeBinWidth,
-    )
+    unfold = make_unfold(h_matrix)
 
     status = unfold.SetInput(h_data)
     print(f"SetInput status: {status}")
@@ -249,6 +489,22 @@ def main():
     c_lcurve.SaveAs(os.path.join(args.outdir, "lcurve.png"))
     print(f"Saved: lcurve.pdf / .png")
 
+    # --- Toys and systematic re-unfoldings ---
+    toy_hists = []
+    if args.toys > 0:
+        toys, shifted = run_toy_mode(args.histograms, args.matrix, tau_best,
+                                     args.toys, args.workers, args.seed)
+        labels = [h_unfolded.GetXaxis().GetBinLabel(i + 1) for i in range(n_gen_bins)]
+        toy_hists = toy_summary_histograms(toys, shifted, h_unfolded, labels)
+        n_ok = toys["pull"].n
+        print(f"\n{'='*65}")
+        print(f"Toys: {n_ok} unfolded, {toys['failed']} failed")
+        print(f"  {'Bin':<5} {'Label':<28} {'<pull>':>8} {'sigma':>8} {'<bias>':>10} {'cover':>7}")
+        print(f"  {'-'*65}")
+        for i in range(n_gen_bins):
+            print(f"  {i+1:<5} {labels[i]:<28} {toys['pull'].mean[i]:>8.3f} {toys['pull'].std[i]:>8.3f} "
+                  f"{toys['bias'].mean[i]:>10.2f} {toys['covered'][i] / max(n_ok, 1):>7.3f}")
+
     # --- Save ROOT file ---
     fout = ROOT.TFile(out_root, "RECREATE")
     h_unfolded.Write("h_unfolded")
@@ -258,6 +514,8 @@ def main():
     l_curve.Write("lcurve")
     c_comp.Write("canvas_truth_vs_unfolded")
     c_lcurve.Write("canvas_lcurve")
+    for h in toy_hists:
+        h.Write()
     fout.Close()
 
     f_proc.Close()
@@ -9,6 +9,7 @@
 #   4. makeDatacards.py        (generate Combine datacards + run_impacts.sh)
 #
 # Steps 2-4 require a per-era lumiXinfo JSON in Inputs/ and are skipped if absent.
+# It can be generated from the Runs trees of the MC files with ../scripts/genWeightIndex.py --lumiXinfo.
 # Eras that have no BDTScore dataFiles JSON in Inputs/ are skipped entirely.
 #
 # Usage:
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Index genEventCount / genEventSumw / genEventSumw2 from the Runs tree of every
+file in one or more dataset JSONs, and emit per-dataset totals plus a
+lumiXinfo JSON for 005-Unfolding and 006-Results.
+
+Only the Runs tree (one row per run and file) is read, with uproot, files in
+parallel threads, so indexing all MC of an era takes seconds rather than an
+event loop. Per-file results are cached keyed by (path, size, mtime): local
+files are re-read only when they change, and remote /store/... LFNs (read
+through --redirector) are treated as immutable and read once.
+
+Inputs are nested dataset JSONs ({DataMC: {group: {dataset: {filepath:
+"Events"}}}}) -- the DAS_{era}_dataset.json of 002-Samples for the original
+NanoAOD, or preselection_{era}_datasets.json for the preselected files, which
+keep the Runs tree of their inputs. Data groups (DataMC starting with "Data")
+are skipped.
+
+Usage:
+    python3 genWeightIndex.py --era UL2017 --datasetJSON preselection_UL2017_datasets.json \\
+        -o UL2017_genWeights.json \\
+        --lumiXinfo Inputs/midNov_BDTScore_UL2017_lumiXinfo.json \\
+        --xsecConfig ../003-ObjectSelectionI/config.yaml --lumiCSV UL2017_lumi_info.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import uproot
+
+CACHE_VERSION = 1
+SUM_KEYS = ("genEventCount", "genEventSumw", "genEventSumw2")
+
+
+def runs_sums(path, tree_name="Runs"):
+    """{genEventCount, genEventSumw, genEventSumw2} summed over one file's Runs tree."""
+    with uproot.open(path) as f:
+        tree = f[tree_name]
+        names = set(tree.keys())
+        out = {}
+        for key in SUM_KEYS:
+            # NanoAOD before v7 suffixed these with '_' (genEventSumw_, ...).
+            branch = key if key in names else f"{key}_"
+            if branch not in names:
+                raise KeyError(f"{key} not found in {tree_name} tree of {path}")
+            out[key] = float(np.sum(tree[branch].array(library="np"), dtype=np.float64))
+        return out
+
+
+def file_signature(path):
+    """(size, mtime_ns) of a local file, or (None, None) for a remote URL."""
+    if "://" in path:
+        return None, None
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def load_cache(cache_path):
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Ignoring unreadable cache {cache_path}: {e}")
+        return {}
+    return cache.get("files", {}) if cache.get("version") == CACHE_VERSION else {}
+
+
+def save_cache(cache_path, files):
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": CACHE_VERSION, "files": files}, f, indent=1)
+    os.replace(tmp_path, cache_path)
+
+
+def resolve(path, redirector):
+    return redirector.rstrip("/") + "/" + path.lstrip("/") if path.startswith("/store/") and redirector else path
+
+
+def index_files(paths, cache, workers, redirector=None):
+    """{path: sums} for every path, reading only files missing from / stale in the cache."""
+    results, to_read = {}, []
+    for path in paths:
+        url = resolve(path, redirector)
+        try:
+            size, mtime_ns = file_signature(url)
+        except OSError as e:
+            print(f"Cannot stat {url}: {e}")
+            continue
+        cached = cache.get(path)
+        if cached and cached.get("size") == size and cached.get("mtime_ns") == mtime_ns:
+            results[path] = cached
+        else:
+            to_read.append((path, url, size, mtime_ns))
+    print(f"{len(paths) - len(to_read)} of {len(paths)} files cached; reading Runs trees of {len(to_read)} "
+          f"with {workers} workers")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(runs_sums, url): (path, size, mtime_ns) for path, url, size, mtime_ns in to_read}
+        for i, future in enumerate(as_completed(futures), start=1):
+            path, size, mtime_ns = futures[future]
+            try:
+                results[path] = dict(future.result(), size=size, mtime_ns=mtime_ns)
+            except Exception as e:
+                print(f"  FAILED to read Runs tree of {path}: {e}")
+            if i % 500 == 0 or i == len(to_read):
+                print(f"  Progress: {i}/{len(to_read)}")
+    return results
+
+
+def dataset_totals(dataset_json, per_file):
+    """{DataMC/group/dataset: {n_files, n_missing, genEventCount, genEventSumw, genEventSumw2}} for MC."""
+    totals = {}
+    for DataMC, groups in dataset_json.items():
+        if DataMC.lower().startswith("data"):
+            continue
+        for group, datasets in groups.items():
+            for dataset, files in datasets.items():
+                entry = dict.fromkeys(SUM_KEYS, 0.0)
+                entry.update(n_files=0, n_missing=0)
+                for path in files:
+                    sums = per_file.get(path)
+                    if sums is None:
+                        entry["n_missing"] += 1
+                        continue
+                    entry["n_files"] += 1
+                    for key in SUM_KEYS:
+                        entry[key] += sums[key]
+                entry["genEventCount"] = int(round(entry["genEventCount"]))
+                totals[f"{DataMC}/{group}/{dataset}"] = entry
+    return totals
+
+
+def luminosity_from_brilcalc_csv(csv_path):
+    """Total recorded luminosity in pb^-1 from a brilcalc lumi CSV (#Summary section)."""
+    scale = {"/fb": 1e3, "/pb": 1.0, "/nb": 1e-3, "/ub": 1e-6}
+    with open(csv_path) as f:
+        rows = list(csv.reader(f))
+    for i, row in enumerate(rows[:-1]):
+        header = [c.lstrip("#").strip() for c in row]
+        recorded = [j for j, c in enumerate(header) if c.startswith("totrecorded")]
+        if recorded:
+            column = header[recorded[0]]
+            unit = column[column.index("(") + 1:column.index(")")] if "(" in column else "/pb"
+            return float(rows[i + 1][recorded[0]].lstrip("#")) * scale[unit]
+    raise ValueError(f"No totrecorded summary found in {csv_path}")
+
+
+def cross_sections(config_path, era):
+    """{dataset: Xsec} for `era` from a chapter config.yaml's NgenandXsec block."""
+    import yaml
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    xsecs = {}
+    for groups in config.get("NgenandXsec", {}).get(era, {}).values():
+        for datasets in groups.values():
+            for dataset, info in datasets.items():
+                xsecs[dataset] = info.get("Xsec")
+    return xsecs
+
+
+def make_lumiXinfo(era, totals, luminosity, xsecs, normalization):
+    """lumiXinfo in the format read by getAs.py / makeDatacards.py (keys "{era}_{dataset}")."""
+    norm_key = "genEventCount" if normalization == "count" else "genEventSumw"
+    info = {"era": era, "Luminosity": luminosity, "cross_sections": {}, "generated_events": {}}
+    for label, entry in totals.items():
+        dataset = label.rsplit("/", 1)[-1]
+        key = f"{era}_{dataset}"
+        if entry["n_missing"]:
+            print(f"  WARNING: {key}: {entry['n_missing']} file(s) could not be read; "
+                  f"{norm_key} covers only {entry['n_files']} file(s)")
+        info["generated_events"][key] = entry[norm_key]
+        if dataset in xsecs:
+            info["cross_sections"][key] = xsecs[dataset]
+        else:
+            print(f"  WARNING: no cross section for {dataset} in the xsec config")
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index Runs-tree generator weight sums per dataset.")
+    parser.add_argument("--era", required=True)
+    parser.add_argument("--datasetJSON", nargs="+", required=True,
+                        help="Nested dataset JSON(s): {DataMC: {group: {dataset: {filepath: tree}}}}")
+    parser.add_argument("-o", "--output", required=True, help="Per-dataset totals JSON")
+    parser.add_argument("--cache", default=None,
+                        help="Per-file cache keyed by (path, size, mtime) (default: {output stem}_cache.json)")
+    parser.add_argument("--noCache", action="store_true", help="Neither read nor write the per-file cache")
+    parser.add_argument("-j", "--workers", type=int, default=16, help="Parallel reader threads (default: 16)")
+    parser.add_argument("--redirector", default=None,
+                        help="XRootD redirector prefixed to /store/... LFNs, e.g. root://cms-xrd-global.cern.ch/")
+    parser.add_argument("--lumiXinfo", default=None, help="Also write a lumiXinfo JSON here")
+    parser.add_argument("--xsecConfig", default=None,
+                        help="Chapter config.yaml with NgenandXsec, the source of the lumiXinfo cross sections")
+    lumi = parser.add_mutually_exclusive_group()
+    lumi.add_argument("--luminosity", type=float, default=None, help="Era luminosity in pb^-1")
+    lumi.add_argument("--lumiCSV", default=None, help="brilcalc lumi CSV ({era}_lumi_info.csv from 002-Samples)")
+    parser.add_argument("--normalization", choices=("count", "sumw"), default="count",
+                        help="generated_events from genEventCount (unweighted, as the config Ngen) or "
+                             "genEventSumw (when genWeight is applied). Default: count")
+    args = parser.parse_args()
+
+    cache_path = None if args.noCache else (args.cache or f"{os.path.splitext(args.output)[0]}_cache.json")
+    cache = load_cache(cache_path)
+
+    dataset_json = {}
+    for path in args.datasetJSON:
+        with open(path) as f:
+            for DataMC, groups in json.load(f).items():
+                for group, datasets in groups.items():
+                    for dataset, files in datasets.items():
+                        dataset_json.setdefault(DataMC, {}).setdefault(group, {}).setdefault(dataset, {}).update(files)
+
+    mc_files = [path for DataMC, groups in dataset_json.items() if not DataMC.lower().startswith("data")
+                for datasets in groups.values() for files in datasets.values() for path in files]
+    per_file = index_files(mc_files, cache, args.workers, args.redirector)
+    if cache_path:
+        # Keep entries of files not in this run's JSONs, so indexing eras or
+        # stages one at a time doesn't evict each other's cache.
+        save_cache(cache_path, dict(cache, **per_file))
+
+    totals = dataset_totals(dataset_json, per_file)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"era": args.era, "datasets": totals}, f, indent=4)
+    print(f"Per-dataset generator weight totals for {len(totals)} datasets written to {args.output}")
+
+    if args.lumiXinfo:
+        if args.lumiCSV:
+            luminosity = luminosity_from_brilcalc_csv(args.lumiCSV)
+        elif args.luminosity is not None:
+            luminosity = args.luminosity
+        else:
+            parser.error("--lumiXinfo needs --luminosity or --lumiCSV")
+        xsecs = cross_sections(args.xsecConfig, args.era) if args.xsecConfig else {}
+        info = make_lumiXinfo(args.era, totals, luminosity, xsecs, args.normalization)
+        os.makedirs(os.path.dirname(os.path.abspath(args.lumiXinfo)), exist_ok=True)
+        with open(args.lumiXinfo, "w") as f:
+            json.dump(info, f, indent=4)
+        print(f"lumiXinfo ({luminosity:.1f} pb^-1, {len(info['generated_events'])} datasets) written to {args.lumiXinfo}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,19 @@
 #!/bin/env python
 import ROOT
 import numpy
-import sys
+import os
+import time
+import argparse
+import multiprocessing
 
-if len(sys.argv) < 3:
-    print("Syntax: haddnano.py out.root input1.root input2.root ...")
-ofname = sys.argv[1]
-files = sys.argv[2:]
+# Backfill loop in C++: one TBranch::Fill per entry of the (all-zero) buffer,
+# so a missing branch of a big tree is written basket by basket without a
+# Python round trip per entry.
+ROOT.gInterpreter.Declare("""
+void haddnano_fill_n(TBranch* branch, Long64_t n) {
+    for (Long64_t i = 0; i < n; ++i) branch->Fill();
+}
+""")
 
 
 def zeroFill(tree, brName, brObj, allowNonBool=False):
@@ -15,7 +22,7 @@ def zeroFill(tree, brName, brObj, allowNonBool=False):
         'u4', 'i'), 'Long64_t': ('i8', 'L'), 'Double_t': ('f8', 'D')}
     brType = brObj.GetLeaf(brName).GetTypeName()
     if (not allowNonBool) and (brType != "Bool_t"):
-        print(("Did not expect to back fill non-boolean branches ", tree, brName, brObj.GetLeaf(br).GetTypeName()))
+        print(("Did not expect to back fill non-boolean branches ", tree, brName, brType))
     else:
         if brType not in branch_type_dict:
             raise RuntimeError('Impossible to backfill branch of type %s' % brType)
@@ -24,85 +31,163 @@ def zeroFill(tree, brName, brObj, allowNonBool=False):
                         branch_type_dict[brType][1])
         # be sure we do not trigger flushing
         b.SetBasketSize(tree.GetEntries() * 2)
-        for x in range(0, tree.GetEntries()):
-            b.Fill()
+        ROOT.haddnano_fill_n(b, tree.GetEntries())
         b.ResetAddress()
 
 
-fileHandles = []
-goFast = True
-for fn in files:
-    print("Adding file " + str(fn))
-    fileHandles.append(ROOT.TFile.Open(fn))
-    if fileHandles[-1].GetCompressionSettings() != fileHandles[0].GetCompressionSettings():
-        goFast = False
-        print("Disabling fast merging as inputs have different compressions")
-of = ROOT.TFile(ofname, "recreate")
-if goFast:
-    of.SetCompressionSettings(fileHandles[0].GetCompressionSettings())
-of.cd()
+def merge(ofname, files):
+    """Merge `files` into `ofname`, all inputs open at once."""
+    fileHandles = []
+    goFast = True
+    for fn in files:
+        print("Adding file " + str(fn))
+        fileHandles.append(ROOT.TFile.Open(fn))
+        if fileHandles[-1].GetCompressionSettings() != fileHandles[0].GetCompressionSettings():
+            goFast = False
+            print("Disabling fast merging as inputs have different compressions")
+    of = ROOT.TFile(ofname, "recreate")
+    if goFast:
+        of.SetCompressionSettings(fileHandles[0].GetCompressionSettings())
+    of.cd()
 
-for e in fileHandles[0].GetListOfKeys():
-    name = e.GetName()
-    print("Merging" + str(name))
-    obj = e.ReadObj()
-    cl = ROOT.TClass.GetClass(e.GetClassName())
-    inputs = ROOT.TList()
-    isTree = obj.IsA().InheritsFrom(ROOT.TTree.Class())
-    if isTree:
-        obj = obj.CloneTree(-1, "fast" if goFast else "")
-        branchNames = set([x.GetName() for x in obj.GetListOfBranches()])
-    for fh in fileHandles[1:]:
-        otherObj = fh.GetListOfKeys().FindObject(name).ReadObj()
-        inputs.Add(otherObj)
-        if isTree and obj.GetName() == 'Events':
-            otherObj.SetAutoFlush(0)
-            otherBranches = set([x.GetName()
-                                 for x in otherObj.GetListOfBranches()])
-            missingBranches = list(branchNames - otherBranches)
-            additionalBranches = list(otherBranches - branchNames)
-            print("missing: " + str(missingBranches) + "\n Additional: " + str(additionalBranches))
-            for br in missingBranches:
-                # fill "Other"
-                zeroFill(otherObj, br, obj.GetListOfBranches().FindObject(br))
-            for br in additionalBranches:
-                # fill main
-                branchNames.add(br)
-                zeroFill(obj, br, otherObj.GetListOfBranches().FindObject(br))
-            # merge immediately for trees
-        if isTree and obj.GetName() == 'Runs':
-            otherObj.SetAutoFlush(0)
-            otherBranches = set([x.GetName()
-                                 for x in otherObj.GetListOfBranches()])
-            missingBranches = list(branchNames - otherBranches)
-            additionalBranches = list(otherBranches - branchNames)
-            print("missing: " + str(missingBranches) + "\n Additional: " + str(additionalBranches))
-            for br in missingBranches:
-                # fill "Other"
-                zeroFill(otherObj, br, obj.GetListOfBranches(
-                ).FindObject(br), allowNonBool=True)
-            for br in additionalBranches:
-                # fill main
-                branchNames.add(br)
-                zeroFill(obj, br, otherObj.GetListOfBranches(
-                ).FindObject(br), allowNonBool=True)
-            # merge immediately for trees
+    for e in fileHandles[0].GetListOfKeys():
+        name = e.GetName()
+        print("Merging" + str(name))
+        obj = e.ReadObj()
+        cl = ROOT.TClass.GetClass(e.GetClassName())
+        inputs = ROOT.TList()
+        isTree = obj.IsA().InheritsFrom(ROOT.TTree.Class())
         if isTree:
-            obj.Merge(inputs, "fast" if goFast else "")
-            inputs.Clear()
+            obj = obj.CloneTree(-1, "fast" if goFast else "")
+            branchNames = set([x.GetName() for x in obj.GetListOfBranches()])
+        for fh in fileHandles[1:]:
+            otherObj = fh.GetListOfKeys().FindObject(name).ReadObj()
+            inputs.Add(otherObj)
+            if isTree and obj.GetName() == 'Events':
+                otherObj.SetAutoFlush(0)
+                otherBranches = set([x.GetName()
+                                     for x in otherObj.GetListOfBranches()])
+                missingBranches = list(branchNames - otherBranches)
+                additionalBranches = list(otherBranches - branchNames)
+                print("missing: " + str(missingBranches) + "\n Additional: " + str(additionalBranches))
+                for br in missingBranches:
+                    # fill "Other"
+                    zeroFill(otherObj, br, obj.GetListOfBranches().FindObject(br))
+                for br in additionalBranches:
+                    # fill main
+                    branchNames.add(br)
+                    zeroFill(obj, br, otherObj.GetListOfBranches().FindObject(br))
+                # merge immediately for trees
+            if isTree and obj.GetName() == 'Runs':
+                otherObj.SetAutoFlush(0)
+                otherBranches = set([x.GetName()
+                                     for x in otherObj.GetListOfBranches()])
+                missingBranches = list(branchNames - otherBranches)
+                additionalBranches = list(otherBranches - branchNames)
+                print("missing: " + str(missingBranches) + "\n Additional: " + str(additionalBranches))
+                for br in missingBranches:
+                    # fill "Other"
+                    zeroFill(otherObj, br, obj.GetListOfBranches(
+                    ).FindObject(br), allowNonBool=True)
+                for br in additionalBranches:
+                    # fill main
+                    branchNames.add(br)
+                    zeroFill(obj, br, otherObj.GetListOfBranches(
+                    ).FindObject(br), allowNonBool=True)
+                # merge immediately for trees
+            if isTree:
+                obj.Merge(inputs, "fast" if goFast else "")
+                inputs.Clear()
 
-    if isTree:
-        obj.Write()
-    elif obj.IsA().InheritsFrom(ROOT.TH1.Class()):
-        obj.Merge(inputs)
-        obj.Write()
-    elif obj.IsA().InheritsFrom(ROOT.TObjString.Class()):
-        for st in inputs:
-            if st.GetString() != obj.GetString():
-                print("Strings are not matching")
-        obj.Write()
-    elif obj.IsA().InheritsFrom(ROOT.THnSparse.Class()) :
-        obj.Merge(inputs)
-        obj.Write()
-    else:
-        print("Cannot handle " + str(obj.IsA().GetName()))
+        if isTree:
+            obj.Write()
+        elif obj.IsA().InheritsFrom(ROOT.TH1.Class()):
+            obj.Merge(inputs)
+            obj.Write()
+        elif obj.IsA().InheritsFrom(ROOT.TObjString.Class()):
+            for st in inputs:
+                if st.GetString() != obj.GetString():
+                    print("Strings are not matching")
+            obj.Write()
+        elif obj.IsA().InheritsFrom(ROOT.THnSparse.Class()) :
+            obj.Merge(inputs)
+            obj.Write()
+        else:
+            print("Cannot handle " + str(obj.IsA().GetName()))
+
+    of.Close()
+    for fh in fileHandles:
+        fh.Close()
+
+
+def _merge_group(args):
+    ofname, files = args
+    merge(ofname, files)
+    return ofname
+
+
+def hierarchical_merge(ofname, files, jobs=1, maxOpenFiles=0, tmpdir=None):
+    """Merge `files` into `ofname` in levels of consecutive groups of at most
+    maxOpenFiles inputs (0: no limit; with jobs > 1, at most one group per
+    worker), each level's groups in `jobs` worker processes, until one group
+    is left, which is merged into `ofname`.
+
+    Entry order is kept, and every merge is an ordinary merge() of its group --
+    trees (Events, LuminosityBlocks, Runs) are concatenated, histograms added --
+    so the result is the same as merging all files at once.
+    """
+    groupSize = maxOpenFiles if maxOpenFiles >= 2 else len(files)
+    if jobs > 1:
+        groupSize = min(groupSize, max(2, -(-len(files) // jobs)))
+    tmpdir = tmpdir or os.path.dirname(os.path.abspath(ofname))
+    stem = os.path.splitext(os.path.basename(ofname))[0]
+    ctx = multiprocessing.get_context("spawn")
+    level, current, temporaries, start = 0, list(files), [], time.time()
+    try:
+        while len(current) > groupSize:
+            level += 1
+            groups = [current[i:i + groupSize] for i in range(0, len(current), groupSize)]
+            tasks = [(os.path.join(tmpdir, ".%s.level%d_%d.root" % (stem, level, i)), g)
+                     for i, g in enumerate(groups)]
+            temporaries.extend(out for out, _ in tasks)
+            print("Level %d: merging %d files in %d groups of up to %d with %d worker(s)"
+                  % (level, len(current), len(tasks), groupSize, jobs))
+            outputs = []
+            if jobs > 1:
+                with ctx.Pool(min(jobs, len(tasks))) as pool:
+                    merged = pool.imap(_merge_group, tasks)
+                    for i, out in enumerate(merged, start=1):
+                        outputs.append(out)
+                        print("Level %d: %d/%d groups merged (%.0f s)" % (level, i, len(tasks), time.time() - start))
+            else:
+                for i, task in enumerate(tasks, start=1):
+                    outputs.append(_merge_group(task))
+                    print("Level %d: %d/%d groups merged (%.0f s)" % (level, i, len(tasks), time.time() - start))
+            if level > 1:
+                for fn in current:
+                    os.remove(fn)
+            current = outputs
+        if level:
+            print("Final merge of %d files into %s" % (len(current), ofname))
+        merge(ofname, current)
+    finally:
+        for fn in temporaries:
+            if os.path.exists(fn):
+                os.remove(fn)
+    print("Merged %d files into %s in %.0f s" % (len(files), ofname, time.time() - start))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge NanoAOD files.",
+                                     usage="haddnano.py [-j N] [-n N] out.root input1.root input2.root ...")
+    parser.add_argument("output")
+    parser.add_argument("inputs", nargs="+")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Worker processes merging groups of inputs in parallel (default: 1)")
+    parser.add_argument("-n", "--maxOpenFiles", type=int, default=0,
+                        help="Open at most this many inputs per merge; more are merged in levels "
+                             "through temporary files (default: 0 = all at once)")
+    parser.add_argument("--tmpdir", default=None,
+                        help="Directory for the temporary files (default: the output's directory)")
+    args = parser.parse_args()
+    hierarchical_merge(args.output, args.inputs, args.jobs, args.maxOpenFiles, args.tmpdir)
@@ -1,42 +1,82 @@
 #!/usr/bin/env python
 # imported from https://github.com/CERN-PH-CMG/cmg-cmssw/blob/0c11a5a0a15c4c3e1a648c9707b06b08b747b0c0/PhysicsTools/Heppy/scripts/heppy_report.py
+#
+# Columnar version: run/luminosityBlock are read as whole arrays per file with
+# uproot (files in parallel worker processes) and de-duplicated / compacted
+# into ranges with NumPy, instead of a Python GetEntry() loop over a TChain.
 from optparse import OptionParser
+from concurrent.futures import ProcessPoolExecutor
 import json
-import ROOT
-ROOT.PyConfig.IgnoreCommandLineOptions = True
-
-
-def root2map(tree):
-    tree.SetBranchStatus("*", 0)
-    tree.SetBranchStatus("run", 1)
-    tree.SetBranchStatus("luminosityBlock", 1)
-    jsonind = {}
-    for e in range(tree.GetEntries()):
-        tree.GetEntry(e)
-        run, lumi = tree.run, tree.luminosityBlock
-        if run not in jsonind:
-            jsonind[run] = [lumi]
-        else:
-            jsonind[run].append(lumi)
-    # remove duplicates
-    for run in jsonind:
-        jsonind[run] = list(set(jsonind[run]))
-
-    nruns = len(jsonind)
-    nlumis = sum(len(v) for v in jsonind.values())
+import numpy as np
+import uproot
+
+_LUMI_BITS = np.uint64(32)
+_LUMI_MASK = np.uint64(0xFFFFFFFF)
+
+
+def lumi_keys(runs, lumis):
+    """Combine run and luminosityBlock arrays into one sortable 64-bit key."""
+    return (np.asarray(runs, dtype=np.uint64) << _LUMI_BITS) | np.asarray(lumis, dtype=np.uint64)
+
+
+def file_lumi_keys(fname, treeName="LuminosityBlocks"):
+    """Unique (sorted) run/lumi keys of one file."""
+    with uproot.open(fname) as f:
+        arrays = f[treeName].arrays(["run", "luminosityBlock"], library="np")
+    return np.unique(lumi_keys(arrays["run"], arrays["luminosityBlock"]))
+
+
+def keys2map(keys):
+    """Compact unique run/lumi keys into a {run: [[first, last], ...]} map."""
+    keys = np.unique(keys)
+    if len(keys) == 0:
+        return {}, 0, 0
+    runs = (keys >> _LUMI_BITS).astype(np.int64)
+    lumis = (keys & _LUMI_MASK).astype(np.int64)
+    # A new range starts wherever the run changes or the lumi isn't previous + 1.
+    is_start = np.ones(len(keys), dtype=bool)
+    is_start[1:] = (runs[1:] != runs[:-1]) | (lumis[1:] != lumis[:-1] + 1)
+    starts = np.flatnonzero(is_start)
+    ends = np.append(starts[1:], len(keys)) - 1
     jsonmap = {}
-    for r, lumis in jsonind.items():
-        if len(lumis) == 0:
-            continue  # shouldn't happen
-        lumis.sort()
-        ranges = [[lumis[0], lumis[0]]]
-        for lumi in lumis[1:]:
-            if lumi == ranges[-1][1] + 1:
-                ranges[-1][1] = lumi
-            else:
-                ranges.append([lumi, lumi])
-        jsonmap[r] = ranges
-    return (jsonmap, nruns, nlumis)
+    for r, first, last in zip(runs[starts].tolist(), lumis[starts].tolist(), lumis[ends].tolist()):
+        jsonmap.setdefault(r, []).append([first, last])
+    return (jsonmap, len(jsonmap), len(keys))
+
+
+def files2map(files, treeName="LuminosityBlocks", jobs=1):
+    """Processed-lumi map of all files, reading them in `jobs` processes."""
+    if jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            per_file = list(pool.map(file_lumi_keys, files, [treeName] * len(files)))
+    else:
+        per_file = [file_lumi_keys(f, treeName) for f in files]
+    return keys2map(np.concatenate(per_file) if per_file else np.array([], dtype=np.uint64))
+
+
+def map2keys(jsonmap):
+    """Expand a {run: [[first, last], ...]} map (e.g. a golden JSON) into keys."""
+    runs, firsts, lasts = [], [], []
+    for run, ranges in jsonmap.items():
+        for first, last in ranges:
+            runs.append(int(run))
+            firsts.append(first)
+            lasts.append(last)
+    if not runs:
+        return np.array([], dtype=np.uint64)
+    runs, firsts, lasts = np.array(runs), np.array(firsts), np.array(lasts)
+    lengths = lasts - firsts + 1
+    # Position of each lumi inside its own range, without a per-range loop.
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.unique(lumi_keys(np.repeat(runs, lengths), np.repeat(firsts, lengths) + offsets))
+
+
+def diff_with_golden(jsonmap, golden):
+    """(missing, extra) maps: certified lumis not processed, processed lumis not certified."""
+    processed, certified = map2keys(jsonmap), map2keys(golden)
+    missing = keys2map(np.setdiff1d(certified, processed, assume_unique=True))
+    extra = keys2map(np.setdiff1d(processed, certified, assume_unique=True))
+    return missing, extra
 
 
 if __name__ == '__main__':
@@ -46,15 +86,25 @@ if __name__ == '__main__':
                       help="Name of the TTree with the luminosity blocks")
     parser.add_option("-o", "--out", dest="outputFile",
                       default="lumiSummary.json", help="Name of the output file")
+    parser.add_option("-j", "--jobs", dest="jobs", type="int", default=4,
+                      help="Number of parallel processes reading the input files")
+    parser.add_option("-g", "--golden", dest="golden", default=None,
+                      help="Golden JSON to diff the processed lumis against; writes the certified-but-missing "
+                           "and processed-but-uncertified lumis next to the output file as *_missing.json / *_extra.json")
     (options, args) = parser.parse_args()
     if len(args) == 0:
         print('provide at least one input file in argument. Use -h to display help')
         exit()
-    chain = ROOT.TChain(options.treeName)
-    for a in args:
-        chain.Add(a)
-    summary = root2map(chain)
+    summary = files2map(args, options.treeName, options.jobs)
     if summary:
         jmap, runs, lumis = summary
         json.dump(jmap, open(options.outputFile, 'w'))
         print("Saved %s (%d runs, %d lumis)" % (options.outputFile, runs, lumis))
+        if options.golden:
+            golden = json.load(open(options.golden))
+            (missing, mruns, mlumis), (extra, eruns, elumis) = diff_with_golden(jmap, golden)
+            stem = options.outputFile[:-len(".json")] if options.outputFile.endswith(".json") else options.outputFile
+            json.dump(missing, open(stem + "_missing.json", 'w'))
+            json.dump(extra, open(stem + "_extra.json", 'w'))
+            print("Certified but not processed: %d lumis in %d runs -> %s" % (mlumis, mruns, stem + "_missing.json"))
+            print("Processed but not certified: %d lumis in %d runs -> %s" % (elumis, eruns, stem + "_extra.json"))
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Derive per-stage output keep/drop files from what later chapters actually read.
+
+Every PostProcessor stage (003-I selectionI, 003-II selectionII, 004A reco,
+004B bdtVariables, and the BDTScore/observables step of modules/workflow/)
+copies all of its input branches to its output, so the original NanoAOD
+content rides along to the end of the chain although the analysis only reads
+a few dozen columns. This script collects the branch consumers declared
+downstream, without importing or running them:
+  - 003-III and 004B config.yaml: histDetails[*].variable, weightList
+  - 004C config.yaml BDTVariables / AdditionalFeatures / EventIDBranches / TargetBranch and
+    training_config.yaml Features / IntegerFeatures / TargetBranch
+  - 005-Unfolding getParquet.py: RECO_BRANCHES, WEIGHT_BRANCHES, GEN_BRANCHES
+  - 006-Results processors: events["X"], _f("X"), _sel("X", "Y"), "X" in fields
+  - each stage's own modules (scripts/modules/*.py), by a static scan of
+    event.X, getattr(event, "X"), Collection(event, "X") -> nX, X_*;
+    optionally the exact read sets of --profileReadSet ({stage}_readset.json)
+and walks the chain backwards: a stage keeps what the next stage and the
+direct consumers of its output read, plus what the next stage keeps and does
+not produce itself (literal/looped out.branch() names and config branchNames).
+run, luminosityBlock and event are always kept.
+
+Outputs, in --outDir:
+    {stage}_keep_and_drop_output.txt   "drop *" + one "keep" per branch/pattern,
+                                       for the drivers' --outputBranchsel
+                                       (PostProcessor outputbranchsel,
+                                       nano_postproc.py --bo)
+    slimBranches_report.json           per stage: keep list with the consumers
+                                       of each entry; with --datasetJSON, per
+                                       dataset the Events-tree bytes on disk,
+                                       kept and saved
+
+Usage:
+    python3 slimBranches.py --outDir slim/ \\
+        --readSet ../003-ObjectSelectionII/readset ../004A-Reconstruction/readset ../004B-BDT/readset \\
+        --datasetJSON selectionI=selectionI_midNov_UL2017_datasets.json \\
+                      bdtVariables=BDTVariables_midNov_UL2017_datasets.json
+"""
+
+import argparse
+import ast
+import glob
+import itertools
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+
+import uproot
+import yaml
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ALWAYS_KEEP = ("run", "luminosityBlock", "event")
+
+# Processing chain, in order. "modules": module sources whose reads are the
+# stage's input read set and whose out.branch() names it produces;
+# "produces": names the static scan cannot resolve.
+STAGES = [
+    {"name": "selectionI", "chapter": "003-ObjectSelectionI",
+     "modules": ["003-ObjectSelectionI/scripts/modules/*.py"]},
+    {"name": "selectionII", "chapter": "003-ObjectSelectionII",
+     "modules": ["003-ObjectSelectionII/scripts/modules/*.py"]},
+    {"name": "reco", "chapter": "004A-Reconstruction",
+     "modules": ["004A-Reconstruction/scripts/modules/*.py"]},
+    {"name": "bdtVariables", "chapter": "004B-BDT",
+     "modules": ["004B-BDT/scripts/modules/*.py"]},
+    {"name": "bdtScore", "chapter": None,
+     "modules": ["modules/workflow/applyBDTModule.py", "modules/workflow/observables.py"],
+     "produces": ["BDTScore"]},  # ApplyBDT's branch_name
+]
+
+
+# ---------------------------------------------------------------------------
+# Consumers declared downstream
+# ---------------------------------------------------------------------------
+
+def _load_yaml(relpath):
+    path = os.path.join(REPO, relpath)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return yaml.safe_load(f) or {}
+
+
+def hist_consumers(relpath):
+    """histDetails variables and weightList branches of a plotting config.yaml."""
+    config = _load_yaml(relpath)
+    names = {h["variable"] for h in (config.get("histDetails") or {}).values() if h.get("variable")}
+    for weights in (config.get("weightList") or {}).values():
+        names.update(weights or [])
+    return names
+
+
+def bdt_training_consumers():
+    """004C extraction columns and training features (the BDTScore step's inputs too)."""
+    names = set()
+    config = _load_yaml("004C-BDTTraining/config.yaml")
+    for key in ("BDTVariables", "AdditionalFeatures", "EventIDBranches"):
+        names.update(config.get(key) or [])
+    training = _load_yaml("004C-BDTTraining/training_config.yaml")
+    for key in ("Features", "IntegerFeatures"):
+        names.update(training.get(key) or [])
+    for cfg in (config, training):
+        if cfg.get("TargetBranch"):
+            names.add(cfg["TargetBranch"])
+    return names
+
+
+def module_level_lists(relpath, names):
+    """Union of the module-level list constants `names` of a Python file, via ast."""
+    with open(os.path.join(REPO, relpath)) as f:
+        tree = ast.parse(f.read(), relpath)
+    out = set()
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id in names for t in node.targets):
+            out.update(ast.literal_eval(node.value))
+    return out
+
+
+def _str_const(node):
+    return node.value if isinstance(node, ast.Constant) and isinstance(node.value, str) else None
+
+
+def processor_fields(relpath):
+    """Fields a coffea processor reads: events["X"], _f("X"), _sel("X", "Y"), "X" in fields."""
+    with open(os.path.join(REPO, relpath)) as f:
+        tree = ast.parse(f.read(), relpath)
+    out = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == "events":
+            name = _str_const(node.slice)
+            if name:
+                out.add(name)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ("_f", "_sel"):
+            out.update(n for n in map(_str_const, node.args) if n)
+        elif (isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.ops[0], ast.In)
+              and isinstance(node.comparators[0], ast.Name) and node.comparators[0].id == "fields"):
+            name = _str_const(node.left)
+            if name:
+                out.add(name)
+    return out
+
+
+def output_consumers():
+    """{stage: {consumer label: set of branch names}} of everything outside the stages' own modules."""
+    consumers = defaultdict(dict)
+    consumers["selectionII"]["003-ObjectSelectionIII histDetails/weightList"] = \
+        hist_consumers("003-ObjectSelectionIII/config.yaml")
+    consumers["bdtVariables"]["004B-BDT histDetails/weightList"] = hist_consumers("004B-BDT/config.yaml")
+    consumers["bdtVariables"]["004C-BDTTraining features/target"] = bdt_training_consumers()
+    # ApplyBDT's branch_map: the trained features, read from bdtVariables output
+    consumers["bdtVariables"]["bdtScore branch_map"] = bdt_training_consumers()
+    consumers["bdtScore"]["005-Unfolding getParquet.py"] = module_level_lists(
+        "005-Unfolding/getParquet.py", {"RECO_BRANCHES", "WEIGHT_BRANCHES", "GEN_BRANCHES"})
+    for path in sorted(glob.glob(os.path.join(REPO, "006-Results", "scripts", "*.py"))):
+        fields = processor_fields(os.path.relpath(path, REPO))
+        if fields:
+            consumers["bdtScore"][f"006-Results {os.path.basename(path)}"] = fields
+    return consumers
+
+
+# ---------------------------------------------------------------------------
+# Static scan of PostProcessor modules
+# ---------------------------------------------------------------------------
+
+def _expand(node, env):
+    """Possible values of a str constant, or a loop variable / f-string over loop variables bound to literal lists."""
+    if _str_const(node) is not None:
+        return [node.value]
+    if isinstance(node, ast.Name) and node.id in env:
+        return [str(v) for v in env[node.id]]
+    if not isinstance(node, ast.JoinedStr):
+        return []
+    parts = []
+    for value in node.values:
+        if isinstance(value, ast.Constant):
+            parts.append([str(value.value)])
+        elif (isinstance(value, ast.FormattedValue) and isinstance(value.value, ast.Name)
+              and value.value.id in env):
+            parts.append([str(v) for v in env[value.value.id]])
+        else:
+            return []
+    return ["".join(p) for p in itertools.product(*parts)]
+
+
+class _ModuleScan(ast.NodeVisitor):
+    def __init__(self):
+        self.reads, self.produces = set(), set()
+        self.env = {}
+
+    def visit_For(self, node):
+        bound = None
+        if isinstance(node.target, ast.Name):
+            try:
+                bound = list(ast.literal_eval(node.iter))
+            except (ValueError, TypeError, SyntaxError):
+                bound = None
+        if bound is None:
+            self.generic_visit(node)
+            return
+        saved = self.env.get(node.target.id)
+        self.env[node.target.id] = bound
+        self.generic_visit(node)
+        if saved is None:
+            self.env.pop(node.target.id, None)
+        else:
+            self.env[node.target.id] = saved
+
+    def visit_Attribute(self, node):
+        if isinstance(node.value, ast.Name) and node.value.id == "event" and not node.attr.startswith("_"):
+            self.reads.add(node.attr)
+        elif (isinstance(node.value, ast.Attribute) and isinstance(node.value.value, ast.Name)
+              and node.value.value.id == "event"):
+            self.reads.add(f"{node.value.attr}_{node.attr}")  # event.MET.pt -> MET_pt
+            return
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        func = node.func
+        first_is_event = node.args and isinstance(node.args[0], ast.Name) and node.args[0].id == "event"
+        if isinstance(func, ast.Name) and func.id in ("getattr", "hasattr") and first_is_event and len(node.args) > 1:
+            self.reads.update(_expand(node.args[1], self.env))
+        elif isinstance(func, ast.Name) and func.id in ("Collection", "Object") and first_is_event and len(node.args) > 1:
+            for prefix in _expand(node.args[1], self.env):
+                self.reads.add(f"{prefix}_*")
+                if func.id == "Collection":
+                    self.reads.add(f"n{prefix}")
+        elif isinstance(func, ast.Attribute) and func.attr == "branch" and node.args:
+            self.produces.update(_expand(node.args[0], self.env))
+        self.generic_visit(node)
+
+
+def scan_modules(patterns):
+    """(reads, produces) of the module files matching `patterns` (relative to the repo)."""
+    scan = _ModuleScan()
+    for pattern in patterns:
+        for path in sorted(glob.glob(os.path.join(REPO, pattern))):
+            with open(path) as f:
+                scan.visit(ast.parse(f.read(), path))
+    # "MET" of event.MET.pt is an accessor, not a branch
+    reads = {r for r in scan.reads if not any(o.startswith(f"{r}_") and o != f"{r}_*" for o in scan.reads)}
+    return reads, scan.produces
+
+
+def config_branch_names(chapter):
+    """Every string under a 'branchNames' key of a chapter's Modules config (all eras)."""
+    out = set()
+
+    def walk(node, under=False):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                walk(value, under or key == "branchNames")
+        elif isinstance(node, list):
+            for value in node:
+                walk(value, under)
+        elif under and isinstance(node, str):
+            out.add(node)
+
+    if chapter:
+        walk(_load_yaml(f"{chapter}/config.yaml").get("Modules") or {})
+    return out
+
+
+def profiled_reads(read_set_dirs, stage):
+    """Branches read by `stage` per its {stage}_readset.json (readSetProfiler.py), if any directory has one."""
+    for directory in read_set_dirs:
+        path = os.path.join(directory, f"{stage}_readset.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                report = json.load(f)
+            return (set(report["framework"]).union(report.get("named_not_read", ()),
+                                                   *map(set, report["modules"].values())), path)
+    return None, None
+
+
+# ---------------------------------------------------------------------------
+# Keep sets
+# ---------------------------------------------------------------------------
+
+def keep_sets(read_set_dirs=()):
+    """{stage: {branch or pattern: sorted consumer labels}} for every stage's output, walking the chain backwards."""
+    consumers = output_consumers()
+    info = []
+    for stage in STAGES:
+        reads, produces = scan_modules(stage["modules"])
+        profiled, path = profiled_reads(read_set_dirs, stage["name"])
+        label = f"{stage['name']} modules"
+        if profiled is not None:
+            reads |= profiled
+            label += f" ({os.path.basename(path)})"
+        produces |= config_branch_names(stage["chapter"]) | set(stage.get("produces", ()))
+        info.append((stage["name"], reads, produces, label))
+
+    keeps = {}
+    downstream = {}  # {branch: consumers} the next stage needs from its input, beyond its own reads
+    for i in range(len(info) - 1, -1, -1):
+        name = info[i][0]
+        keep = defaultdict(set)
+        for consumer, branches in consumers.get(name, {}).items():
+            for branch in branches:
+                keep[branch].add(consumer)
+        if i + 1 < len(info):
+            _, next_reads, _, next_label = info[i + 1]
+            for branch in next_reads:
+                keep[branch].add(next_label)
+            for branch, labels in downstream.items():
+                keep[branch].update(labels)
+        for branch in ALWAYS_KEEP:
+            keep[branch].add("event identity")
+        keeps[name] = {b: sorted(keep[b]) for b in sorted(keep)}
+        produces = info[i][2]
+        downstream = {b: labels for b, labels in keep.items()
+                      if b not in produces and b not in ALWAYS_KEEP}
+    return {stage["name"]: keeps[stage["name"]] for stage in STAGES}
+
+
+def is_kept(branch, patterns):
+    """PostProcessor keep/drop semantics for "drop *" + keep lines: kept iff some keep matches."""
+    return any(fnmatchcase(branch, p) for p in patterns)
+
+
+def keep_lines(keep):
+    """Keep entries minus the names a wildcard entry already covers (Jet_pt is in Jet_*)."""
+    patterns = [b for b in keep if "*" in b]
+    return [b for b in keep if "*" in b or not is_kept(b, patterns)]
+
+
+def write_keep_and_drop(out_dir, stage, keep):
+    keep = keep_lines(keep)
+    path = os.path.join(out_dir, f"{stage}_keep_and_drop_output.txt")
+    with open(path, "w") as f:
+        f.write(f"# Generated by scripts/slimBranches.py: branches of the {stage} output read downstream.\n"
+                f"# Entries for branches a file lacks (e.g. MC weights in Data) are no-ops.\n"
+                "drop *\n" + "".join(f"keep {b}\n" for b in keep))
+    return path, len(keep)
+
+
+# ---------------------------------------------------------------------------
+# Bytes report
+# ---------------------------------------------------------------------------
+
+def branch_bytes(path, tree_name="Events"):
+    """{branch: compressed bytes on disk} of one file's tree."""
+    with uproot.open(path) as f:
+        return {b.name: int(b.compressed_bytes) for b in f[tree_name].branches}
+
+
+def dataset_report(dataset_json, patterns, workers, max_files):
+    """{DataMC/group/dataset: bytes total/kept/saved}, extrapolated from max_files per dataset if given."""
+    jobs = {}
+    for DataMC, groups in dataset_json.items():
+        for group, datasets in groups.items():
+            for dataset, files in datasets.items():
+                paths = list(files)
+                jobs[f"{DataMC}/{group}/{dataset}"] = (paths, paths[:max_files] if max_files else paths)
+
+    sampled = sorted({p for _, sample in jobs.values() for p in sample})
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {path: pool.submit(branch_bytes, path) for path in sampled}
+    sizes = {}
+    for path, future in futures.items():
+        try:
+            sizes[path] = future.result()
+        except Exception as e:
+            print(f"  FAILED to read {path}: {e}")
+
+    report, present = {}, set()
+    for label, (paths, sample) in jobs.items():
+        total = kept = n_read = 0
+        for path in sample:
+            if path not in sizes:
+                continue
+            n_read += 1
+            present.update(sizes[path])
+            for branch, nbytes in sizes[path].items():
+                total += nbytes
+                if is_kept(branch, patterns):
+                    kept += nbytes
+        scale = len(paths) / n_read if n_read else 0.0
+        report[label] = {
+            "n_files": len(paths), "n_read": n_read,
+            "bytes_total": int(total * scale), "bytes_kept": int(kept * scale),
+            "bytes_saved": int((total - kept) * scale),
+            "fraction_saved": (total - kept) / total if total else 0.0,
+        }
+    unmatched = sorted(p for p in patterns if not any(fnmatchcase(b, p) for b in present))
+    return report, unmatched
+
+
+def print_report(stage, report):
+    print(f"\n{stage}:")
+    print(f"  {'dataset':<60} {'files':>6} {'total GB':>10} {'kept GB':>10} {'saved':>7}")
+    for label, entry in sorted(report.items()):
+        print(f"  {label:<60} {entry['n_files']:>6} {entry['bytes_total'] / 1e9:>10.3f} "
+              f"{entry['bytes_kept'] / 1e9:>10.3f} {entry['fraction_saved']:>7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage output keep/drop files from downstream branch consumers.")
+    parser.add_argument("--outDir", required=True, help="Directory for the keep/drop files and the report")
+    parser.add_argument("--readSet", nargs="+", default=[], metavar="DIR",
+                        help="--profileReadSet output directories; their {stage}_readset.json replace guesswork "
+                             "for reads the static module scan cannot resolve")
+    parser.add_argument("--datasetJSON", nargs="+", default=[], metavar="STAGE=JSON",
+                        help="Output dataset JSON of a stage ({DataMC: {group: {dataset: {filepath: tree}}}}) "
+                             "to report bytes saved per dataset, e.g. selectionI=selectionI_midNov_UL2017_datasets.json")
+    parser.add_argument("-j", "--workers", type=int, default=16, help="Parallel reader threads (default: 16)")
+    parser.add_argument("--maxFiles", type=int, default=0,
+                        help="Read at most this many files per dataset and scale by the file count (default: all)")
+    args = parser.parse_args()
+
+    stage_names = [s["name"] for s in STAGES]
+    dataset_jsons = {}
+    for item in args.datasetJSON:
+        stage, sep, path = item.partition("=")
+        if not sep or stage not in stage_names:
+            parser.error(f"--datasetJSON expects STAGE=JSON with STAGE one of {stage_names}, got {item!r}")
+        dataset_jsons[stage] = path
+
+    keeps = keep_sets(args.readSet)
+    os.makedirs(args.outDir, exist_ok=True)
+    summary = {"stages": {}}
+    for stage, keep in keeps.items():
+        path, n_lines = write_keep_and_drop(args.outDir, stage, keep)
+        print(f"{stage}: {n_lines} keep lines -> {path}")
+        summary["stages"][stage] = {"keep": keep}
+
+    for stage, path in dataset_jsons.items():
+        with open(path) as f:
+            dataset_json = json.load(f)
+        report, unmatched = dataset_report(dataset_json, keep_lines(keeps[stage]), args.workers, args.maxFiles)
+        summary["stages"][stage].update(datasetJSON=path, datasets=report, unmatched=unmatched)
+        print_report(stage, report)
+        if unmatched:
+            print(f"  Keep entries matching no branch of the read files: {', '.join(unmatched)}")
+
+    report_path = os.path.join(args.outDir, "slimBranches_report.json")
+    with open(report_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"\nReport written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()